@@ -25,8 +25,22 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def _session() -> Session:
+    initialize_database()
+    return SessionLocal()
+
+
+def validate_code(func: FunctionCreate) -> None:
+    if func.language != "python":
+        return
+    try:
+        compile(func.code, "function.py", "exec")
+    except SyntaxError as e:
+        raise HTTPException(status_code=400, detail=f"Syntax error on line {e.lineno}: {e.msg}")
+
 def save_function(func: FunctionCreate) -> FunctionResponse:
-    db = SessionLocal()
+    validate_code(func)
+    db = _session()
     db_func = Function(**func.dict())
     try:
         db.add(db_func)
@@ -39,14 +53,14 @@ def save_function(func: FunctionCreate) -> FunctionResponse:
         db.close()
     return FunctionResponse.from_orm(db_func)
 def get_function(func_id: int) -> FunctionResponse:
-    db = SessionLocal()
+    db = _session()
     func = db.query(Function).filter(Function.id == func_id).first()
     db.close()
     if func is None:
         raise HTTPException(status_code=404, detail="Function not found")
     return FunctionResponse.from_orm(func)
 def list_functions() -> List[FunctionResponse]:
-    db = SessionLocal()
+    db = _session()
     try:
         functions = db.query(Function).all()
         if not functions:
@@ -58,7 +72,7 @@ def list_functions() -> List[FunctionResponse]:
         db.close()
 
 def delete_function(func_id: int) -> None:
-    db = SessionLocal()
+    db = _session()
     func = db.query(Function).filter(Function.id == func_id).first()
     if func is None:
         db.close()
@@ -67,7 +81,7 @@ def delete_function(func_id: int) -> None:
     db.commit()
     db.close()
 def execute_function(func_id: int, input_data: Dict) -> Dict:
-    db = SessionLocal()
+    db = _session()
     func = db.query(Function).filter(Function.id == func_id).first()
     if func is None:
         db.close()
@@ -84,7 +98,8 @@ def execute_function(func_id: int, input_data: Dict) -> Dict:
     return result
 
 def update_function(func_id: int, func_data: FunctionCreate) -> FunctionResponse:
-    db = SessionLocal()
+    validate_code(func_data)
+    db = _session()
     func = db.query(Function).filter(Function.id == func_id).first()
     if func is None:
         db.close()
@@ -97,7 +112,7 @@ def update_function(func_id: int, func_data: FunctionCreate) -> FunctionResponse
     return FunctionResponse.from_orm(func)
 
 def record_execution(func_id: int, execution_time: float, status: str, error: str = None) -> None:
-    db = SessionLocal()
+    db = _session()
     func = db.query(Function).filter(Function.id == func_id).first()
     if func is None:
         db.close()
@@ -109,8 +124,15 @@ def record_execution(func_id: int, execution_time: float, status: str, error: st
     db.close()
 
 
+_initialized = False
+
 def initialize_database():
+    # Idempotent; called on first use instead of at import time
+    global _initialized
+    if _initialized:
+        return
     Base.metadata.create_all(bind=engine)
+    _initialized = True
     db = SessionLocal()
     try:
         # Check if the database is empty and initialize it if necessary
@@ -121,6 +143,5 @@ def initialize_database():
         raise HTTPException(status_code=500, detail=f"Error initializing database: {str(e)}")
     finally:
         db.close()
-initialize_database()
 
 
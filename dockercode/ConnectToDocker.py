@@ -16,9 +16,9 @@ from sqlalchemy.orm import Session
 
 
 # Initialize Docker client
-def dockerconnect():
+def dockerconnect(base_url='unix://var/run/docker.sock'):
     try:
-        client = DockerClient(base_url='unix://var/run/docker.sock', version='auto')
+        client = DockerClient(base_url=base_url, version='auto')
         return client
     except DockerException as e:
         raise HTTPException(status_code=500, detail=f"Error connecting to Docker: {str(e)}")
@@ -28,9 +28,9 @@ def dockerconnect():
 
 
 #now we will initialize the docker client for other functions
-def initialize_docker_client():
+def initialize_docker_client(base_url='unix://var/run/docker.sock'):
     try:
-        client = dockerconnect()
+        client = dockerconnect(base_url)
         if client is None:
             raise HTTPException(status_code=500, detail="Failed to connect to Docker")
         return client
@@ -1,9 +1,17 @@
 import docker
+import requests
 import uuid
 import os
 from backend.function_manager import get_function
 
-client = docker.from_env()
+_client = None
+
+def get_client():
+    # Connect on first use so importing this module never needs a running daemon
+    global _client
+    if _client is None:
+        _client = docker.from_env()
+    return _client
 
 def execute_function(func_id: int, input_data: dict):
     func = get_function(func_id)
@@ -19,15 +27,22 @@ def execute_function(func_id: int, input_data: dict):
 
     try:
         # Run in a Docker container with timeout
-        result = client.containers.run(
+        client = get_client()
+        container = client.containers.run(
             image="python:3.9",
+            name=container_name,
             command=f"python {file_path}",
             volumes={file_path: {'bind': file_path, 'mode': 'ro'}},
-            detach=False,
-            remove=True,
+            detach=True,
             network_disabled=True
         )
-        return {"output": result.decode()}
+        try:
+            container.wait(timeout=func.timeout)
+        except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError):
+            # docker-py reports a wait that outlived its timeout as a requests error
+            container.kill()
+            return {"error": "Function execution timed out"}
+        return {"output": container.logs(stdout=True, stderr=False).decode()}
     except Exception as e:
         return {"error": str(e)}
     finally:
@@ -36,7 +51,7 @@ def execute_function(func_id: int, input_data: dict):
 
         # Clean up the container
         try:
-            container = client.containers.get(container_name)
+            container = get_client().containers.get(container_name)
             container.remove(force=True)
             pass
         except Exception as e:  
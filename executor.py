@@ -11,7 +11,9 @@
 import subprocess
 import json
 import os
+import shutil
 import docker
+import requests
 from docker.errors import NotFound, APIError
 from fastapi import HTTPException
 from backend.models import Function
@@ -38,7 +40,12 @@ def execute_function(func_id: int, input_data: dict) -> dict:
             f.write(func.code)
 
         # Build the Docker image
-        image, build_logs = client.images.build(path=temp_dir, tag=f"function_{func_id}")
+        # Labelled so the platform's reaper can remove it once stale
+        image, build_logs = client.images.build(
+            path=temp_dir,
+            tag=f"function_{func_id}",
+            labels={"serverless-platform.image": "legacy-function"}
+        )
         for log in build_logs:
             if 'stream' in log:
                 print(log['stream'].strip())
@@ -55,9 +62,10 @@ def execute_function(func_id: int, input_data: dict) -> dict:
         print(f"Container {container.id} started")
         try:
             # Wait for the container to finish and get the logs
-            container.wait(timeout=10)
+            container.wait(timeout=func.timeout)
             logs = container.logs()
-        except docker.errors.TimeoutError:
+        except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError):
+            # docker-py reports a wait that outlived its timeout as a requests error
             container.kill()
             raise HTTPException(status_code=500, detail="Container timed out")
 
@@ -97,7 +105,7 @@ def execute_function(func_id: int, input_data: dict) -> dict:
     finally:
         # Clean up the temporary directory
         if os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
+            shutil.rmtree(temp_dir)
         session.close()
         client.close()
     
@@ -7,8 +7,10 @@ from backend.docker_runner import execute_function
 
 app = FastAPI()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create database tables once the app starts rather than on import
+@app.on_event("startup")
+def create_tables():
+    Base.metadata.create_all(bind=engine)
 
 @app.post("/functions/", response_model=FunctionResponse)
 def create_function(func: FunctionCreate):
@@ -15,27 +15,110 @@
 # │           └── runner.js
 
 # app.py
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Body
-from fastapi.responses import JSONResponse
-from typing import Dict, Any, Optional
-import uvicorn
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Body, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, Any, List, Optional
 import json
 import os
+import threading
 import time
-from database import Function, init_db, get_db
+from database import Function, SessionLocal, init_db, get_db
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from docker_manager import DockerManager
 from function_service import FunctionService
+from payload_transfer import MAX_INPUT_SIZE, BodySpool, PayloadTooLargeError, SpooledPayload, is_buffer
+from codec import JSON, EncodedPayload, codec_for_content_type, is_raw_content_type, negotiate
+from backends import BAD_REQUEST, BackendRegistry
+from process_backend import ProcessBackend
+from deadlines import Deadline
+from reaper import Reaper
+from workflow import WorkflowEngine
+from schedules import ScheduleRunner
+from event_sources import EventSourceManager
+from retention import RetentionManager
+from metrics import LATENCY
+from singleflight import SingleFlight, input_hash
 
 app = FastAPI(title="Serverless Function Platform")
+# Nothing below connects to Docker; hosts connect on first use
 docker_manager = DockerManager()
+process_backend = ProcessBackend()
+backends = BackendRegistry()
+backends.register(docker_manager)
+backends.register(process_backend)
+# Workers touch their directory on every call; idle ones are protected from the age check too
+reaper = Reaper(
+    docker_manager.scheduler,
+    protected=process_backend.workdirs,
+    registered=docker_manager.registry.container_ids
+)
+workflows = WorkflowEngine(backends)
+schedules = ScheduleRunner(backends, lambda db: FunctionService(db, docker_manager))
+event_sources = EventSourceManager(backends, lambda db: FunctionService(db, docker_manager))
+single_flight = SingleFlight()
+retention = RetentionManager(lambda db: FunctionService(db, docker_manager))
+
+async def _read_input(request, limit, codec):
+    """
+    Read an invocation body as it streams in, rejecting it as soon as it
+    passes limit; large bodies are spooled to a staging file, not memory
+    """
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > limit:
+        raise PayloadTooLargeError(f"Input exceeds the function's limit of {limit} bytes")
+    spool = BodySpool(limit)
+    try:
+        async for chunk in request.stream():
+            spool.write(chunk)
+    except BaseException:
+        spool.discard()
+        raise
+    return spool.finish(codec)
+
+def _stream_buffer(view, chunk_size=64 * 1024):
+    """Yield a large output buffer in small chunks instead of one full copy"""
+    for offset in range(0, len(view), chunk_size):
+        yield bytes(view[offset:offset + chunk_size])
+
+def _build_base_images_in_background():
+    if docker_manager.building_base_images:
+        return
+    try:
+        docker_manager.build_base_images()
+    except Exception:
+        # Reported by the readiness check; invocations build missing images on demand
+        pass
 
 @app.on_event("startup")
 async def startup_event():
     # Initialize database
     init_db()
-    # Ensure Docker base images are built
-    docker_manager.build_base_images()
+    # Build Docker base images without holding up startup when a daemon is slow or down
+    threading.Thread(target=_build_base_images_in_background, name="base-images", daemon=True).start()
+    # Sweep up containers, images and workspaces leaked by failed invocations
+    reaper.start()
+    # Arm every enabled schedule and catch up on runs missed while down
+    schedules.start()
+    # Resume every event source from its last checkpoint
+    event_sources.start()
+    # Compact old execution rows into minute and hour rollups
+    retention.start()
+    # Flush per-function latency sketches into the minute rollups
+    LATENCY.start(lambda db: FunctionService(db, docker_manager))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Stop the reaper, pooled sandbox workers and persistent runners
+    reaper.stop()
+    schedules.stop()
+    event_sources.stop()
+    retention.stop()
+    LATENCY.stop()
+    workflows.shutdown()
+    process_backend.shutdown()
+    docker_manager.node_runners.shutdown()
 
 @app.get("/")
 async def root():
@@ -54,6 +137,22 @@ async def create_function(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/functions/bulk")
+def create_functions(
+    functions_data: List[Dict[str, Any]] = Body(..., embed=True, alias="functions"),
+    db: Session = Depends(get_db)
+):
+    """Deploy many functions in one transaction, preparing their artifacts concurrently"""
+    function_service = FunctionService(db, docker_manager)
+    try:
+        results = function_service.create_functions(functions_data)
+    except Exception as e:
+        # Only a failed transaction gets here; invalid definitions are reported per function
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    created = sum(result["status"] == "created" for result in results)
+    return {"created": created, "failed": len(results) - created, "functions": results}
+
 @app.get("/functions/")
 async def get_functions(db: Session = Depends(get_db)):
     """Get all functions"""
@@ -90,45 +189,238 @@ async def update_function(
 async def delete_function(function_id: int, db: Session = Depends(get_db)):
     """Delete a function"""
     function_service = FunctionService(db, docker_manager)
+    function_schedules = function_service.get_schedules(function_id)
+    function_sources = function_service.get_event_sources(function_id)
     success = function_service.delete_function(function_id)
     if not success:
         raise HTTPException(status_code=404, detail="Function not found")
+    for schedule in function_schedules:
+        schedules.remove(schedule["id"])
+    for source in function_sources:
+        event_sources.remove(source["id"])
     return {"message": "Function deleted successfully"}
 
+@app.get("/functions/{function_id}/versions")
+async def get_function_versions(function_id: int, db: Session = Depends(get_db)):
+    """Get all immutable versions of a function"""
+    function_service = FunctionService(db, docker_manager)
+    if not function_service.get_function(function_id):
+        raise HTTPException(status_code=404, detail="Function not found")
+    return function_service.get_versions(function_id)
+
+@app.get("/functions/{function_id}/aliases")
+async def get_function_aliases(function_id: int, db: Session = Depends(get_db)):
+    """Get the aliases of a function"""
+    function_service = FunctionService(db, docker_manager)
+    if not function_service.get_function(function_id):
+        raise HTTPException(status_code=404, detail="Function not found")
+    return function_service.get_aliases(function_id)
+
+@app.put("/functions/{function_id}/aliases/{alias}")
+async def set_function_alias(
+    function_id: int,
+    alias: str,
+    alias_data: Dict[str, Any] = Body(...),
+    db: Session = Depends(get_db)
+):
+    """Point an alias such as "live" or "canary" at a version"""
+    function_service = FunctionService(db, docker_manager)
+    if not function_service.get_function(function_id):
+        raise HTTPException(status_code=404, detail="Function not found")
+    if "version" not in alias_data:
+        raise HTTPException(status_code=400, detail="Missing required field: version")
+    try:
+        return function_service.set_alias(function_id, alias, alias_data["version"])
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/functions/{function_id}/schedules")
+async def get_function_schedules(function_id: int, db: Session = Depends(get_db)):
+    """Get the cron schedules of a function"""
+    function_service = FunctionService(db, docker_manager)
+    if not function_service.get_function(function_id):
+        raise HTTPException(status_code=404, detail="Function not found")
+    return function_service.get_schedules(function_id)
+
+@app.post("/functions/{function_id}/schedules", status_code=201)
+async def create_function_schedule(
+    function_id: int,
+    schedule_data: Dict[str, Any] = Body(...),
+    db: Session = Depends(get_db)
+):
+    """Run a function on a cron schedule"""
+    function_service = FunctionService(db, docker_manager)
+    if not function_service.get_function(function_id):
+        raise HTTPException(status_code=404, detail="Function not found")
+    try:
+        schedule = function_service.create_schedule(function_id, schedule_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    schedules.load(schedule)
+    return schedule
+
+@app.put("/functions/{function_id}/schedules/{schedule_id}")
+async def update_function_schedule(
+    function_id: int,
+    schedule_id: int,
+    schedule_data: Dict[str, Any] = Body(...),
+    db: Session = Depends(get_db)
+):
+    """Update a schedule"""
+    function_service = FunctionService(db, docker_manager)
+    try:
+        schedule = function_service.update_schedule(function_id, schedule_id, schedule_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    schedules.load(schedule)
+    return schedule
+
+@app.delete("/functions/{function_id}/schedules/{schedule_id}")
+async def delete_function_schedule(function_id: int, schedule_id: int, db: Session = Depends(get_db)):
+    """Delete a schedule"""
+    function_service = FunctionService(db, docker_manager)
+    if not function_service.delete_schedule(function_id, schedule_id):
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    schedules.remove(schedule_id)
+    return {"message": "Schedule deleted successfully"}
+
+@app.get("/schedules/stats")
+async def get_schedule_stats():
+    """Get timer wheel and scheduled run counters"""
+    return schedules.get_stats()
+
+@app.get("/functions/{function_id}/event-sources")
+async def get_function_event_sources(function_id: int, db: Session = Depends(get_db)):
+    """Get the event sources feeding a function"""
+    function_service = FunctionService(db, docker_manager)
+    if not function_service.get_function(function_id):
+        raise HTTPException(status_code=404, detail="Function not found")
+    return function_service.get_event_sources(function_id)
+
+@app.post("/functions/{function_id}/event-sources", status_code=201)
+async def create_function_event_source(
+    function_id: int,
+    source_data: Dict[str, Any] = Body(...),
+    db: Session = Depends(get_db)
+):
+    """Feed an NDJSON file or queue directory to a function in micro-batches"""
+    function_service = FunctionService(db, docker_manager)
+    if not function_service.get_function(function_id):
+        raise HTTPException(status_code=404, detail="Function not found")
+    try:
+        source = function_service.create_event_source(function_id, source_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    event_sources.load(source)
+    return source
+
+@app.delete("/functions/{function_id}/event-sources/{source_id}")
+async def delete_function_event_source(function_id: int, source_id: int, db: Session = Depends(get_db)):
+    """Stop and delete an event source"""
+    function_service = FunctionService(db, docker_manager)
+    if not function_service.delete_event_source(function_id, source_id):
+        raise HTTPException(status_code=404, detail="Event source not found")
+    event_sources.remove(source_id)
+    return {"message": "Event source deleted successfully"}
+
+@app.get("/event-sources/stats")
+async def get_event_source_stats():
+    """Get delivery counters and checkpoints of running event sources"""
+    return event_sources.get_stats()
+
 @app.post("/functions/{function_id}/invoke")
 async def invoke_function(
     function_id: int,
-    payload: Dict[str, Any] = Body(default={}),
+    request: Request,
+    alias: Optional[str] = None,
+    version: Optional[str] = None,
+    timeout: Optional[float] = None,
     background_tasks: BackgroundTasks = BackgroundTasks(),
     db: Session = Depends(get_db)
 ):
-    """Invoke a function with the given payload"""
+    """Invoke a function with the given payload, by alias (default "live") or version"""
+    if timeout is not None and timeout <= 0:
+        raise HTTPException(status_code=400, detail="timeout must be positive")
+    
+    # Negotiate the request and response encodings from the headers
+    content_type = request.headers.get("content-type")
+    raw_body = is_raw_content_type(content_type)
+    request_codec = JSON if raw_body else codec_for_content_type(content_type)
+    if request_codec is None:
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Type: {content_type}")
+    response_codec = negotiate(request.headers.get("accept"), default=request_codec)
+    if response_codec is None:
+        raise HTTPException(status_code=406, detail="No acceptable response encoding")
+    
+    # Resolve the version once; a concurrent deploy can't change it mid-call
     function_service = FunctionService(db, docker_manager)
-    function = function_service.get_function(function_id)
+    function = function_service.resolve_version(function_id, alias, version)
     if not function:
-        raise HTTPException(status_code=404, detail="Function not found")
+        raise HTTPException(status_code=404, detail="Function or version not found")
+    
+    # The body is passed to the runner still encoded instead of being parsed here
+    try:
+        body = await _read_input(
+            request,
+            function.function.max_input_size or MAX_INPUT_SIZE,
+            None if raw_body else request_codec
+        )
+    except PayloadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if isinstance(body, SpooledPayload):
+        payload = body
+    elif raw_body:
+        payload = body
+    else:
+        payload = EncodedPayload(body or request_codec.dumps({}), request_codec)
     
     try:
+        # The budget starts now and can only be tightened, never extended, by the caller
         start_time = time.time()
-        result = docker_manager.run_function(function, payload)
+        deadline = Deadline.for_function(function, timeout)
+        if function.function.coalesce:
+            # Identical concurrent calls of the same version and timeout wait on one execution;
+            # one already in flight started earlier, so it ends within the joining call's budget too
+            # Hashing decodes the whole body, up to the input size limit, so it runs off the event loop
+            key = (function_id, function.version, deadline.timeout, await run_in_threadpool(input_hash, payload))
+            result, shared = await single_flight.run(key, backends.run_function, function, payload, deadline=deadline)
+        else:
+            # Off the event loop, so health checks and other requests are served meanwhile
+            result = await run_in_threadpool(backends.run_function, function, payload, deadline=deadline)
+            shared = False
         execution_time = time.time() - start_time
+        headers = {"X-Coalesced": "true"} if shared else None
         
-        # Store metrics asynchronously
-        background_tasks.add_task(
-            function_service.record_execution,
-            function_id,
-            execution_time,
-            result.get("status", "error"),
-            result.get("error")
-        )
+        # A body the runner couldn't decode is the caller's error and isn't recorded against the function
+        if result.get("status") == BAD_REQUEST:
+            return JSONResponse(status_code=400, content={"error": result["error"]}, headers=headers)
+        
+        # Store metrics asynchronously; a shared result was already recorded by its first caller
+        if not shared:
+            background_tasks.add_task(function_service.record_result, function_id, execution_time, result)
         
         if "error" in result:
             return JSONResponse(
                 status_code=500,
-                content={"error": result["error"]}
+                content={"error": result["error"]},
+                headers=headers
+            )
+        
+        # Large binary outputs come back as a shared-memory view
+        if is_buffer(result.get("output")):
+            return StreamingResponse(
+                _stream_buffer(memoryview(result["output"]).cast("B")),
+                media_type="application/octet-stream",
+                headers=headers
             )
         
-        return result["output"]
+        return Response(
+            content=response_codec.dumps(result["output"]),
+            media_type=response_codec.media_types[0],
+            headers=headers
+        )
     except Exception as e:
         background_tasks.add_task(
             function_service.record_execution,
@@ -138,6 +430,80 @@ async def invoke_function(
             str(e)
         )
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Unlink a spooled body once the call ends; backends still holding its mapping are unaffected
+        if isinstance(payload, SpooledPayload):
+            payload.cleanup()
+
+@app.post("/workflows/execute")
+def execute_workflow(
+    definition: Dict[str, Any] = Body(...),
+    background_tasks: BackgroundTasks = BackgroundTasks(),
+    db: Session = Depends(get_db)
+):
+    """Run a DAG of functions in one request and return the final output with per-step timings"""
+    # A plain def, so FastAPI runs the whole DAG in its threadpool instead of on the event loop
+    function_service = FunctionService(db, docker_manager)
+    try:
+        functions = function_service.resolve_workflow(definition)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    result = workflows.run(definition, functions)
+    
+    # Store metrics for every step that ran
+    for step_id, step in result["steps"].items():
+        if "execution_time" in step:
+            background_tasks.add_task(
+                function_service.record_execution,
+                step["function_id"],
+                step["execution_time"],
+                step["status"],
+                step.get("error"),
+                step.pop("usage"),
+                step.get("cold_start"),
+                step.get("phases")
+            )
+    
+    if result["status"] != "success":
+        return JSONResponse(status_code=500, content=result)
+    return Response(content=JSON.dumps(result), media_type=JSON.media_types[0])
+
+@app.get("/functions/{function_id}/coldstarts")
+async def get_cold_starts(function_id: int, hours: int = 24, bucket_minutes: int = 60, db: Session = Depends(get_db)):
+    """Get the cold-start ratio and per-phase startup percentiles over time"""
+    if hours <= 0 or bucket_minutes <= 0:
+        raise HTTPException(status_code=400, detail="hours and bucket_minutes must be positive")
+    function_service = FunctionService(db, docker_manager)
+    if not function_service.get_function(function_id):
+        raise HTTPException(status_code=404, detail="Function not found")
+    try:
+        return function_service.get_cold_start_report(function_id, hours, bucket_minutes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/coalescing/stats")
+async def get_coalescing_stats():
+    """Get how many invocations each coalescing function shared instead of running"""
+    return single_flight.get_stats()
+
+@app.get("/functions/{function_id}/recommendation")
+async def get_resource_recommendation(function_id: int, sample_size: int = 100, db: Session = Depends(get_db)):
+    """Suggest memory_limit and timeout from measured usage"""
+    function_service = FunctionService(db, docker_manager)
+    recommendation = function_service.get_resource_recommendation(function_id, sample_size)
+    if recommendation is None:
+        raise HTTPException(status_code=404, detail="Function not found")
+    return recommendation
+
+@app.post("/functions/{function_id}/recommendation/apply")
+async def apply_resource_recommendation(function_id: int, sample_size: int = 100, db: Session = Depends(get_db)):
+    """Right-size memory_limit and timeout from measured usage"""
+    function_service = FunctionService(db, docker_manager)
+    recommendation = function_service.apply_resource_recommendation(function_id, sample_size)
+    if recommendation is None:
+        raise HTTPException(status_code=404, detail="Function not found")
+    return recommendation
 
 @app.get("/execution-stats")
 async def get_execution_stats(db: Session = Depends(get_db)):
@@ -152,19 +518,84 @@ async def get_base_images():
     base_images = docker_manager.get_base_images()
     return {"base_images": base_images}
 
+@app.get("/hosts")
+async def get_hosts():
+    """Get load, health and warm functions of every Docker host, and the runners shared on this node"""
+    return {
+        "hosts": docker_manager.scheduler.get_stats(),
+        "warm": docker_manager.scheduler.router.get_stats(),
+        "shared": docker_manager.registry.get_stats()
+    }
+
+@app.get("/reaper")
+async def get_reaper_stats():
+    """Get what the background reaper has reclaimed"""
+    return reaper.get_stats()
+
+@app.post("/reaper/run")
+def run_reaper():
+    """Run one budgeted reaper pass now"""
+    return reaper.run_once()
+
+@app.get("/retention")
+async def get_retention_stats():
+    """Get retention windows and how many execution rows have been compacted"""
+    return retention.get_stats()
+
+@app.post("/retention/run")
+def run_retention():
+    """Run one bounded compaction pass now"""
+    return retention.run_once()
+
 @app.post("/base-images/build")
 async def build_base_images():
     """Build base images"""
     try:
-        docker_manager.build_base_images()
+        docker_manager.build_base_images(force=True)
         return {"message": "Base images built successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/health")
-async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy"}
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness_check():
+    """Readiness probe: the database answers and at least one Docker host is reachable"""
+    checks = {}
+    ready = True
+    
+    try:
+        init_db()
+        db = SessionLocal()
+        try:
+            db.execute(text("SELECT 1"))
+        finally:
+            db.close()
+        checks["database"] = {"status": "ok"}
+    except Exception as e:
+        checks["database"] = {"status": "error", "error": str(e)}
+        ready = False
+    
+    healthy_hosts = docker_manager.scheduler.healthy_hosts()
+    checks["docker"] = {
+        "status": "ok" if healthy_hosts else "error",
+        "healthy_hosts": healthy_hosts,
+        "base_images": sorted(docker_manager.base_images_ready)
+    }
+    if not healthy_hosts:
+        ready = False
+    elif not set(healthy_hosts) <= docker_manager.base_images_ready:
+        # A host came up after startup; build its images ahead of the first invocation
+        threading.Thread(target=_build_base_images_in_background, name="base-images", daemon=True).start()
+    
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not ready", "checks": checks}
+    )
 #this endpoint is used to check the health of the serverless function platform
 @app.get("/logs/{function_id}")
 async def get_function_logs(function_id: int, db: Session = Depends(get_db)):
@@ -196,18 +627,35 @@ async def get_function_metrics(function_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Metrics not found")
     return metrics
 
+def _parse_quantiles(quantiles):
+    try:
+        values = [float(q) for q in quantiles.split(",") if q.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Quantiles must be numbers between 0 and 1")
+    if not values or any(not 0 < q <= 1 for q in values):
+        raise HTTPException(status_code=400, detail="Quantiles must be numbers between 0 and 1")
+    return values
+
+@app.get("/functions/{function_id}/metrics")
+async def get_function_latency(function_id: int, window_minutes: int = 60, quantiles: str = "0.5,0.95,0.99",
+                               db: Session = Depends(get_db)):
+    """Execution counts and latency percentiles over a sliding window"""
+    if window_minutes < 1:
+        raise HTTPException(status_code=400, detail="window_minutes must be at least 1")
+    function_service = FunctionService(db, docker_manager)
+    metrics = function_service.get_latency_metrics(function_id, window_minutes, _parse_quantiles(quantiles))
+    if metrics is None:
+        raise HTTPException(status_code=404, detail="Function not found")
+    return metrics
+
 @app.get("/logs/{function_id}/metrics/average")
-async def get_function_metrics_average(function_id: int, db: Session = Depends(get_db)):
+async def get_function_metrics_average(function_id: int, window_minutes: int = 60, db: Session = Depends(get_db)):
     """Get average metrics for a specific function"""
     function_service = FunctionService(db, docker_manager)
-    metrics = function_service.get_function_metrics_average(function_id)
-    if not metrics:
+    # Served from the latency sketches, so the tail is reported alongside the average
+    metrics = function_service.get_latency_metrics(function_id, window_minutes)
+    if metrics is None:
         raise HTTPException(status_code=404, detail="Metrics not found")
-    else:
-        # Calculate average execution time
-        total_time = sum(log["execution_time"] for log in metrics)
-        average_time = total_time / len(metrics) if metrics else 0
-        metrics["average_execution_time"] = average_time
     return metrics
 
 
@@ -243,5 +691,7 @@ async def download_function_logs(function_id: int, db: Session = Depends(get_db)
     )
 
 if __name__ == "__main__":
+    # Only needed when run directly, so workers started by a server don't pay for it
+    import uvicorn
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
 
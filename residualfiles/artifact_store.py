@@ -0,0 +1,46 @@
+# artifact_store.py
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+# Function code and its compiled forms, one directory per SHA-256 of the source
+ARTIFACT_DIR = Path(os.path.abspath(os.environ.get(
+    "ARTIFACT_DIR", Path(os.path.dirname(os.path.abspath(__file__))) / "artifacts"
+)))
+SOURCE_FILE = "source"
+
+
+def artifact_dir(digest):
+    """Directory holding a function's artifacts; mounted read-only into containers"""
+    return ARTIFACT_DIR / digest
+
+
+def artifact_path(digest, name=SOURCE_FILE):
+    return artifact_dir(digest) / name
+
+
+def put(code):
+    """Store function source unless identical source already is, returning its hash"""
+    data = code.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    if not artifact_path(digest).exists():
+        write(digest, SOURCE_FILE, data)
+    return digest
+
+
+def read(digest):
+    """Source stored under a code hash"""
+    return artifact_path(digest).read_text("utf-8")
+
+
+def write(digest, name, data):
+    """Save an artifact atomically so concurrent readers never see a partial file"""
+    directory = artifact_dir(digest)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    # Containers read artifacts as whatever user their image runs as
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, directory / name)
@@ -0,0 +1,84 @@
+# backends.py
+from codec import JSON, EncodedPayload
+from payload_transfer import SpooledPayload, is_buffer
+
+BACKENDS = ["docker", "process"]
+DEFAULT_BACKEND = "docker"
+# Result status of an event the runner couldn't decode; the caller's error, not the function's
+BAD_REQUEST = "bad_request"
+
+
+def resolve_codec(event_data, codec=None):
+    """Pre-encoded events carry their codec; everything else defaults to JSON"""
+    if codec is not None:
+        return codec
+    if isinstance(event_data, (EncodedPayload, SpooledPayload)) and event_data.codec is not None:
+        return event_data.codec
+    return JSON
+
+
+def encode_event(event_data, codec):
+    """Turn an event into the (kind, body) pair sent to long-lived runners"""
+    if is_buffer(event_data):
+        return "raw", event_data
+    if isinstance(event_data, SpooledPayload):
+        # Sent straight from the mapped file
+        return "raw" if event_data.raw else "encoded", event_data.view()
+    if isinstance(event_data, EncodedPayload):
+        return "encoded", event_data.data
+    return "encoded", codec.dumps(event_data)
+
+
+def decode_reply(reply, data, codec):
+    """Turn a runner reply frame into a result dict"""
+    if reply.get("status") != "success":
+        return reply
+    output = memoryview(data) if reply["kind"] == "raw" else codec.loads(data)
+    result = {"output": output, "execution_time": reply["execution_time"], "status": "success"}
+    for field in ("usage", "load_time"):
+        if field in reply:
+            result[field] = reply[field]
+    return result
+
+
+class ExecutionBackend:
+    """Interface every function execution backend implements"""
+
+    name = None
+
+    def run_function(self, function, event_data, codec=None, deadline=None):
+        """
+        Run a function and return its result dict.
+
+        The result carries "status" plus either "output" and
+        "execution_time" or "error" (and optionally "traceback"),
+        mirroring what the runners write to their result file.
+        Backends also set "cold_start" and, for cold starts, a
+        "phases" breakdown in seconds (image, create, start, boot,
+        load, handler). Without a deadline the function's own timeout
+        applies.
+        """
+        raise NotImplementedError
+
+
+class BackendRegistry:
+    """Picks the execution backend configured on each function"""
+
+    def __init__(self, default=DEFAULT_BACKEND):
+        self.default = default
+        self._backends = {}
+
+    def register(self, backend):
+        self._backends[backend.name] = backend
+
+    def get(self, name):
+        if name not in self._backends:
+            raise ValueError(f"Unsupported backend: {name}")
+        return self._backends[name]
+
+    def for_function(self, function):
+        return self.get(getattr(function, "backend", None) or self.default)
+
+    def run_function(self, function, event_data, codec=None, deadline=None):
+        """Run a function on the backend it is configured for"""
+        return self.for_function(function).run_function(function, event_data, codec, deadline)
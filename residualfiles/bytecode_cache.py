@@ -0,0 +1,96 @@
+# bytecode_cache.py
+import ast
+import hashlib
+import marshal
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import artifact_store
+
+# Compiled code is kept next to its source in the artifact store, one file per interpreter cache tag
+INTERPRETER = sys.implementation.cache_tag  # e.g. "cpython-311"
+
+
+def code_hash(code):
+    """SHA-256 of the function source"""
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def validate_code(code, language):
+    """Reject code that can't load, raising ValueError with the reason"""
+    if language == "python":
+        try:
+            tree = ast.parse(code, "function.py")
+        except SyntaxError as e:
+            raise ValueError(f"Syntax error on line {e.lineno}: {e.msg}")
+        if "handler" not in _top_level_names(tree.body):
+            raise ValueError("Function must contain a 'handler' function")
+    elif language == "javascript":
+        _check_javascript(code)
+
+
+# Statements whose blocks still run at module level, e.g. "try: import x / except ImportError: ..."
+MODULE_LEVEL_BLOCKS = (ast.If, ast.Try, getattr(ast, "TryStar", ast.Try), ast.With, ast.For, ast.While)
+
+
+def _top_level_names(body):
+    names = set()
+    for node in body:
+        if isinstance(node, MODULE_LEVEL_BLOCKS):
+            for field in ("body", "orelse", "finalbody"):
+                names |= _top_level_names(getattr(node, field, []))
+            for handler in getattr(node, "handlers", []):
+                names |= _top_level_names(handler.body)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names.update(t.id for t in targets if isinstance(t, ast.Name))
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+    return names
+
+
+def _check_javascript(code):
+    """Syntax-check JavaScript with node when it is installed on this host"""
+    node = shutil.which("node")
+    if node is None:
+        return
+    with tempfile.NamedTemporaryFile("w", suffix=".js", delete=False) as f:
+        f.write(code)
+    try:
+        check = subprocess.run([node, "--check", f.name], capture_output=True, text=True, timeout=10)
+    except subprocess.TimeoutExpired:
+        raise ValueError("JavaScript syntax check timed out")
+    finally:
+        os.remove(f.name)
+    if check.returncode != 0:
+        # node prints the offending source line first, then the error itself
+        errors = [line for line in check.stderr.splitlines() if "Error" in line]
+        raise ValueError(errors[0] if errors else "Invalid JavaScript")
+
+
+def artifact_path(digest, interpreter=INTERPRETER):
+    return artifact_store.artifact_path(digest, f"{interpreter}.bin")
+
+
+def load(digest, interpreter=INTERPRETER):
+    """Marshalled code object for a code hash and interpreter, or None"""
+    try:
+        return artifact_path(digest, interpreter).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def store(digest, interpreter, data):
+    artifact_store.write(digest, f"{interpreter}.bin", data)
+
+
+def precompile(code):
+    """Compile code for this interpreter and cache it, returning the code hash"""
+    digest = code_hash(code)
+    if load(digest) is None:
+        store(digest, INTERPRETER, marshal.dumps(compile(code, "function.py", "exec")))
+    return digest
@@ -0,0 +1,120 @@
+# codec.py
+import json
+
+# Fast JSON and msgpack are optional; stdlib json is always available
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+RAW_MEDIA_TYPE = "application/octet-stream"
+
+
+class JSONCodec:
+    name = "json"
+    media_types = ("application/json",)
+
+    def dumps(self, obj):
+        """Encode an object to JSON bytes"""
+        if orjson is not None:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj).encode("utf-8")
+
+    def loads(self, data):
+        """Decode JSON from bytes, bytearray or memoryview"""
+        if orjson is not None:
+            return orjson.loads(data)
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    name = "msgpack"
+    media_types = ("application/msgpack", "application/x-msgpack")
+
+    def dumps(self, obj):
+        """Encode an object to msgpack bytes"""
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        """Decode msgpack from any bytes-like object"""
+        return msgpack.unpackb(data, raw=False)
+
+
+JSON = JSONCodec()
+CODECS = {JSON.name: JSON}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+_BY_MEDIA_TYPE = {
+    media_type: codec
+    for codec in CODECS.values()
+    for media_type in codec.media_types
+}
+
+
+class EncodedPayload:
+    """An event that is already encoded with a codec and is passed through as-is"""
+
+    def __init__(self, data, codec):
+        self.data = data
+        self.codec = codec
+
+
+def _media_type(header):
+    return header.split(";", 1)[0].strip().lower()
+
+
+def get_codec(name):
+    """Look up a codec by name"""
+    if name not in CODECS:
+        raise ValueError(f"Unsupported codec: {name}")
+    return CODECS[name]
+
+
+def is_raw_content_type(content_type):
+    """Check whether a Content-Type header marks a raw binary body"""
+    return bool(content_type) and _media_type(content_type) == RAW_MEDIA_TYPE
+
+
+def codec_for_content_type(content_type):
+    """Pick the codec for a request Content-Type, or None if unsupported"""
+    if not content_type:
+        return JSON
+    return _BY_MEDIA_TYPE.get(_media_type(content_type))
+
+
+def negotiate(accept, default=JSON):
+    """Pick the response codec from an Accept header, or None if nothing matches"""
+    if not accept:
+        return default
+
+    best, best_q = None, 0.0
+    for item in accept.split(","):
+        media_type, _, params = item.partition(";")
+        media_type = media_type.strip().lower()
+
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+
+        if media_type in ("*/*", "application/*"):
+            codec = default
+        else:
+            codec = _BY_MEDIA_TYPE.get(media_type)
+
+        if codec is not None and q > best_q:
+            best, best_q = codec, q
+
+    return best
@@ -1,9 +1,11 @@
 # database.py
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import create_engine, exc, Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, synonym
+import artifact_store
 import datetime
 import os
+import threading
 
 # Create SQLite database
 DATABASE_URL = "sqlite:///./serverless_platform.db"
@@ -11,21 +13,106 @@ engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+class StoredCode:
+    """Source of a function or version, read from the artifact store by code_hash"""
+    
+    @property
+    def code(self):
+        return artifact_store.read(self.code_hash) if self.code_hash else self.inline_code
+
 # Define database models
-class Function(Base):
+class Function(StoredCode, Base):
     __tablename__ = "functions"
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
     route = Column(String, unique=True)
     language = Column(String)  # "python" or "javascript"
-    code = Column(Text)
+    inline_code = Column("code", Text, nullable=True)  # only rows from before the artifact store; see init_db
+    code_hash = Column(String, index=True)  # SHA-256 of code, keys its artifacts
     timeout = Column(Integer, default=30)  # timeout in seconds
     memory_limit = Column(Integer, default=128)  # memory limit in MB
+    backend = Column(String, default="docker")  # "docker" or "process"
+    coalesce = Column(Boolean, default=False)  # share one execution among identical concurrent calls
+    max_input_size = Column(Integer, nullable=True)  # largest accepted input in bytes; None uses MAX_INPUT_SIZE
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     
     executions = relationship("FunctionExecution", back_populates="function")
+    versions = relationship("FunctionVersion", back_populates="function", cascade="all, delete-orphan")
+    aliases = relationship("FunctionAlias", back_populates="function", cascade="all, delete-orphan")
+    schedules = relationship("FunctionSchedule", back_populates="function", cascade="all, delete-orphan")
+    event_sources = relationship("EventSource", back_populates="function", cascade="all, delete-orphan")
+    rollups = relationship("ExecutionRollup", back_populates="function", cascade="all, delete-orphan")
+
+class FunctionVersion(StoredCode, Base):
+    __tablename__ = "function_versions"
+    
+    # Immutable snapshot of a function definition, identified by its content hash
+    function_id = Column(Integer, ForeignKey("functions.id"), primary_key=True)
+    version = Column(String, primary_key=True)
+    language = Column(String)
+    inline_code = Column("code", Text, nullable=True)
+    code_hash = Column(String, index=True)
+    timeout = Column(Integer)
+    memory_limit = Column(Integer)
+    backend = Column(String)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    
+    # Lets a version stand in for its function when it is executed
+    id = synonym("function_id")
+    
+    function = relationship("Function", back_populates="versions")
+
+class FunctionAlias(Base):
+    __tablename__ = "function_aliases"
+    
+    function_id = Column(Integer, ForeignKey("functions.id"), primary_key=True)
+    name = Column(String, primary_key=True)  # e.g. "live" or "canary"
+    version = Column(String)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    
+    function = relationship("Function", back_populates="aliases")
+
+class FunctionSchedule(Base):
+    __tablename__ = "function_schedules"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    function_id = Column(Integer, ForeignKey("functions.id"), index=True)
+    cron = Column(String)  # five-field cron expression, UTC
+    alias = Column(String, default="live")
+    payload = Column(Text, nullable=True)  # JSON event passed to every run
+    jitter = Column(Integer, default=30)  # max seconds each run is randomly delayed
+    misfire_policy = Column(String, default="skip")  # "skip", "run_once" or "run_all"
+    overlap_policy = Column(String, default="skip")  # "skip", "queue" or "allow"
+    enabled = Column(Boolean, default=True)
+    next_run_at = Column(DateTime, nullable=True)
+    last_run_at = Column(DateTime, nullable=True)
+    last_status = Column(String, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    
+    function = relationship("Function", back_populates="schedules")
+
+class EventSource(Base):
+    __tablename__ = "event_sources"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    function_id = Column(Integer, ForeignKey("functions.id"), index=True)
+    kind = Column(String)  # "ndjson" or "queue_dir"
+    path = Column(String)
+    alias = Column(String, default="live")
+    batch_size = Column(Integer, default=100)  # max events per invocation
+    batch_latency = Column(Float, default=1.0)  # max seconds an event waits for its batch
+    enabled = Column(Boolean, default=True)
+    offset = Column(Integer, default=0)  # ndjson: committed byte offset; queue_dir: events delivered
+    inode = Column(Integer, nullable=True)  # ndjson: detects rotation
+    last_error = Column(Text, nullable=True)
+    owner = Column(String, nullable=True)  # "<hostname>:<pid>" of the worker consuming it
+    lease_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    
+    function = relationship("Function", back_populates="event_sources")
 
 class FunctionExecution(Base):
     __tablename__ = "function_executions"
@@ -33,21 +120,106 @@ class FunctionExecution(Base):
     id = Column(Integer, primary_key=True, index=True)
     function_id = Column(Integer, ForeignKey("functions.id"))
     execution_time = Column(Float)  # in seconds
+    cpu_time = Column(Float, nullable=True)  # CPU seconds used by the invocation
+    memory_peak = Column(Float, nullable=True)  # peak memory in MB
+    cold_start = Column(Boolean, nullable=True)
+    startup_phases = Column(Text, nullable=True)  # JSON seconds per cold-start phase
     status = Column(String)  # "success" or "error"
     error_message = Column(Text, nullable=True)
-    executed_at = Column(DateTime, default=datetime.datetime.utcnow)
-
-    while True:
-        try:
-            os.system("docker ps")
-            break
-        except Exception as e:
-            time.sleep(0.5)
-    
+    executed_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    rolled_up = Column(Boolean, default=False, nullable=False, index=True)  # counted in the minute rollups
+
     function = relationship("Function", back_populates="executions")
 
+class ExecutionRollup(Base):
+    __tablename__ = "execution_rollups"
+    __table_args__ = (UniqueConstraint("function_id", "resolution", "bucket_start"),)
+    
+    # Executions past the raw retention window, compacted per minute and then per hour
+    id = Column(Integer, primary_key=True, index=True)
+    function_id = Column(Integer, ForeignKey("functions.id"), index=True)
+    resolution = Column(String)  # "minute" or "hour"
+    bucket_start = Column(DateTime, index=True)
+    count = Column(Integer, default=0)
+    errors = Column(Integer, default=0)
+    cold_starts = Column(Integer, default=0)
+    latency_sum = Column(Float, default=0.0)  # seconds
+    latency_max = Column(Float, default=0.0)
+    sketch = Column(Text)  # JSON DDSketch of execution times
+    
+    function = relationship("Function", back_populates="rollups")
+
+# Columns added to existing tables since they were introduced, for databases created before them
+COLUMNS_ADDED = {
+    "functions": {
+        "backend": "VARCHAR DEFAULT 'docker'",
+        "code_hash": "VARCHAR",
+        "coalesce": "BOOLEAN DEFAULT 0",
+        "max_input_size": "INTEGER"
+    },
+    "function_executions": {
+        "cpu_time": "FLOAT",
+        "memory_peak": "FLOAT",
+        "cold_start": "BOOLEAN",
+        "startup_phases": "TEXT",
+        # Executions recorded before rollups existed still have to be folded in
+        "rolled_up": "BOOLEAN NOT NULL DEFAULT 0"
+    },
+    "event_sources": {
+        "owner": "VARCHAR",
+        "lease_expires_at": "DATETIME"
+    }
+}
+# Indexes on existing tables; create_all only builds them along with a new table
+INDEXES_ADDED = {
+    "ix_functions_code_hash": ("functions", "code_hash"),
+    "ix_function_executions_executed_at": ("function_executions", "executed_at"),
+    "ix_function_executions_rolled_up": ("function_executions", "rolled_up")
+}
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    """Create any missing tables; only the first call per process touches the database"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            Base.metadata.create_all(bind=engine)
+            _add_missing_columns()
+            _move_code_to_artifacts()
+            _schema_ready = True
+
+def _add_missing_columns():
+    """Bring tables created by older versions up to the current models"""
+    with engine.begin() as conn:
+        for table, columns in COLUMNS_ADDED.items():
+            existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+            for column, definition in columns.items():
+                if column in existing:
+                    continue
+                try:
+                    conn.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN "{column}" {definition}')
+                except exc.OperationalError as e:
+                    # Another worker added it first
+                    if "duplicate column" not in str(e):
+                        raise
+        for name, (table, column) in INDEXES_ADDED.items():
+            conn.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ("{column}")')
+
+def _move_code_to_artifacts():
+    """Move source still stored in rows into the artifact store, keeping only its hash"""
+    db = SessionLocal()
+    try:
+        for model in (Function, FunctionVersion):
+            for row in db.query(model).filter(model.inline_code.isnot(None)):
+                row.code_hash = artifact_store.put(row.inline_code)
+                row.inline_code = None
+        db.commit()
+    finally:
+        db.close()
 
 def edit_db():
     db = SessionLocal()
@@ -60,6 +232,7 @@ def edit_db():
         db.close()
 
 def get_db():
+    init_db()
     db = SessionLocal()
     try:
         yield db
@@ -0,0 +1,99 @@
+# deadlines.py
+import heapq
+import itertools
+import threading
+import time
+
+
+class Deadline:
+    """A point in time an invocation must finish by, shared by every layer it passes through"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def for_function(cls, function, timeout=None):
+        """The function's timeout, tightened by a per-request timeout if one is given"""
+        if timeout is not None and timeout < function.timeout:
+            return cls(timeout)
+        return cls(function.timeout)
+
+    def remaining(self):
+        """Seconds left, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+
+class TimerHandle:
+    """A scheduled expiry callback that can be cancelled until it fires"""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.cancelled = False
+        self.fired = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class DeadlineScheduler:
+    """
+    One timer thread owning the kill deadlines of every in-flight invocation.
+
+    Deadlines sit in a min-heap, so the thread sleeps exactly until the
+    earliest one instead of each caller polling or starting its own timer.
+    Callbacks run on their own short-lived thread so a slow kill (e.g. a
+    Docker API call) never delays the deadlines behind it.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._order = itertools.count()
+        self._wakeup = threading.Condition()
+        self._thread = None
+
+    def _ensure_thread(self):
+        # Started lazily so importing this module never spawns threads; caller holds the lock
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="deadline-scheduler", daemon=True)
+            self._thread.start()
+
+    def schedule(self, deadline, callback):
+        """Call callback once deadline passes, unless the returned handle is cancelled first"""
+        handle = TimerHandle(callback)
+        with self._wakeup:
+            heapq.heappush(self._heap, (deadline.expires_at, next(self._order), handle))
+            self._ensure_thread()
+            # Only a new earliest deadline changes how long the thread should sleep
+            if self._heap[0][2] is handle:
+                self._wakeup.notify()
+        return handle
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._heap:
+                    self._wakeup.wait()
+                expires_at, _, handle = self._heap[0]
+                delay = expires_at - time.monotonic()
+                if delay > 0:
+                    self._wakeup.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                if handle.cancelled:
+                    continue
+                handle.fired = True
+            threading.Thread(target=handle.callback, daemon=True).start()
+
+    def pending(self):
+        """Number of deadlines not yet fired or cancelled"""
+        with self._wakeup:
+            return sum(1 for _, _, handle in self._heap if not handle.cancelled)
+
+
+# Shared by every backend in the process
+DEADLINES = DeadlineScheduler()
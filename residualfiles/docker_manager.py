@@ -1,16 +1,40 @@
 # docker_manager.py
 import docker
+import hashlib
 import os
 import tempfile
 import json
 import time
 import uuid
 import shutil
+import threading
 from pathlib import Path
+from payload_transfer import PayloadStage
+from scheduler import HostScheduler
+from backends import ExecutionBackend, resolve_codec
+from deadlines import DEADLINES, Deadline
+from reaper import IMAGE_LABEL, container_labels
+import artifact_store
+import bytecode_cache
+from resource_usage import UsageSampler
+from node_runner import NodeRunnerPool
+from warm_registry import WarmRegistry
 
-class DockerManager:
-    def __init__(self):
-        self.client = docker.from_env()
+# Interpreter in the Python base image, which compiled artifacts must match
+PYTHON_RUNNER_INTERPRETER = "cpython-39"
+# "persistent" serves JavaScript from long-lived runners, "oneshot" starts a container per call
+JS_RUNNER_MODE = os.environ.get("JS_RUNNER_MODE", "persistent")
+# How often a running container's resource usage is sampled, in seconds
+USAGE_SAMPLE_INTERVAL = 0.1
+# How long past its deadline a killed container may take to exit before the host is considered failed
+KILL_GRACE = 5.0
+
+class DockerManager(ExecutionBackend):
+    name = "docker"
+
+    def __init__(self, scheduler=None):
+        # Invocations are spread over every configured Docker endpoint; hosts connect on first use
+        self.scheduler = scheduler or HostScheduler.from_endpoints()
         self.base_path = Path(os.path.dirname(os.path.abspath(__file__)))
         self.templates_path = self.base_path / "templates" / "base_images"
         self.python_image_name = "serverless-platform/python:latest"
@@ -22,45 +46,199 @@ class DockerManager:
         
         # Create base image Dockerfiles and runners if they don't exist
         self._create_base_files()
+        
+        # Warm runners and built images are shared by every API worker on this node
+        self.registry = WarmRegistry()
+        self.node_runners = NodeRunnerPool(self.javascript_image_name, registry=self.registry)
+        self.base_images_ready = set()  # names of hosts whose base images are built
+        self._build_lock = threading.Lock()
+    
+    @property
+    def client(self):
+        return self.scheduler.hosts[0].client
+    
+    @property
+    def building_base_images(self):
+        return self._build_lock.locked()
     
+    def _write_template(self, path, content):
+        """Write a template file if it is missing or out of date"""
+        if path.exists() and path.read_text() == content:
+            return
+        with open(path, "w") as f:
+            f.write(content)
+
     def _create_base_files(self):
         # Python base image files
-        python_dockerfile = self.templates_path / "python" / "Dockerfile"
-        if not python_dockerfile.exists():
-            with open(python_dockerfile, "w") as f:
-                f.write("""FROM python:3.9-slim
+        self._write_template(self.templates_path / "python" / "Dockerfile", """FROM python:3.9-slim
 WORKDIR /app
 COPY runner.py /app/
-RUN pip install --no-cache-dir requests
+RUN pip install --no-cache-dir requests orjson msgpack
 CMD ["python", "runner.py"]
 """)
         
-        python_runner = self.templates_path / "python" / "runner.py"
-        if not python_runner.exists():
-            with open(python_runner, "w") as f:
-                f.write("""
+        self._write_template(self.templates_path / "python" / "runner.py", """
 import json
+import marshal
+import mmap
+import signal
 import sys
 import time
 import os
 import traceback
+from collections.abc import Mapping
 from types import ModuleType
 
+# Marks the end of interpreter boot, for the platform's cold-start profile
+RUNNER_STARTED_AT = time.time()
+PAYLOAD_DIR = '/payload'
+LARGE_PAYLOAD_THRESHOLD = int(os.environ.get('LARGE_PAYLOAD_THRESHOLD', 1024 * 1024))
+CODEC = os.environ.get('EVENT_CODEC', 'json')
+# Seconds left of the invocation's budget when the container started
+FUNCTION_TIMEOUT = float(os.environ.get('FUNCTION_TIMEOUT', '0'))
+
+# Events and results use the same codec as the API that started the container
+if CODEC == 'msgpack':
+    import msgpack
+
+    def dumps(obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(data):
+        return msgpack.unpackb(data, raw=False)
+else:
+    try:
+        import orjson
+
+        def dumps(obj):
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+        def loads(data):
+            return orjson.loads(data)
+    except ImportError:
+        def dumps(obj):
+            return json.dumps(obj).encode('utf-8')
+
+        def loads(data):
+            return json.loads(bytes(data))
+
+EVENT_FILE = '/app/event.' + CODEC
+RESULT_FILE = '/app/result.' + CODEC
+# The function's artifact directory, mounted read-only
+SOURCE_FILE = '/function/source'
+BYTECODE_FILE = '/function/' + sys.implementation.cache_tag + '.bin'
+COMPILED_FILE = '/app/function.' + sys.implementation.cache_tag + '.bin'
+
+class PayloadEvent(Mapping):
+    # Event staged in shared memory; 'buffer' is a zero-copy view of the
+    # encoded document and the mapping is decoded on first access
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self._data = None
+
+    def _decoded(self):
+        if self._data is None:
+            self._data = decode_event(self.buffer)
+        return self._data
+
+    def __getitem__(self, key):
+        return self._decoded()[key]
+
+    def __iter__(self):
+        return iter(self._decoded())
+
+    def __len__(self):
+        return len(self._decoded())
+
+def decode_event(data):
+    try:
+        return loads(data)
+    except ValueError as e:
+        raise BadRequest(f"Request body could not be decoded: {e}")
+
+def load_event():
+    with open(EVENT_FILE, 'rb') as f:
+        event = decode_event(f.read())
+
+    ref = event.get('__payload__') if isinstance(event, dict) else None
+    if ref is None:
+        return event
+
+    # Large payloads are memory-mapped straight from the shared segment
+    if ref['size'] == 0:
+        buffer = memoryview(b'')
+    else:
+        with open(ref['path'], 'rb') as f:
+            buffer = memoryview(mmap.mmap(f.fileno(), ref['size'], access=mmap.ACCESS_READ))
+
+    if ref['kind'] == 'raw':
+        return buffer
+    return PayloadEvent(buffer)
+
+def write_result(result):
+    # Raw buffers and large outputs go back through the shared segment
+    output = result.get('output')
+    kind, data = None, None
+    if isinstance(output, (bytes, bytearray, memoryview)):
+        kind, data = 'raw', output
+    elif 'output' in result and os.path.isdir(PAYLOAD_DIR):
+        encoded = dumps(output)
+        if len(encoded) >= LARGE_PAYLOAD_THRESHOLD:
+            kind, data = 'encoded', encoded
+
+    if data is not None:
+        with open(os.path.join(PAYLOAD_DIR, 'result.bin'), 'wb') as f:
+            f.write(data)
+        del result['output']
+        result['output_ref'] = {'kind': kind, 'size': len(data)}
+
+    with open(RESULT_FILE, 'wb') as f:
+        f.write(dumps(result))
+
+def load_code():
+    # A shipped artifact skips parsing and compiling the source
+    if os.path.exists(BYTECODE_FILE):
+        with open(BYTECODE_FILE, 'rb') as f:
+            return marshal.loads(f.read())
+
+    with open(SOURCE_FILE, 'r') as f:
+        code = compile(f.read(), 'function.py', 'exec')
+
+    # Hand the artifact back so the platform can store it for later runs
+    with open(COMPILED_FILE, 'wb') as f:
+        f.write(marshal.dumps(code))
+    return code
+
+class FunctionTimeout(Exception):
+    pass
+
+class BadRequest(Exception):
+    # The caller's event couldn't be decoded; not the function's failure
+    pass
+
+def on_timeout(signum, frame):
+    raise FunctionTimeout("Function execution timed out")
+
+STATUSES = {FunctionTimeout: "timeout", BadRequest: "bad_request"}
+
 def main():
-    # Load function code from file
-    with open('/app/function.py', 'r') as f:
-        function_code = f.read()
-    
-    # Load event data
-    with open('/app/event.json', 'r') as f:
-        event = json.load(f)
+    # Stop the handler ourselves when the budget runs out; the platform kills us just after
+    if FUNCTION_TIMEOUT > 0:
+        signal.signal(signal.SIGALRM, on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, FUNCTION_TIMEOUT)
     
     # Create a module for the function
     mod = ModuleType('function_module')
     
     try:
+        # Load function code and event data
+        load_start = time.time()
+        function_code = load_code()
+        event = load_event()
+
         # Execute the function code in the module's namespace
         exec(function_code, mod.__dict__)
+        load_time = time.time() - load_start
         
         # Ensure 'handler' function exists
         if not hasattr(mod, 'handler'):
@@ -72,50 +250,126 @@ def main():
         execution_time = time.time() - start_time
         
         # Write the result to output file
-        with open('/app/result.json', 'w') as f:
-            json.dump({
-                "output": result,
-                "execution_time": execution_time,
-                "status": "success"
-            }, f)
+        write_result({
+            "output": result,
+            "execution_time": execution_time,
+            "phases": {"runtime_start": RUNNER_STARTED_AT, "load": load_time},
+            "status": "success"
+        })
         
     except Exception as e:
         error_msg = traceback.format_exc()
-        with open('/app/result.json', 'w') as f:
-            json.dump({
+        with open(RESULT_FILE, 'wb') as f:
+            f.write(dumps({
                 "error": str(e),
                 "traceback": error_msg,
-                "status": "error"
-            }, f)
+                "status": STATUSES.get(type(e), "error")
+            }))
 
 if __name__ == '__main__':
     main()
 """)
         
         # JavaScript base image files
-        js_dockerfile = self.templates_path / "javascript" / "Dockerfile"
-        if not js_dockerfile.exists():
-            with open(js_dockerfile, "w") as f:
-                f.write("""FROM node:16-alpine
+        self._write_template(self.templates_path / "javascript" / "Dockerfile", """FROM node:16-alpine
 WORKDIR /app
 COPY runner.js /app/
+RUN mkdir -p /opt/runtime && cd /opt/runtime && npm install --no-save @msgpack/msgpack
+COPY server.js /opt/runtime/
+ENV NODE_PATH=/opt/runtime/node_modules
 CMD ["node", "runner.js"]
 """)
         
-        js_runner = self.templates_path / "javascript" / "runner.js"
-        if not js_runner.exists():
-            with open(js_runner, "w") as f:
-                f.write("""
+        self._write_template(self.templates_path / "javascript" / "runner.js", """
+// Marks the end of Node boot, for the platform's cold-start profile
+const RUNNER_STARTED_AT = Date.now() / 1000;
 const fs = require('fs');
 const path = require('path');
 
+const PAYLOAD_DIR = '/payload';
+const LARGE_PAYLOAD_THRESHOLD = parseInt(process.env.LARGE_PAYLOAD_THRESHOLD || '1048576', 10);
+const CODEC = process.env.EVENT_CODEC || 'json';
+const EVENT_FILE = '/app/event.' + CODEC;
+const RESULT_FILE = '/app/result.' + CODEC;
+// Seconds left of the invocation's budget when the container started
+const FUNCTION_TIMEOUT = parseFloat(process.env.FUNCTION_TIMEOUT || '0');
+
+// Events and results use the same codec as the API that started the container
+let encode;
+let decode;
+if (CODEC === 'msgpack') {
+    const msgpack = require('@msgpack/msgpack');
+    encode = (obj) => Buffer.from(msgpack.encode(obj));
+    decode = (buffer) => msgpack.decode(buffer);
+} else {
+    encode = (obj) => Buffer.from(JSON.stringify(obj), 'utf8');
+    decode = (buffer) => JSON.parse(buffer.toString('utf8'));
+}
+
+// The caller's event couldn't be decoded; not the function's failure
+class BadRequestError extends Error {}
+
+function decodeEvent(buffer) {
+    try {
+        return decode(buffer);
+    } catch (error) {
+        throw new BadRequestError('Request body could not be decoded: ' + error.message);
+    }
+}
+
+function loadEvent() {
+    const event = decodeEvent(fs.readFileSync(EVENT_FILE));
+    const ref = event && event.__payload__;
+    if (!ref) {
+        return event;
+    }
+
+    // Large payloads are read straight from the shared segment
+    const buffer = fs.readFileSync(ref.path);
+    return ref.kind === 'raw' ? buffer : decodeEvent(buffer);
+}
+
+function writeResult(result) {
+    // Raw buffers and large outputs go back through the shared segment
+    const output = result.output;
+    let kind = null;
+    let data = null;
+    if (output instanceof Uint8Array) {
+        kind = 'raw';
+        data = output;
+    } else if (output !== undefined && fs.existsSync(PAYLOAD_DIR)) {
+        const encoded = encode(output);
+        if (encoded.length >= LARGE_PAYLOAD_THRESHOLD) {
+            kind = 'encoded';
+            data = encoded;
+        }
+    }
+
+    if (data !== null) {
+        fs.writeFileSync(path.join(PAYLOAD_DIR, 'result.bin'), data);
+        delete result.output;
+        result.output_ref = { kind: kind, size: data.length };
+    }
+
+    fs.writeFileSync(RESULT_FILE, encode(result));
+}
+
 async function main() {
+    // Stop a handler waiting on async work once the budget runs out; the platform kills us just after
+    if (FUNCTION_TIMEOUT > 0) {
+        setTimeout(() => {
+            fs.writeFileSync(RESULT_FILE, encode({ error: 'Function execution timed out', status: 'timeout' }));
+            process.exit(1);
+        }, FUNCTION_TIMEOUT * 1000).unref();
+    }
+
     try {
         // Load function code
-        const functionCode = fs.readFileSync('/app/function.js', 'utf8');
+        const loadStart = Date.now();
+        const functionCode = fs.readFileSync('/function/source', 'utf8');
         
         // Load event data
-        const event = JSON.parse(fs.readFileSync('/app/event.json', 'utf8'));
+        const event = loadEvent();
         
         // Create a module from the function code
         const functionModule = new Function('exports', 'require', 'module', '__filename', '__dirname', functionCode);
@@ -130,6 +384,7 @@ async function main() {
         if (typeof module.exports.handler !== 'function') {
             throw new Error("Function must export a 'handler' function");
         }
+        const loadTime = (Date.now() - loadStart) / 1000;
         
         // Call the handler function with the event
         const startTime = Date.now();
@@ -137,16 +392,17 @@ async function main() {
         const executionTime = (Date.now() - startTime) / 1000;
         
         // Write the result to output file
-        fs.writeFileSync('/app/result.json', JSON.stringify({
+        writeResult({
             output: result,
             execution_time: executionTime,
+            phases: { runtime_start: RUNNER_STARTED_AT, load: loadTime },
             status: 'success'
-        }));
+        });
     } catch (error) {
-        fs.writeFileSync('/app/result.json', JSON.stringify({
+        fs.writeFileSync(RESULT_FILE, encode({
             error: error.message,
             traceback: error.stack,
-            status: 'error'
+            status: error instanceof BadRequestError ? 'bad_request' : 'error'
         }));
     }
 }
@@ -154,97 +410,396 @@ async function main() {
 main();
 """)
     
-    def build_base_images(self):
-        """Build base Docker images for Python and JavaScript functions"""
-        try:
-            # Build Python base image
-            python_path = self.templates_path / "python"
-            self.client.images.build(
-                path=str(python_path),
-                tag=self.python_image_name,
-                rm=True
-            )
-            
-            # Build JavaScript base image
-            js_path = self.templates_path / "javascript"
-            self.client.images.build(
-                path=str(js_path),
-                tag=self.javascript_image_name,
-                rm=True
-            )
-            
-            print("Base images built successfully")
-        except Exception as e:
-            print(f"Error building base images: {str(e)}")
-            raise
+        # Long-lived JavaScript runner with a compiled-handler cache
+        self._write_template(self.templates_path / "javascript" / "server.js", """
+const crypto = require('crypto');
+const fs = require('fs');
+const net = require('net');
+const path = require('path');
+const vm = require('vm');
+
+const SOCKET_PATH = '/runner/runner.sock';
+const FUNCTIONS_DIR = '/functions';
+const CODE_CACHE_DIR = '/code-cache';
+const MAX_HANDLERS = 64;
+
+let msgpack = null;
+
+function codecFor(name) {
+    if (name === 'msgpack') {
+        msgpack = msgpack || require('@msgpack/msgpack');
+        return {
+            encode: (obj) => Buffer.from(msgpack.encode(obj)),
+            decode: (buffer) => msgpack.decode(buffer)
+        };
+    }
+    return {
+        encode: (obj) => Buffer.from(JSON.stringify(obj === undefined ? null : obj), 'utf8'),
+        decode: (buffer) => JSON.parse(buffer.toString('utf8'))
+    };
+}
+
+// Compiled handlers by code hash; Map insertion order doubles as LRU order
+const handlers = new Map();
+
+function loadHandler(codeHash) {
+    let handler = handlers.get(codeHash);
+    if (handler) {
+        handlers.delete(codeHash);
+        handlers.set(codeHash, handler);
+        return handler;
+    }
+
+    const source = fs.readFileSync(path.join(FUNCTIONS_DIR, codeHash, 'source'), 'utf8');
+    const digest = crypto.createHash('sha256').update(source, 'utf8').digest('hex');
+    if (digest !== codeHash) {
+        throw new Error('Function source does not match its code hash');
+    }
+    // Cache files start with the hash of the source they were compiled from
+    const cacheFile = path.join(CODE_CACHE_DIR, codeHash + '.bin');
+    const header = Buffer.from(digest, 'latin1');
+    let cachedData;
+    try {
+        const cached = fs.readFileSync(cacheFile);
+        if (cached.length > header.length && cached.subarray(0, header.length).equals(header)) {
+            cachedData = cached.subarray(header.length);
+        }
+    } catch (error) {
+        cachedData = undefined;
+    }
+
+    // Wrap the code like a CommonJS module; V8's code cache skips reparsing after restarts
+    const script = new vm.Script(
+        '(function (exports, require, module, __filename, __dirname) {' + source + '\\n})',
+        { filename: '/app/function.js', cachedData: cachedData }
+    );
+    const module = { exports: {} };
+    script.runInThisContext()(module.exports, require, module, '/app/function.js', '/app');
+
+    if (typeof module.exports.handler !== 'function') {
+        throw new Error("Function must export a 'handler' function");
+    }
+
+    if (cachedData === undefined || script.cachedDataRejected) {
+        try {
+            // Written under a temporary name so a reader never sees half a file
+            const tmpFile = cacheFile + '.' + process.pid + '.tmp';
+            fs.writeFileSync(tmpFile, Buffer.concat([header, script.createCachedData()]));
+            fs.renameSync(tmpFile, cacheFile);
+        } catch (error) {
+            // The code cache is only an optimisation
+        }
+    }
+
+    handler = module.exports.handler;
+    handlers.set(codeHash, handler);
+    if (handlers.size > MAX_HANDLERS) {
+        handlers.delete(handlers.keys().next().value);
+    }
+    return handler;
+}
+
+function writeFrame(socket, meta, body) {
+    const metaBuffer = Buffer.from(JSON.stringify(meta), 'utf8');
+    const header = Buffer.alloc(8);
+    header.writeUInt32BE(metaBuffer.length, 0);
+    header.writeUInt32BE(body ? body.length : 0, 4);
+    socket.write(Buffer.concat(body ? [header, metaBuffer, body] : [header, metaBuffer]));
+}
+
+function usage() {
+    // CPU can't be attributed to one call while several run at once, so only report peak RSS
+    return { memory_peak: process.resourceUsage().maxRSS / 1024 };
+}
+
+async function invoke(socket, meta, body) {
+    const codec = codecFor(meta.codec);
+    try {
+        // A handler missing from the cache is a cold start for this call
+        const cached = handlers.has(meta.code_hash);
+        const loadStart = Date.now();
+        const handler = loadHandler(meta.code_hash);
+        const loadTime = (Date.now() - loadStart) / 1000;
+        let event;
+        try {
+            event = meta.kind === 'raw' ? body : codec.decode(body);
+        } catch (error) {
+            // The caller's event, not the function, is at fault
+            const message = 'Request body could not be decoded: ' + error.message;
+            writeFrame(socket, { id: meta.id, error: message, status: 'bad_request' });
+            return;
+        }
+
+        const startTime = Date.now();
+        const output = await handler(event);
+        const executionTime = (Date.now() - startTime) / 1000;
+
+        const reply = { id: meta.id, execution_time: executionTime, usage: usage(), status: 'success' };
+        if (!cached) {
+            reply.load_time = loadTime;
+        }
+        if (output instanceof Uint8Array) {
+            reply.kind = 'raw';
+            writeFrame(socket, reply, Buffer.from(output.buffer, output.byteOffset, output.byteLength));
+        } else {
+            reply.kind = 'encoded';
+            writeFrame(socket, reply, codec.encode(output));
+        }
+    } catch (error) {
+        writeFrame(socket, { id: meta.id, error: error.message, traceback: error.stack, status: 'error' });
+    }
+}
+
+function serve(socket) {
+    let pending = Buffer.alloc(0);
+    socket.on('data', (chunk) => {
+        pending = pending.length ? Buffer.concat([pending, chunk]) : chunk;
+        while (pending.length >= 8) {
+            const metaLength = pending.readUInt32BE(0);
+            const bodyLength = pending.readUInt32BE(4);
+            const frameLength = 8 + metaLength + bodyLength;
+            if (pending.length < frameLength) {
+                break;
+            }
+            const meta = JSON.parse(pending.toString('utf8', 8, 8 + metaLength));
+            const body = pending.subarray(8 + metaLength, frameLength);
+            pending = pending.subarray(frameLength);
+            // Not awaited: many async handlers run concurrently in this process
+            invoke(socket, meta, body);
+        }
+    });
+    socket.on('error', () => socket.destroy());
+}
+
+try {
+    fs.unlinkSync(SOCKET_PATH);
+} catch (error) {
+    // No stale socket to remove
+}
+net.createServer(serve).listen(SOCKET_PATH, () => fs.chmodSync(SOCKET_PATH, 0o777));
+""")
+    
+    def build_base_images(self, force=False):
+        """
+        Build base Docker images for Python and JavaScript functions on every healthy host.
+
+        Hosts that already have them from an earlier call are skipped unless
+        force is set, so this is safe to call again whenever a host comes back.
+        Only one worker on the node builds for a host; the others pick the
+        result up from the warm registry.
+        """
+        digest = self._templates_digest()
+        
+        def build(host):
+            if host.name in self.base_images_ready:
+                return
+            claim = self.registry.claim_image(host.name, "base", digest, force=force)
+            if claim == "building":
+                return
+            if claim == "build":
+                try:
+                    self._build_base_images_on(host.client)
+                except Exception:
+                    self.registry.abandon_image(host.name, "base")
+                    raise
+                self.registry.image_built(host.name, "base", digest)
+                print(f"Base images built on {host.name}")
+            self.base_images_ready.add(host.name)
+        
+        with self._build_lock:
+            if force:
+                self.base_images_ready.clear()
+            try:
+                self.scheduler.for_each_host(build)
+            except Exception as e:
+                print(f"Error building base images: {str(e)}")
+                raise
+
+    def _templates_digest(self):
+        """Hash of every base image template, so edited templates are rebuilt"""
+        digest = hashlib.sha256()
+        for path in sorted(self.templates_path.rglob("*")):
+            if path.is_file():
+                digest.update(str(path.relative_to(self.templates_path)).encode("utf-8"))
+                digest.update(path.read_bytes())
+        return digest.hexdigest()
+
+    def _build_base_images_on(self, client):
+        # Build Python base image
+        python_path = self.templates_path / "python"
+        client.images.build(
+            path=str(python_path),
+            tag=self.python_image_name,
+            labels={IMAGE_LABEL: "base"},
+            rm=True
+        )
+        
+        # Build JavaScript base image
+        js_path = self.templates_path / "javascript"
+        client.images.build(
+            path=str(js_path),
+            tag=self.javascript_image_name,
+            labels={IMAGE_LABEL: "base"},
+            rm=True
+        )
     
-    def run_function(self, function, event_data):
+    def run_function(self, function, event_data, codec=None, deadline=None):
         """Run a function in a Docker container"""
-        # Create a temporary directory to store function code and event data
-        temp_dir = tempfile.mkdtemp()
+        codec = resolve_codec(event_data, codec)
+        deadline = deadline or Deadline.for_function(function)
+        if function.language == "javascript" and JS_RUNNER_MODE == "persistent":
+            return self._run_persistent(function, event_data, codec, deadline)
+        # Create a temporary directory for event data and results; the code is mounted from the artifact store
+        temp_dir = tempfile.mkdtemp(prefix="serverless-func-")
+        # Shared-memory area for large inputs and outputs
+        stage = PayloadStage()
         try:
-            # Write function code to file
             if function.language == "python":
-                function_file = os.path.join(temp_dir, "function.py")
                 image_name = self.python_image_name
             elif function.language == "javascript":
-                function_file = os.path.join(temp_dir, "function.js")
                 image_name = self.javascript_image_name
             else:
                 raise ValueError(f"Unsupported language: {function.language}")
             
-            with open(function_file, "w") as f:
-                f.write(function.code)
-            
-            # Write event data to file
-            event_file = os.path.join(temp_dir, "event.json")
-            with open(event_file, "w") as f:
-                json.dump(event_data, f)
+            # The runner loads bytecode from the store when its interpreter has some there
+            compiled = function.language == "python" and \
+                bytecode_cache.artifact_path(function.code_hash, PYTHON_RUNNER_INTERPRETER).exists()
+            bytecode_file = os.path.join(temp_dir, f"function.{PYTHON_RUNNER_INTERPRETER}.bin")
             
-            # Create a unique container name
-            container_name = f"function-{function.id}-{str(uuid.uuid4())[:8]}"
+            # Write event data to file, staging large payloads in shared memory
+            event_file = os.path.join(temp_dir, f"event.{codec.name}")
+            with open(event_file, "wb") as f:
+                f.write(stage.stage_event(event_data, codec))
             
-            # Run the function in a Docker container
-            container = self.client.containers.run(
-                image=image_name,
-                name=container_name,
-                volumes={
-                    temp_dir: {"bind": "/app", "mode": "rw"}
-                },
-                mem_limit=f"{function.memory_limit}m",
-                detach=True
+            # Place the container on a warm or least-loaded healthy host, failing over on host errors
+            result = self.scheduler.run(
+                function.memory_limit,
+                lambda host: self._run_container(host.client, function, image_name, temp_dir, stage, codec, deadline),
+                key=self._affinity_key(function)
             )
             
-            # Wait for the container to complete or timeout
-            start_time = time.time()
-            status = None
-            while time.time() - start_time < function.timeout:
-                container.reload()
-                status = container.status
-                if status != "running":
-                    break
-                time.sleep(0.1)
-            
-            # If the container is still running after timeout, kill it
-            if status == "running":
-                container.kill()
-                container.remove()
-                return {"error": "Function execution timed out", "status": "timeout"}
-            
-            # Read the result
-            result_file = os.path.join(temp_dir, "result.json")
-            if os.path.exists(result_file):
-                with open(result_file, "r") as f:
-                    result = json.load(f)
-            else:
-                result = {"error": "Function execution failed", "status": "error"}
-            
-            # Clean up the container
-            container.remove()
+            # Keep the artifact the runner compiled on its first run
+            if function.language == "python" and not compiled and os.path.exists(bytecode_file):
+                with open(bytecode_file, "rb") as f:
+                    bytecode_cache.store(function.code_hash, PYTHON_RUNNER_INTERPRETER, f.read())
             
             return result
         except Exception as e:
             return {"error": str(e), "status": "error"}
         finally:
             # Clean up temporary directory
-            shutil.rmtree(temp_dir)
\ No newline at end of file
+            shutil.rmtree(temp_dir)
+            stage.cleanup()
+
+    def _affinity_key(self, function):
+        """Warm state belongs to a function version, so route by version"""
+        return f"function-{function.id}-{function.version}"
+
+    def _run_persistent(self, function, event_data, codec, deadline):
+        """Run a JavaScript function on a warm persistent runner"""
+        try:
+            return self.scheduler.run(
+                function.memory_limit,
+                lambda host: self.node_runners.run(host, function, event_data, codec, deadline),
+                key=self._affinity_key(function)
+            )
+        except Exception as e:
+            return {"error": str(e), "status": "error"}
+
+    def _run_container(self, client, function, image_name, temp_dir, stage, codec, deadline):
+        """Run a staged function on one Docker host and collect its result"""
+        # Host failover may have spent part of the budget already
+        if deadline.expired:
+            return {"error": "Function execution timed out", "status": "timeout"}
+        
+        # Create a unique container name
+        container_name = f"function-{function.id}-{str(uuid.uuid4())[:8]}"
+        
+        # Create and start the container separately so the cold start can be profiled
+        phases = {}
+        phase_start = time.time()
+        container_options = dict(
+            image=image_name,
+            name=container_name,
+            volumes={
+                temp_dir: {"bind": "/app", "mode": "rw"},
+                str(artifact_store.artifact_dir(function.code_hash)): {"bind": "/function", "mode": "ro"},
+                **stage.volume()
+            },
+            environment={
+                "LARGE_PAYLOAD_THRESHOLD": str(stage.threshold),
+                "EVENT_CODEC": codec.name,
+                "FUNCTION_TIMEOUT": str(deadline.remaining())
+            },
+            # Lets the reaper find the container if removing it below is skipped
+            labels=container_labels("function", function.id, deadline),
+            mem_limit=f"{function.memory_limit}m"
+        )
+        try:
+            container = client.containers.create(**container_options)
+        except docker.errors.ImageNotFound:
+            # A host added after startup builds the base images on first use
+            self._build_base_images_on(client)
+            phases["image"] = time.time() - phase_start
+            phase_start = time.time()
+            container = client.containers.create(**container_options)
+        phases["create"] = time.time() - phase_start
+        phase_start = time.time()
+        container.start()
+        started_at = time.time()
+        phases["start"] = started_at - phase_start
+        
+        # The deadline service kills the container the moment its budget runs out
+        kill = DEADLINES.schedule(deadline, lambda: self._kill(container))
+        
+        # Block until the container exits while its resource usage is sampled alongside
+        sampler = UsageSampler(container)
+        sampler.start(USAGE_SAMPLE_INTERVAL)
+        try:
+            # A daemon that can't stop the container in time raises here, which counts as a failed host
+            container.wait(timeout=deadline.remaining() + KILL_GRACE)
+        finally:
+            kill.cancel()
+            sampler.stop()
+        
+        if kill.fired:
+            container.remove(force=True)
+            return {
+                "error": "Function execution timed out",
+                "status": "timeout",
+                "usage": sampler.usage(),
+                "cold_start": True,
+                "phases": phases
+            }
+        
+        # Read the result
+        result_file = os.path.join(temp_dir, f"result.{codec.name}")
+        if os.path.exists(result_file):
+            with open(result_file, "rb") as f:
+                result = stage.resolve_result(codec.loads(f.read()), codec)
+        else:
+            result = {"error": "Function execution failed", "status": "error"}
+        result["usage"] = sampler.usage()
+        
+        # Every one-shot container is a cold start; the runner reports its own boot and load
+        runner_phases = result.pop("phases", {})
+        if "runtime_start" in runner_phases:
+            phases["boot"] = max(0.0, runner_phases["runtime_start"] - started_at)
+        if "load" in runner_phases:
+            phases["load"] = runner_phases["load"]
+        if "execution_time" in result:
+            phases["handler"] = result["execution_time"]
+        result["cold_start"] = True
+        result["phases"] = phases
+        
+        # Clean up the container
+        container.remove()
+        
+        return result
+
+    def _kill(self, container):
+        try:
+            container.kill()
+        except docker.errors.APIError:
+            # It exited on its own just before the deadline
+            pass
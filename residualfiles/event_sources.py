@@ -0,0 +1,307 @@
+# event_sources.py
+import json
+import os
+import threading
+import time
+from database import SessionLocal
+from reaper import INSTANCE
+
+EVENT_SOURCE_KINDS = ["ndjson", "queue_dir"]
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_BATCH_LATENCY = 1.0  # seconds the first event of a batch may wait
+POLL_INTERVAL = 0.2
+MAX_RETRY_DELAY = 60.0
+# Sources must live under this directory; queue directories have their files moved and deleted
+EVENT_SOURCE_ROOT = os.path.realpath(os.environ.get(
+    "EVENT_SOURCE_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "event-sources")
+))
+# Seconds a worker owns a source for after taking or renewing its lease
+EVENT_SOURCE_LEASE = float(os.environ.get("EVENT_SOURCE_LEASE", 30))
+FAILED_DIR = "failed"  # malformed queue files are moved here instead of deleted
+
+
+def within_root(path):
+    """Whether a source path resolves to somewhere under EVENT_SOURCE_ROOT"""
+    resolved = os.path.realpath(path)
+    return resolved != EVENT_SOURCE_ROOT and os.path.commonpath([resolved, EVENT_SOURCE_ROOT]) == EVENT_SOURCE_ROOT
+
+
+class NDJSONSource:
+    """Tails a newline-delimited JSON file from a checkpointed byte offset"""
+
+    def __init__(self, path, offset=0, inode=None):
+        self.path = path
+        self.offset = offset or 0
+        self.inode = inode
+
+    def read(self, limit):
+        """
+        Return up to limit (event, end offset) pairs past the checkpoint.
+
+        A trailing line without its newline is still being written and
+        is left for the next read.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        # The file was rotated or truncated; start over on the new one
+        if (self.inode is not None and stat.st_ino != self.inode) or stat.st_size < self.offset:
+            self.offset = 0
+        self.inode = stat.st_ino
+
+        events = []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            position = self.offset
+            while len(events) < limit:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                position += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    events.append((json.loads(line), position))
+                except ValueError:
+                    # Can never be delivered; skip it rather than block the stream
+                    events.append((None, position))
+        return events
+
+    def commit(self, events):
+        self.offset = events[-1][1]
+
+    def checkpoint(self):
+        return {"offset": self.offset, "inode": self.inode}
+
+
+class QueueDirSource:
+    """
+    Consumes one-event-per-file JSON messages from a directory in name order.
+
+    Producers should write to a dot-file or *.tmp and rename it into
+    place. Files are deleted once their batch is delivered, so the
+    directory itself is the checkpoint; files that aren't valid JSON are
+    moved to its failed/ subdirectory instead.
+    """
+
+    def __init__(self, path, offset=0, inode=None):
+        self.path = path
+        self.offset = offset or 0  # events delivered so far
+
+    def read(self, limit):
+        try:
+            names = sorted(
+                entry.name for entry in os.scandir(self.path)
+                if entry.is_file() and not entry.name.startswith(".") and not entry.name.endswith(".tmp")
+            )[:limit]
+        except FileNotFoundError:
+            return []
+
+        events = []
+        for name in names:
+            file_path = os.path.join(self.path, name)
+            try:
+                with open(file_path, "rb") as f:
+                    events.append((json.loads(f.read()), file_path))
+            except ValueError:
+                events.append((None, file_path))
+            except FileNotFoundError:
+                continue
+        return events
+
+    def commit(self, events):
+        failed_dir = os.path.join(self.path, FAILED_DIR)
+        for event, file_path in events:
+            try:
+                if event is None:
+                    os.makedirs(failed_dir, exist_ok=True)
+                    os.replace(file_path, os.path.join(failed_dir, os.path.basename(file_path)))
+                else:
+                    os.remove(file_path)
+            except FileNotFoundError:
+                pass
+        self.offset += len(events)
+
+    def checkpoint(self):
+        return {"offset": self.offset}
+
+
+class EventSourceConsumer:
+    """
+    Delivers one source's events to its function in micro-batches, at least once.
+
+    Every worker runs a consumer, but only the one holding the source's
+    lease reads from it; the others wait to take over if it lapses.
+    """
+
+    def __init__(self, source, backends, service_factory):
+        self.config = source
+        self.backends = backends
+        self.service_factory = service_factory
+        self.reader_class = NDJSONSource if source["kind"] == "ndjson" else QueueDirSource
+        self.reader = self.reader_class(source["path"], source.get("offset"), source.get("inode"))
+        self.lease_until = 0.0
+        self.stats = {"batches": 0, "events": 0, "malformed": 0, "failures": 0}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"event-source-{source['id']}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _hold_lease(self, extra=0.0):
+        """
+        Take or renew this worker's lease on the source, for extra seconds
+        beyond the usual term; False while another worker holds it
+        """
+        now = time.time()
+        if not extra and now < self.lease_until - EVENT_SOURCE_LEASE / 2:
+            return True
+        db = SessionLocal()
+        try:
+            checkpoint = self.service_factory(db).lease_event_source(self.config["id"], INSTANCE, EVENT_SOURCE_LEASE + extra)
+        finally:
+            db.close()
+        if checkpoint is None:
+            self.lease_until = 0.0
+            return False
+        if self.lease_until < now:
+            # Just taken over; the previous owner may have moved the checkpoint
+            self.reader = self.reader_class(self.config["path"], checkpoint["offset"], checkpoint["inode"])
+        self.lease_until = now + EVENT_SOURCE_LEASE + extra
+        return True
+
+    def _release_lease(self):
+        db = SessionLocal()
+        try:
+            self.service_factory(db).release_event_source(self.config["id"], INSTANCE)
+        finally:
+            db.close()
+
+    def _next_batch(self):
+        """Wait for batch_size events or until the first has waited batch_latency"""
+        batch_size = self.config["batch_size"]
+        first_seen = None
+        while not self._stop.is_set():
+            if not self._hold_lease():
+                return []
+            events = self.reader.read(batch_size)
+            if len(events) >= batch_size:
+                return events
+            if events and first_seen is None:
+                first_seen = time.time()
+            if events and time.time() - first_seen >= self.config["batch_latency"]:
+                return events
+            self._stop.wait(POLL_INTERVAL)
+        return []
+
+    def _loop(self):
+        if not within_root(self.config["path"]):
+            # Registered before sources were confined to the root; never touch it
+            self._save(last_error=f"path must be under {EVENT_SOURCE_ROOT}")
+            return
+        retry_delay = POLL_INTERVAL
+        while not self._stop.is_set():
+            if not self._hold_lease():
+                self._stop.wait(EVENT_SOURCE_LEASE / 2)
+                continue
+            events = self._next_batch()
+            if not events:
+                continue
+            # The same batch is re-read and retried until it is delivered
+            error = self._deliver([event for event, _ in events if event is not None])
+            if error is not None:
+                self.stats["failures"] += 1
+                self._save(last_error=error)
+                self._stop.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY)
+                continue
+
+            retry_delay = POLL_INTERVAL
+            self.reader.commit(events)
+            self.stats["batches"] += 1
+            self.stats["events"] += len(events)
+            self.stats["malformed"] += sum(1 for event, _ in events if event is None)
+            self._save(last_error=None, **self.reader.checkpoint())
+        if self.lease_until:
+            self._release_lease()
+
+    def _deliver(self, events):
+        """Invoke the function with one batch; returns an error message or None"""
+        if not events:
+            return None
+        db = SessionLocal()
+        try:
+            service = self.service_factory(db)
+            function = service.resolve_version(self.config["function_id"], self.config["alias"])
+            if function is None:
+                return "Function or alias not found"
+            # Cover the whole call, so no other worker takes the batch over while it runs
+            if not self._hold_lease(extra=function.timeout or 0):
+                return "Lease on the source was taken over by another worker"
+            start_time = time.time()
+            result = self.backends.run_function(function, {"source": self.config["id"], "events": events})
+            service.record_result(self.config["function_id"], time.time() - start_time, result)
+            return result.get("error")
+        except Exception as e:
+            return str(e)
+        finally:
+            db.close()
+
+    def _save(self, **fields):
+        db = SessionLocal()
+        try:
+            self.service_factory(db).update_event_source_state(self.config["id"], **fields)
+        finally:
+            db.close()
+
+    def get_stats(self):
+        return dict(self.stats, **self.reader.checkpoint())
+
+
+class EventSourceManager:
+    """Runs a consumer thread for every enabled event source"""
+
+    def __init__(self, backends, service_factory):
+        self.backends = backends
+        # Builds a FunctionService for a session; kept abstract to avoid an import cycle
+        self.service_factory = service_factory
+        self._consumers = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        db = SessionLocal()
+        try:
+            for source in self.service_factory(db).get_all_event_sources():
+                self.load(source)
+        finally:
+            db.close()
+
+    def load(self, source):
+        """(Re)start the consumer for a source from its dict form"""
+        self.remove(source["id"])
+        if not source["enabled"]:
+            return
+        consumer = EventSourceConsumer(source, self.backends, self.service_factory)
+        with self._lock:
+            self._consumers[source["id"]] = consumer
+        consumer.start()
+
+    def remove(self, source_id):
+        with self._lock:
+            consumer = self._consumers.pop(source_id, None)
+        if consumer is not None:
+            consumer.stop()
+
+    def stop(self):
+        with self._lock:
+            consumers, self._consumers = self._consumers, {}
+        for consumer in consumers.values():
+            consumer.stop()
+
+    def get_stats(self):
+        with self._lock:
+            return {source_id: consumer.get_stats() for source_id, consumer in self._consumers.items()}
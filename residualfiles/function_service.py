@@ -1,8 +1,31 @@
 # function_service.py
-from database import Function, FunctionExecution
+from database import Function, FunctionExecution, FunctionVersion, FunctionAlias, FunctionSchedule, EventSource, ExecutionRollup
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import case, func, or_
+from backends import BACKENDS, BAD_REQUEST, DEFAULT_BACKEND
+import artifact_store
+import bytecode_cache
+from resource_usage import percentile, recommend_limits
+from sketches import DDSketch
+from retention import EXECUTION_RAW_RETENTION
+from metrics import LATENCY, add_execution, empty_aggregate, fold, minute_of, summarize
+from workflow import plan
+from schedules import CronExpression, DEFAULT_JITTER, MISFIRE_POLICIES, OVERLAP_POLICIES
+from event_sources import DEFAULT_BATCH_LATENCY, DEFAULT_BATCH_SIZE, EVENT_SOURCE_KINDS, EVENT_SOURCE_ROOT, within_root
+from concurrent.futures import ThreadPoolExecutor
+import os
 import datetime
+import hashlib
+import json
+
+# Alias that plain invocations and updates use
+LIVE_ALIAS = "live"
+# Functions validated or compiled at once during a bulk deploy
+DEPLOY_CONCURRENCY = int(os.environ.get("DEPLOY_CONCURRENCY", 8))
+# Container memory limits in MB; Docker refuses anything under 6
+DEFAULT_MEMORY_LIMIT = 128
+DEFAULT_TIMEOUT = 30  # seconds
+MIN_MEMORY_LIMIT = 6
 
 class FunctionService:
     def __init__(self, db: Session, docker_manager):
@@ -11,32 +34,101 @@ class FunctionService:
     
     def create_function(self, function_data):
         """Create a new function in the database"""
-        # Validate required fields
-        required_fields = ["name", "route", "language", "code"]
-        for field in required_fields:
-            if field not in function_data:
-                raise ValueError(f"Missing required field: {field}")
-        
-        # Validate language
-        if function_data["language"] not in ["python", "javascript"]:
-            raise ValueError("Language must be either 'python' or 'javascript'")
-        
-        # Create function object
-        function = Function(
-            name=function_data["name"],
-            route=function_data["route"],
-            language=function_data["language"],
-            code=function_data["code"],
-            timeout=function_data.get("timeout", 30),
-            memory_limit=function_data.get("memory_limit", 128)
-        )
+        self._validate_function_data(function_data)
+        digest = self._prepare_code(function_data["code"], function_data["language"])
+        function = self._new_function(function_data, digest)
         
         self.db.add(function)
+        # Assign the function id, then publish the first version in the same transaction
+        self.db.flush()
+        self._point_alias(function.id, LIVE_ALIAS, self._publish_version(function).version)
         self.db.commit()
         self.db.refresh(function)
         
         return function
     
+    def create_functions(self, functions_data, concurrency=DEPLOY_CONCURRENCY):
+        """
+        Deploy many functions at once and return a status entry for each.
+
+        Definitions are validated concurrently; the valid ones are inserted,
+        versioned and aliased in a single transaction, then their artifacts
+        are compiled (and base images checked) concurrently. A definition
+        that fails validation is reported and doesn't stop the others.
+        """
+        results = [{"index": index, "name": data.get("name") if isinstance(data, dict) else None}
+                   for index, data in enumerate(functions_data)]
+        
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="deploy") as pool:
+            # Validate every definition; JavaScript checks spawn node, so this is worth spreading out
+            errors = list(pool.map(self._validation_error, functions_data))
+            valid = [index for index, error in enumerate(errors) if error is None]
+            # Rows only carry the code hash, so the source has to be stored before they are
+            digests = dict(zip(valid, pool.map(artifact_store.put, [functions_data[i]["code"] for i in valid])))
+            
+            # Names and routes must be unique across the batch and against what's deployed
+            names = {row.name for row in self.db.query(Function.name)
+                     .filter(Function.name.in_([functions_data[i]["name"] for i in valid]))}
+            routes = {row.route for row in self.db.query(Function.route)
+                      .filter(Function.route.in_([functions_data[i]["route"] for i in valid]))}
+            for index in valid:
+                data = functions_data[index]
+                if data["name"] in names:
+                    errors[index] = f"Function name already exists: {data['name']}"
+                elif data["route"] in routes:
+                    errors[index] = f"Function route already exists: {data['route']}"
+                names.add(data["name"])
+                routes.add(data["route"])
+            
+            # Insert the whole batch in one transaction
+            created = {}
+            for index, data in enumerate(functions_data):
+                if errors[index] is None:
+                    created[index] = self._new_function(data, digests[index])
+            self.db.add_all(created.values())
+            self.db.flush()
+            deployed = {}
+            for index, function in created.items():
+                version = self._publish_version(function).version
+                self._point_alias(function.id, LIVE_ALIAS, version)
+                deployed[index] = {"status": "created", "id": function.id, "route": function.route, "version": version}
+            self.db.commit()
+            
+            # Compile artifacts alongside a base image check for Docker-backed functions
+            images = None
+            docker_backed = {index for index in created if functions_data[index].get("backend", DEFAULT_BACKEND) == "docker"}
+            if self.docker_manager is not None and docker_backed:
+                images = pool.submit(self.docker_manager.build_base_images)
+            artifacts = {index: pool.submit(self._prepare_code, functions_data[index]["code"], functions_data[index]["language"])
+                         for index in created}
+            image_status, images_error = "pending", None
+            if images is not None:
+                try:
+                    images.result()
+                    # With no healthy host the images are left to be built on demand
+                    if self.docker_manager.base_images_ready:
+                        image_status = "ready"
+                except Exception as e:
+                    # Invocations build missing images on demand, so the functions are still usable
+                    image_status, images_error = "failed", str(e)
+            
+            for index, result in enumerate(results):
+                if errors[index] is not None:
+                    result.update(status="invalid", error=errors[index])
+                    continue
+                result.update(deployed[index])
+                try:
+                    artifacts[index].result()
+                    result["artifact"] = "ready"
+                except Exception as e:
+                    result["artifact"] = "failed"
+                    result["error"] = str(e)
+                if index in docker_backed:
+                    result["image"] = image_status
+                    if images_error:
+                        result["error"] = images_error
+        return results
+    
     def get_all_functions(self):
         """Get all functions from the database"""
         functions = self.db.query(Function).all()
@@ -49,6 +141,10 @@ class FunctionService:
             return self._function_to_dict(function)
         return None
     
+    def get_function_model(self, function_id):
+        """Get the Function model by ID, for execution"""
+        return self.db.query(Function).filter(Function.id == function_id).first()
+    
     def update_function(self, function_id, function_data):
         """Update a function"""
         function = self.db.query(Function).filter(Function.id == function_id).first()
@@ -64,15 +160,29 @@ class FunctionService:
             if function_data["language"] not in ["python", "javascript"]:
                 raise ValueError("Language must be either 'python' or 'javascript'")
             function.language = function_data["language"]
-        if "code" in function_data:
-            function.code = function_data["code"]
+        if "code" in function_data or "language" in function_data:
+            code = function_data["code"] if "code" in function_data else function.code
+            bytecode_cache.validate_code(code, function.language)
+            function.code_hash = self._prepare_code(code, function.language)
         if "timeout" in function_data:
-            function.timeout = function_data["timeout"]
+            function.timeout = self._validate_timeout(function_data["timeout"])
         if "memory_limit" in function_data:
-            function.memory_limit = function_data["memory_limit"]
+            function.memory_limit = self._validate_memory_limit(function_data["memory_limit"])
+        if "backend" in function_data:
+            if function_data["backend"] not in BACKENDS:
+                raise ValueError(f"Backend must be one of {BACKENDS}")
+            function.backend = function_data["backend"]
+        if "coalesce" in function_data:
+            function.coalesce = bool(function_data["coalesce"])
+        if "max_input_size" in function_data:
+            function.max_input_size = self._validate_input_size(function_data["max_input_size"])
         
         function.updated_at = datetime.datetime.utcnow()
         
+        # Publish the new definition and switch "live" to it atomically;
+        # calls already running keep the version they resolved
+        self._point_alias(function.id, LIVE_ALIAS, self._publish_version(function).version)
+        
         self.db.commit()
         self.db.refresh(function)
         
@@ -89,17 +199,604 @@ class FunctionService:
         
         return True
     
-    def record_execution(self, function_id, execution_time, status, error_message=None):
-        """Record a function execution"""
+    def get_versions(self, function_id):
+        """Get all versions of a function, newest first"""
+        versions = self.db.query(FunctionVersion) \
+            .filter(FunctionVersion.function_id == function_id) \
+            .order_by(FunctionVersion.created_at.desc()) \
+            .all()
+        return [self._version_to_dict(v) for v in versions]
+    
+    def get_aliases(self, function_id):
+        """Get the aliases of a function and the versions they point to"""
+        aliases = self.db.query(FunctionAlias).filter(FunctionAlias.function_id == function_id).all()
+        return {a.name: a.version for a in aliases}
+    
+    def set_alias(self, function_id, alias, version):
+        """Point an alias at an existing version"""
+        exists = self.db.query(FunctionVersion) \
+            .filter(FunctionVersion.function_id == function_id) \
+            .filter(FunctionVersion.version == version) \
+            .first()
+        if not exists:
+            raise ValueError(f"Version not found: {version}")
+        
+        self._point_alias(function_id, alias, version)
+        self.db.commit()
+        
+        return self.get_aliases(function_id)
+    
+    def resolve_version(self, function_id, alias=None, version=None):
+        """Get the version to execute, by explicit version or by alias (default "live")"""
+        if version is None:
+            pointer = self.db.query(FunctionAlias) \
+                .filter(FunctionAlias.function_id == function_id) \
+                .filter(FunctionAlias.name == (alias or LIVE_ALIAS)) \
+                .first()
+            if pointer is None:
+                # Functions created before versioning get their first version on demand
+                function = self.get_function_model(function_id)
+                if function is None or alias not in (None, LIVE_ALIAS):
+                    return None
+                published = self._publish_version(function)
+                self._point_alias(function_id, LIVE_ALIAS, published.version)
+                self.db.commit()
+                return published
+            version = pointer.version
+        
+        return self.db.query(FunctionVersion) \
+            .filter(FunctionVersion.function_id == function_id) \
+            .filter(FunctionVersion.version == version) \
+            .first()
+    
+    def resolve_workflow(self, definition):
+        """Validate a workflow and resolve the version each step runs"""
+        steps = definition.get("steps") or []
+        plan(steps)
+        if definition.get("output") is not None and definition["output"] not in {s["id"] for s in steps}:
+            raise ValueError(f"Unknown output step: {definition['output']}")
+        # The workflow's deadline is built from its timeout, like a function's
+        if definition.get("timeout") is not None:
+            self._validate_timeout(definition["timeout"])
+        
+        functions = {}
+        for step in steps:
+            version = self.resolve_version(step["function_id"], step.get("alias"), step.get("version"))
+            if version is None:
+                raise ValueError(f"Function or version not found for step {step['id']}")
+            functions[step["id"]] = version
+        
+        # A lazy publish commits and expires versions resolved before it; load
+        # them now so steps don't lazy-load through this session from other threads
+        for version in functions.values():
+            self.db.refresh(version)
+        return functions
+    
+    def create_schedule(self, function_id, schedule_data):
+        """Add a cron schedule to a function"""
+        if "cron" not in schedule_data:
+            raise ValueError("Missing required field: cron")
+        
+        schedule = FunctionSchedule(function_id=function_id)
+        self._apply_schedule_fields(schedule, schedule_data)
+        self.db.add(schedule)
+        self.db.commit()
+        self.db.refresh(schedule)
+        
+        return self._schedule_to_dict(schedule)
+    
+    def get_schedules(self, function_id):
+        """Get the schedules of a function"""
+        schedules = self.db.query(FunctionSchedule).filter(FunctionSchedule.function_id == function_id).all()
+        return [self._schedule_to_dict(s) for s in schedules]
+    
+    def get_all_schedules(self):
+        """Get every enabled schedule"""
+        schedules = self.db.query(FunctionSchedule).filter(FunctionSchedule.enabled == True).all()
+        return [self._schedule_to_dict(s) for s in schedules]
+    
+    def update_schedule(self, function_id, schedule_id, schedule_data):
+        """Change a schedule; its next run is recomputed"""
+        schedule = self._get_schedule(function_id, schedule_id)
+        if not schedule:
+            return None
+        
+        self._apply_schedule_fields(schedule, schedule_data)
+        schedule.next_run_at = None
+        self.db.commit()
+        self.db.refresh(schedule)
+        
+        return self._schedule_to_dict(schedule)
+    
+    def delete_schedule(self, function_id, schedule_id):
+        """Delete a schedule"""
+        schedule = self._get_schedule(function_id, schedule_id)
+        if not schedule:
+            return False
+        
+        self.db.delete(schedule)
+        self.db.commit()
+        
+        return True
+    
+    def update_schedule_state(self, schedule_id, **fields):
+        """Store bookkeeping (next_run_at, last_status, ...) from the schedule runner"""
+        self.db.query(FunctionSchedule).filter(FunctionSchedule.id == schedule_id).update(fields)
+        self.db.commit()
+    
+    def claim_schedule_run(self, schedule_id, expected, next_run_at):
+        """
+        Move a schedule's next_run_at from expected on to next_run_at; True
+        only for the one worker whose update did it
+        """
+        query = self.db.query(FunctionSchedule).filter(FunctionSchedule.id == schedule_id)
+        if expected is None:
+            query = query.filter(FunctionSchedule.next_run_at.is_(None))
+        else:
+            query = query.filter(FunctionSchedule.next_run_at == expected)
+        claimed = query.update({"next_run_at": next_run_at}, synchronize_session=False)
+        self.db.commit()
+        return claimed == 1
+    
+    def record_schedule_run(self, schedule_id, run_at, status, error_message=None):
+        """Record the outcome of a scheduled run"""
+        self.update_schedule_state(schedule_id, last_run_at=run_at, last_status=status, last_error=error_message)
+    
+    def create_event_source(self, function_id, source_data):
+        """Attach an NDJSON file or queue directory to a function"""
+        for field in ("kind", "path"):
+            if field not in source_data:
+                raise ValueError(f"Missing required field: {field}")
+        if source_data["kind"] not in EVENT_SOURCE_KINDS:
+            raise ValueError(f"kind must be one of {EVENT_SOURCE_KINDS}")
+        if not os.path.isabs(source_data["path"]):
+            raise ValueError("path must be absolute")
+        # Queue directories have their files deleted, so only paths set aside for sources are accepted
+        if not within_root(source_data["path"]):
+            raise ValueError(f"path must be under {EVENT_SOURCE_ROOT}")
+        
+        batch_size = int(source_data.get("batch_size", DEFAULT_BATCH_SIZE))
+        batch_latency = float(source_data.get("batch_latency", DEFAULT_BATCH_LATENCY))
+        if batch_size < 1 or batch_latency < 0:
+            raise ValueError("batch_size must be positive and batch_latency not negative")
+        
+        source = EventSource(
+            function_id=function_id,
+            kind=source_data["kind"],
+            path=source_data["path"],
+            alias=source_data.get("alias", LIVE_ALIAS),
+            batch_size=batch_size,
+            batch_latency=batch_latency,
+            enabled=source_data.get("enabled", True)
+        )
+        self.db.add(source)
+        self.db.commit()
+        self.db.refresh(source)
+        
+        return self._event_source_to_dict(source)
+    
+    def get_event_sources(self, function_id):
+        """Get the event sources of a function"""
+        sources = self.db.query(EventSource).filter(EventSource.function_id == function_id).all()
+        return [self._event_source_to_dict(s) for s in sources]
+    
+    def get_all_event_sources(self):
+        """Get every enabled event source"""
+        sources = self.db.query(EventSource).filter(EventSource.enabled == True).all()
+        return [self._event_source_to_dict(s) for s in sources]
+    
+    def delete_event_source(self, function_id, source_id):
+        """Delete an event source"""
+        source = self.db.query(EventSource) \
+            .filter(EventSource.function_id == function_id) \
+            .filter(EventSource.id == source_id) \
+            .first()
+        if not source:
+            return False
+        
+        self.db.delete(source)
+        self.db.commit()
+        
+        return True
+    
+    def update_event_source_state(self, source_id, **fields):
+        """Store a consumer's checkpoint and last error"""
+        self.db.query(EventSource).filter(EventSource.id == source_id).update(fields)
+        self.db.commit()
+    
+    def lease_event_source(self, source_id, owner, duration):
+        """
+        Take or renew a worker's lease on a source for duration seconds;
+        returns its checkpoint, or None while another worker holds it
+        """
+        now = datetime.datetime.utcnow()
+        # Conditional update, so exactly one worker wins a free or lapsed lease
+        claimed = self.db.query(EventSource) \
+            .filter(EventSource.id == source_id) \
+            .filter(or_(EventSource.owner.is_(None), EventSource.owner == owner, EventSource.lease_expires_at < now)) \
+            .update({"owner": owner, "lease_expires_at": now + datetime.timedelta(seconds=duration)},
+                    synchronize_session=False)
+        self.db.commit()
+        if not claimed:
+            return None
+        source = self.db.query(EventSource).filter(EventSource.id == source_id).first()
+        return {"offset": source.offset, "inode": source.inode}
+    
+    def release_event_source(self, source_id, owner):
+        """Give up a worker's lease so another can take over without waiting for it to lapse"""
+        self.db.query(EventSource) \
+            .filter(EventSource.id == source_id) \
+            .filter(EventSource.owner == owner) \
+            .update({"owner": None, "lease_expires_at": None}, synchronize_session=False)
+        self.db.commit()
+    
+    def _get_schedule(self, function_id, schedule_id):
+        return self.db.query(FunctionSchedule) \
+            .filter(FunctionSchedule.function_id == function_id) \
+            .filter(FunctionSchedule.id == schedule_id) \
+            .first()
+    
+    def _apply_schedule_fields(self, schedule, schedule_data):
+        """Validate and copy schedule fields"""
+        if "cron" in schedule_data:
+            # Rejects bad syntax and expressions that never fire
+            CronExpression(schedule_data["cron"]).next_after(datetime.datetime.utcnow())
+            schedule.cron = schedule_data["cron"]
+        if schedule_data.get("misfire_policy", "skip") not in MISFIRE_POLICIES:
+            raise ValueError(f"misfire_policy must be one of {MISFIRE_POLICIES}")
+        if schedule_data.get("overlap_policy", "skip") not in OVERLAP_POLICIES:
+            raise ValueError(f"overlap_policy must be one of {OVERLAP_POLICIES}")
+        if int(schedule_data.get("jitter", 0)) < 0:
+            raise ValueError("jitter must not be negative")
+        
+        for field in ("alias", "misfire_policy", "overlap_policy", "enabled"):
+            if field in schedule_data:
+                setattr(schedule, field, schedule_data[field])
+        if "jitter" in schedule_data:
+            schedule.jitter = int(schedule_data["jitter"])
+        elif schedule.jitter is None:
+            schedule.jitter = DEFAULT_JITTER
+        if "payload" in schedule_data:
+            schedule.payload = json.dumps(schedule_data["payload"])
+    
+    def _version_hash(self, function):
+        """Content hash of everything that affects how a function runs"""
+        definition = json.dumps({
+            "language": function.language,
+            "code": function.code,
+            "timeout": function.timeout,
+            "memory_limit": function.memory_limit,
+            "backend": function.backend
+        }, sort_keys=True)
+        return hashlib.sha256(definition.encode("utf-8")).hexdigest()[:16]
+    
+    def _publish_version(self, function):
+        """Snapshot the function's current definition, reusing an identical version"""
+        version_hash = self._version_hash(function)
+        version = self.db.query(FunctionVersion) \
+            .filter(FunctionVersion.function_id == function.id) \
+            .filter(FunctionVersion.version == version_hash) \
+            .first()
+        if version is None:
+            version = FunctionVersion(
+                function_id=function.id,
+                version=version_hash,
+                language=function.language,
+                code_hash=function.code_hash,
+                timeout=function.timeout,
+                memory_limit=function.memory_limit,
+                backend=function.backend
+            )
+            self.db.add(version)
+        return version
+    
+    def _point_alias(self, function_id, alias, version):
+        pointer = self.db.query(FunctionAlias) \
+            .filter(FunctionAlias.function_id == function_id) \
+            .filter(FunctionAlias.name == alias) \
+            .first()
+        if pointer is None:
+            self.db.add(FunctionAlias(function_id=function_id, name=alias, version=version))
+        else:
+            pointer.version = version
+    
+    def record_execution(self, function_id, execution_time, status, error_message=None, usage=None,
+                         cold_start=None, phases=None):
+        """Record a function execution, the resources it used and its cold-start profile"""
+        usage = usage or {}
         execution = FunctionExecution(
             function_id=function_id,
             execution_time=execution_time,
+            cpu_time=usage.get("cpu_time"),
+            memory_peak=usage.get("memory_peak"),
+            cold_start=cold_start,
+            startup_phases=json.dumps(phases) if phases else None,
             status=status,
             error_message=error_message
         )
         
         self.db.add(execution)
+        self.db.flush()
+        execution_id, executed_at = execution.id, execution.executed_at
+        self.db.commit()
+        # Feeds the latency sketches the metrics endpoints and rollups are built from
+        LATENCY.observe(function_id, execution_id, execution_time, status, cold_start, at=executed_at)
+    
+    def record_result(self, function_id, execution_time, result):
+        """Record an execution from a backend result dict"""
+        # An event that couldn't be decoded never reached the function
+        if result.get("status") == BAD_REQUEST:
+            return
+        self.record_execution(
+            function_id,
+            execution_time,
+            result.get("status", "error"),
+            result.get("error"),
+            result.get("usage"),
+            result.get("cold_start"),
+            result.get("phases")
+        )
+    
+    def get_cold_start_report(self, function_id, hours=24, bucket_minutes=60):
+        """Cold-start ratio and per-phase percentiles, overall and per time bucket"""
+        # Startup phases are only kept on raw executions, which retention prunes
+        if hours > EXECUTION_RAW_RETENTION:
+            raise ValueError(f"hours can't exceed the {EXECUTION_RAW_RETENTION:g}-hour raw execution retention")
+        since = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+        executions = self.db.query(FunctionExecution) \
+            .filter(FunctionExecution.function_id == function_id) \
+            .filter(FunctionExecution.executed_at >= since) \
+            .filter(FunctionExecution.cold_start.isnot(None)) \
+            .order_by(FunctionExecution.executed_at) \
+            .all()
+        
+        def summarize(group):
+            cold = [e for e in group if e.cold_start]
+            phases = {}
+            for execution in cold:
+                for phase, seconds in json.loads(execution.startup_phases or "{}").items():
+                    phases.setdefault(phase, []).append(seconds)
+            return {
+                "invocations": len(group),
+                "cold_starts": len(cold),
+                "cold_start_ratio": len(cold) / len(group) if group else 0.0,
+                "phases": {
+                    phase: {q: percentile(values, f) for q, f in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))}
+                    for phase, values in phases.items()
+                }
+            }
+        
+        # Group into fixed buckets counted from the start of the window
+        buckets = {}
+        bucket_size = datetime.timedelta(minutes=bucket_minutes)
+        for execution in executions:
+            index = int((execution.executed_at - since) / bucket_size)
+            buckets.setdefault(index, []).append(execution)
+        
+        report = summarize(executions)
+        report["window_hours"] = hours
+        report["buckets"] = [
+            dict(summarize(group), start=(since + index * bucket_size).isoformat())
+            for index, group in sorted(buckets.items())
+        ]
+        return report
+    
+    def get_resource_recommendation(self, function_id, sample_size=100):
+        """
+        Suggest memory_limit and timeout from recent successful executions;
+        resource usage is only kept on raw executions, so only those within
+        the raw retention window are sampled
+        """
+        function = self.get_function_model(function_id)
+        if not function:
+            return None
+        
+        since = datetime.datetime.utcnow() - datetime.timedelta(hours=EXECUTION_RAW_RETENTION)
+        executions = self.db.query(FunctionExecution) \
+            .filter(FunctionExecution.function_id == function_id) \
+            .filter(FunctionExecution.status == "success") \
+            .filter(FunctionExecution.executed_at >= since) \
+            .order_by(FunctionExecution.executed_at.desc()) \
+            .limit(sample_size) \
+            .all()
+        
+        recommendation = recommend_limits(
+            [e.memory_peak for e in executions if e.memory_peak],
+            [e.execution_time for e in executions if e.execution_time is not None],
+            function.memory_limit,
+            function.timeout
+        )
+        recommendation["window_hours"] = EXECUTION_RAW_RETENTION
+        return recommendation
+    
+    def apply_resource_recommendation(self, function_id, sample_size=100):
+        """Apply the recommended limits as a new version of the function"""
+        recommendation = self.get_resource_recommendation(function_id, sample_size)
+        if recommendation is None:
+            return None
+        
+        changes = {k: v for k, v in recommendation["recommended"].items() if v is not None}
+        if changes:
+            self.update_function(function_id, changes)
+        recommendation["applied"] = changes
+        
+        return recommendation
+    
+    def record_rollups(self, aggregates, execution_ids):
+        """
+        Merge per-minute aggregates, keyed by (function id, minute), into the
+        minute rollups and mark the executions they cover as rolled up
+        """
+        function_ids = {row.id for row in self.db.query(Function.id)}
+        for (function_id, minute), aggregate in aggregates.items():
+            ids = execution_ids[(function_id, minute)]
+            executions = self._claim_executions(
+                self.db.query(FunctionExecution)
+                .filter(FunctionExecution.id.in_(ids))
+                .filter(FunctionExecution.rolled_up == False)
+            )
+            # Retention already folded some of them in; count only the rest
+            if len(executions) < len(ids):
+                aggregate = empty_aggregate()
+                for execution in executions:
+                    add_execution(aggregate, execution.execution_time, execution.status, execution.cold_start)
+            # A function deleted since its executions were recorded has nowhere to keep them
+            if executions and function_id in function_ids:
+                self._merge_rollup(function_id, "minute", minute, aggregate)
+        self.db.commit()
+    
+    def compact_executions(self, older_than, batch_size):
+        """
+        Fold the oldest batch of executions before older_than that no flush
+        rolled up into the minute rollups; those recorded before the upgrade
+        or by a worker that stopped before its flush
+        """
+        executions = self._claim_executions(
+            self.db.query(FunctionExecution)
+            .filter(FunctionExecution.rolled_up == False)
+            .filter(FunctionExecution.executed_at < older_than)
+            .order_by(FunctionExecution.id)
+            .limit(batch_size)
+        )
+        if not executions:
+            return 0
+        
+        function_ids = {row.id for row in self.db.query(Function.id)}
+        buckets = {}
+        for execution in executions:
+            if execution.function_id in function_ids:
+                bucket = buckets.setdefault((execution.function_id, minute_of(execution.executed_at)), empty_aggregate())
+                add_execution(bucket, execution.execution_time, execution.status, execution.cold_start)
+        for (function_id, minute), bucket in buckets.items():
+            self._merge_rollup(function_id, "minute", minute, bucket)
+        self.db.commit()
+        return len(executions)
+    
+    def _claim_executions(self, query):
+        """Mark the executions a query selects as rolled up and return them"""
+        executions = query.all()
+        ids = [execution.id for execution in executions]
+        if ids:
+            marked = self.db.query(FunctionExecution) \
+                .filter(FunctionExecution.id.in_(ids)) \
+                .filter(FunctionExecution.rolled_up == False) \
+                .update({"rolled_up": True}, synchronize_session=False)
+            if marked != len(ids):
+                # Another worker rolled some of them up meanwhile; the caller retries later
+                raise ValueError("Executions were rolled up concurrently")
+        return executions
+    
+    def prune_executions(self, older_than, batch_size):
+        """
+        Delete the oldest batch of raw executions recorded before older_than
+        that are already counted in the minute rollups
+        """
+        ids = [row.id for row in self.db.query(FunctionExecution.id)
+               .filter(FunctionExecution.executed_at < older_than)
+               .filter(FunctionExecution.rolled_up == True)
+               .order_by(FunctionExecution.id)
+               .limit(batch_size)]
+        if not ids:
+            return 0
+        self.db.query(FunctionExecution).filter(FunctionExecution.id.in_(ids)).delete(synchronize_session=False)
+        self.db.commit()
+        return len(ids)
+    
+    def compact_rollups(self, older_than, batch_size):
+        """Fold the oldest batch of minute rollups before older_than into hourly ones"""
+        rollups = self.db.query(ExecutionRollup) \
+            .filter(ExecutionRollup.resolution == "minute") \
+            .filter(ExecutionRollup.bucket_start < older_than) \
+            .order_by(ExecutionRollup.id) \
+            .limit(batch_size) \
+            .all()
+        if not rollups:
+            return 0
+        
+        buckets = {}
+        for rollup in rollups:
+            start = rollup.bucket_start.replace(minute=0)
+            fold(buckets.setdefault((rollup.function_id, start), empty_aggregate()), self._rollup_values(rollup))
+        
+        for (function_id, start), bucket in buckets.items():
+            self._merge_rollup(function_id, "hour", start, bucket)
+        for rollup in rollups:
+            self.db.delete(rollup)
+        self.db.commit()
+        return len(rollups)
+    
+    def expire_rollups(self, older_than, batch_size):
+        """Delete a batch of hourly rollups before older_than"""
+        ids = [row.id for row in self.db.query(ExecutionRollup.id)
+               .filter(ExecutionRollup.resolution == "hour")
+               .filter(ExecutionRollup.bucket_start < older_than)
+               .order_by(ExecutionRollup.id)
+               .limit(batch_size)]
+        if not ids:
+            return 0
+        self.db.query(ExecutionRollup).filter(ExecutionRollup.id.in_(ids)).delete(synchronize_session=False)
         self.db.commit()
+        return len(ids)
+    
+    def _rollup_values(self, rollup):
+        return {
+            "count": rollup.count,
+            "errors": rollup.errors,
+            "cold_starts": rollup.cold_starts,
+            "latency_sum": rollup.latency_sum,
+            "latency_max": rollup.latency_max,
+            "sketch": DDSketch.from_dict(json.loads(rollup.sketch)) if rollup.sketch else DDSketch()
+        }
+    
+    def _merge_rollup(self, function_id, resolution, bucket_start, values):
+        """Add aggregated values to a rollup bucket, creating it if needed"""
+        rollup = self.db.query(ExecutionRollup) \
+            .filter(ExecutionRollup.function_id == function_id) \
+            .filter(ExecutionRollup.resolution == resolution) \
+            .filter(ExecutionRollup.bucket_start == bucket_start) \
+            .first()
+        if rollup is None:
+            rollup = ExecutionRollup(function_id=function_id, resolution=resolution, bucket_start=bucket_start)
+            self.db.add(rollup)
+            merged = values
+        else:
+            merged = fold(self._rollup_values(rollup), values)
+        rollup.count = merged["count"]
+        rollup.errors = merged["errors"]
+        rollup.cold_starts = merged["cold_starts"]
+        rollup.latency_sum = merged["latency_sum"]
+        rollup.latency_max = merged["latency_max"]
+        rollup.sketch = json.dumps(merged["sketch"].to_dict())
+    
+    def get_latency_metrics(self, function_id, window_minutes=60, quantiles=(0.5, 0.95, 0.99)):
+        """
+        Execution counts, average and latency quantiles over the last
+        window_minutes, merged from rollup sketches rather than executions
+        """
+        if not self.get_function_model(function_id):
+            return None
+        since = (datetime.datetime.utcnow() - datetime.timedelta(minutes=window_minutes)) \
+            .replace(second=0, microsecond=0)
+        rollups = self.db.query(ExecutionRollup) \
+            .filter(ExecutionRollup.function_id == function_id) \
+            .filter(ExecutionRollup.bucket_start >= since) \
+            .all()
+        # Executions from the last flush interval or so are not in the rollups yet
+        unrolled = self.db.query(FunctionExecution) \
+            .filter(FunctionExecution.function_id == function_id) \
+            .filter(FunctionExecution.rolled_up == False) \
+            .filter(FunctionExecution.executed_at >= since) \
+            .all()
+        
+        total = empty_aggregate()
+        for rollup in rollups:
+            fold(total, self._rollup_values(rollup))
+        for execution in unrolled:
+            add_execution(total, execution.execution_time, execution.status, execution.cold_start)
+        metrics = summarize(total, quantiles)
+        metrics["function_id"] = function_id
+        metrics["window_minutes"] = window_minutes
+        return metrics
     
     def get_execution_stats(self):
         """Get execution statistics for all functions"""
@@ -107,21 +804,28 @@ class FunctionService:
         stats = []
         
         for function in functions:
+            # Every execution is either in the rollups or still marked as not rolled up
+            rolled_count, rolled_errors, rolled_latency = self.db.query(
+                func.coalesce(func.sum(ExecutionRollup.count), 0),
+                func.coalesce(func.sum(ExecutionRollup.errors), 0),
+                func.coalesce(func.sum(ExecutionRollup.latency_sum), 0.0)
+            ).filter(ExecutionRollup.function_id == function.id).one()
+            raw_count, raw_errors, raw_latency = self.db.query(
+                func.count(FunctionExecution.id),
+                func.coalesce(func.sum(case((FunctionExecution.status != "success", 1), else_=0)), 0),
+                func.coalesce(func.sum(FunctionExecution.execution_time), 0.0)
+            ).filter(FunctionExecution.function_id == function.id) \
+                .filter(FunctionExecution.rolled_up == False).one()
+            
             # Get total executions
-            total_executions = self.db.query(func.count(FunctionExecution.id)) \
-                .filter(FunctionExecution.function_id == function.id) \
-                .scalar() or 0
+            total_executions = rolled_count + raw_count
             
             # Get successful executions
-            successful_executions = self.db.query(func.count(FunctionExecution.id)) \
-                .filter(FunctionExecution.function_id == function.id) \
-                .filter(FunctionExecution.status == "success") \
-                .scalar() or 0
+            successful_executions = total_executions - rolled_errors - raw_errors
             
             # Get average execution time
-            avg_execution_time = self.db.query(func.avg(FunctionExecution.execution_time)) \
-                .filter(FunctionExecution.function_id == function.id) \
-                .scalar() or 0
+            total_latency = rolled_latency + raw_latency
+            avg_execution_time = total_latency / total_executions if total_executions else 0
             
             # Get recent executions
             recent_executions = self.db.query(FunctionExecution) \
@@ -149,6 +853,127 @@ class FunctionService:
         
         return stats
     
+    def _validate_function_data(self, function_data):
+        """Raise ValueError if a function definition can't be deployed"""
+        # Validate required fields
+        required_fields = ["name", "route", "language", "code"]
+        for field in required_fields:
+            if field not in function_data:
+                raise ValueError(f"Missing required field: {field}")
+            if not isinstance(function_data[field], str):
+                raise ValueError(f"Field must be a string: {field}")
+        
+        # Validate language
+        if function_data["language"] not in ["python", "javascript"]:
+            raise ValueError("Language must be either 'python' or 'javascript'")
+        
+        # Validate execution backend
+        if function_data.get("backend", DEFAULT_BACKEND) not in BACKENDS:
+            raise ValueError(f"Backend must be one of {BACKENDS}")
+        
+        self._validate_timeout(function_data.get("timeout", DEFAULT_TIMEOUT))
+        self._validate_memory_limit(function_data.get("memory_limit", DEFAULT_MEMORY_LIMIT))
+        self._validate_input_size(function_data.get("max_input_size"))
+        # Reject code that can't load before it reaches a container
+        bytecode_cache.validate_code(function_data["code"], function_data["language"])
+    
+    def _validation_error(self, function_data):
+        """Why a definition in a bulk deploy is invalid, or None"""
+        if not isinstance(function_data, dict):
+            return "Function definition must be an object"
+        try:
+            self._validate_function_data(function_data)
+        except (ValueError, TypeError) as e:
+            # Reported against this definition only, so the rest of the batch still deploys
+            return str(e)
+        return None
+    
+    def _new_function(self, function_data, digest):
+        return Function(
+            name=function_data["name"],
+            route=function_data["route"],
+            language=function_data["language"],
+            code_hash=digest,
+            timeout=function_data.get("timeout", DEFAULT_TIMEOUT),
+            memory_limit=function_data.get("memory_limit", DEFAULT_MEMORY_LIMIT),
+            backend=function_data.get("backend", DEFAULT_BACKEND),
+            coalesce=bool(function_data.get("coalesce", False)),
+            max_input_size=self._validate_input_size(function_data.get("max_input_size"))
+        )
+    
+    def _prepare_code(self, code, language):
+        """Store code in the artifact store, compile Python for this interpreter, and return the code hash"""
+        digest = artifact_store.put(code)
+        if language == "python":
+            bytecode_cache.precompile(code)
+        return digest
+    
+    def _validate_timeout(self, timeout):
+        """A timeout must be a positive number of seconds; every invocation's deadline is built from it"""
+        if not isinstance(timeout, (int, float)) or isinstance(timeout, bool) or not timeout > 0:
+            raise ValueError("timeout must be a positive number of seconds")
+        return timeout
+    
+    def _validate_memory_limit(self, memory_limit):
+        """A memory limit must be a whole number of MB that Docker accepts"""
+        if not isinstance(memory_limit, int) or isinstance(memory_limit, bool) or memory_limit < MIN_MEMORY_LIMIT:
+            raise ValueError(f"memory_limit must be a whole number of MB, at least {MIN_MEMORY_LIMIT}")
+        return memory_limit
+    
+    def _validate_input_size(self, max_input_size):
+        """A per-function input limit must be a positive byte count, or None for the default"""
+        if max_input_size is None:
+            return None
+        if not isinstance(max_input_size, int) or isinstance(max_input_size, bool) or max_input_size <= 0:
+            raise ValueError("max_input_size must be a positive number of bytes")
+        return max_input_size
+    
+    def _version_to_dict(self, version):
+        """Convert FunctionVersion model to dictionary"""
+        return {
+            "version": version.version,
+            "language": version.language,
+            "code_hash": version.code_hash,
+            "timeout": version.timeout,
+            "memory_limit": version.memory_limit,
+            "backend": version.backend,
+            "created_at": version.created_at.isoformat()
+        }
+    
+    def _schedule_to_dict(self, schedule):
+        """Convert FunctionSchedule model to dictionary"""
+        return {
+            "id": schedule.id,
+            "function_id": schedule.function_id,
+            "cron": schedule.cron,
+            "alias": schedule.alias or LIVE_ALIAS,
+            "payload": schedule.payload,
+            "jitter": schedule.jitter,
+            "misfire_policy": schedule.misfire_policy or "skip",
+            "overlap_policy": schedule.overlap_policy or "skip",
+            "enabled": schedule.enabled if schedule.enabled is not None else True,
+            "next_run_at": schedule.next_run_at.isoformat() if schedule.next_run_at else None,
+            "last_run_at": schedule.last_run_at.isoformat() if schedule.last_run_at else None,
+            "last_status": schedule.last_status,
+            "last_error": schedule.last_error
+        }
+    
+    def _event_source_to_dict(self, source):
+        """Convert EventSource model to dictionary"""
+        return {
+            "id": source.id,
+            "function_id": source.function_id,
+            "kind": source.kind,
+            "path": source.path,
+            "alias": source.alias or LIVE_ALIAS,
+            "batch_size": source.batch_size,
+            "batch_latency": source.batch_latency,
+            "enabled": source.enabled if source.enabled is not None else True,
+            "offset": source.offset,
+            "inode": source.inode,
+            "last_error": source.last_error
+        }
+    
     def _function_to_dict(self, function):
         """Convert Function model to dictionary"""
         return {
@@ -158,6 +983,9 @@ class FunctionService:
             "language": function.language,
             "timeout": function.timeout,
             "memory_limit": function.memory_limit,
+            "backend": function.backend,
+            "coalesce": bool(function.coalesce),
+            "max_input_size": function.max_input_size,
             "created_at": function.created_at.isoformat(),
             "updated_at": function.updated_at.isoformat()
         }
\ No newline at end of file
@@ -0,0 +1,125 @@
+# metrics.py
+import datetime
+import os
+import threading
+from database import SessionLocal
+from sketches import DDSketch
+
+# How often in-memory aggregates are written to the minute rollups, in seconds
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 10))
+
+
+def empty_aggregate():
+    """Execution counters and a latency sketch for one function and time bucket"""
+    return {"count": 0, "errors": 0, "cold_starts": 0, "latency_sum": 0.0, "latency_max": 0.0, "sketch": DDSketch()}
+
+
+def add_execution(aggregate, execution_time, status, cold_start=None):
+    """Count one execution into an aggregate"""
+    latency = execution_time or 0.0
+    aggregate["count"] += 1
+    aggregate["errors"] += status != "success"
+    aggregate["cold_starts"] += bool(cold_start)
+    aggregate["latency_sum"] += latency
+    aggregate["latency_max"] = max(aggregate["latency_max"], latency)
+    aggregate["sketch"].add(latency)
+    return aggregate
+
+
+def fold(into, values):
+    """Add one aggregate into another"""
+    for field in ("count", "errors", "cold_starts", "latency_sum"):
+        into[field] += values[field]
+    into["latency_max"] = max(into["latency_max"], values["latency_max"])
+    into["sketch"].merge(values["sketch"])
+    return into
+
+
+def minute_of(moment):
+    """Start of the minute rollup bucket a moment falls in"""
+    return moment.replace(second=0, microsecond=0)
+
+
+def summarize(aggregate, quantiles):
+    """Counts, average and the requested latency quantiles of an aggregate"""
+    count = aggregate["count"]
+    return {
+        "count": count,
+        "errors": aggregate["errors"],
+        "error_rate": aggregate["errors"] / count if count else 0.0,
+        "cold_starts": aggregate["cold_starts"],
+        "average_execution_time": aggregate["latency_sum"] / count if count else None,
+        "max_execution_time": aggregate["latency_max"] if count else None,
+        "quantiles": {f"p{q * 100:g}": aggregate["sketch"].quantile(q) for q in quantiles}
+    }
+
+
+class LatencyTracker:
+    """
+    Per-function latency sketches updated on every recorded execution.
+
+    Executions are folded into per-minute aggregates in memory and
+    flushed to the minute rollups every interval, where they merge with
+    other workers' flushes. Each flush marks the executions it covers as
+    rolled up in the same transaction, so executions a worker never
+    flushed stay visible to retention, which folds them in itself.
+    """
+
+    def __init__(self, interval=METRICS_FLUSH_INTERVAL):
+        self.interval = interval
+        self._pending = {}  # (function id, minute) -> aggregate not yet flushed
+        self._execution_ids = {}  # (function id, minute) -> executions in that aggregate
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.service_factory = None
+
+    def observe(self, function_id, execution_id, execution_time, status, cold_start=None, at=None):
+        key = (function_id, minute_of(at or datetime.datetime.utcnow()))
+        with self._lock:
+            add_execution(self._pending.setdefault(key, empty_aggregate()), execution_time, status, cold_start)
+            self._execution_ids.setdefault(key, []).append(execution_id)
+
+    def start(self, service_factory):
+        # Builds a FunctionService for a session; kept abstract to avoid an import cycle
+        self.service_factory = service_factory
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="metrics-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Metrics flush failed: {str(e)}")
+
+    def flush(self):
+        """Write pending aggregates to the minute rollups; kept for the next flush if that fails"""
+        if self.service_factory is None:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            execution_ids, self._execution_ids = self._execution_ids, {}
+        if not pending:
+            return
+        db = SessionLocal()
+        try:
+            self.service_factory(db).record_rollups(pending, execution_ids)
+        except Exception:
+            db.rollback()
+            with self._lock:
+                for key, aggregate in pending.items():
+                    fold(self._pending.setdefault(key, empty_aggregate()), aggregate)
+                    self._execution_ids.setdefault(key, []).extend(execution_ids[key])
+            raise
+        finally:
+            db.close()
+
+
+# Shared by everything that records executions in the process
+LATENCY = LatencyTracker()
@@ -0,0 +1,443 @@
+# node_runner.py
+import itertools
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+import artifact_store
+from backends import decode_reply, encode_event
+from deadlines import DEADLINES
+from reaper import container_labels
+from sandbox_worker import read_frame, write_frame
+from warm_registry import WarmRegistry
+
+# Host directories shared with persistent runner containers
+NODE_RUNNER_DIR = os.path.join(tempfile.gettempdir(), "serverless-node")
+CODE_CACHE_DIR = os.path.join(NODE_RUNNER_DIR, "code-cache")  # V8 code cache per function, survives restarts
+SOCKETS_DIR = os.path.join(NODE_RUNNER_DIR, "sockets")
+# How often a worker looks for runners that no worker on the node is using, in seconds
+SHARED_SWEEP_INTERVAL = 10.0
+# Keep-alive policy for idle runners: frozen after RUNNER_PAUSE_AFTER idle seconds
+# (0 disables pausing), removed after RUNNER_IDLE_TIMEOUT
+RUNNER_PAUSE_AFTER = float(os.environ.get("RUNNER_PAUSE_AFTER", 30))
+RUNNER_IDLE_TIMEOUT = float(os.environ.get("RUNNER_IDLE_TIMEOUT", 300))
+# MB of memory limits the runners on one host may hold while warm
+WARM_MEMORY_BUDGET = float(os.environ.get("WARM_MEMORY_BUDGET", 2048))
+
+
+class PersistentNodeRunner:
+    """
+    A long-lived Node container serving concurrent invocations over a unix socket.
+
+    With attach_to, a registry record of a runner another worker started,
+    this only opens a connection to that container instead of starting one.
+    """
+
+    def __init__(self, client, image_name, function, max_concurrency=16, startup_timeout=10.0, attach_to=None):
+        self.client = client
+        self.memory_limit = function.memory_limit
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.in_flight = 0
+        self.hits = 0  # warm calls not yet reported to the registry
+        self.last_used = time.time()
+        self.alive = True
+        self.draining = False  # a call overran; takes no new calls and is recycled once drained
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.sock = None
+        # Startup profile, handed to the first call this runner serves
+        self.startup_phases = {}
+
+        if attach_to is not None:
+            self.socket_dir = attach_to["socket_dir"]
+            self.container_id = attach_to["container_id"]
+            self.container = None
+            # Already warm; nothing for a call to count as a cold start
+            self.startup_phases = None
+            try:
+                self._connect(os.path.join(self.socket_dir, "runner.sock"), 1.0)
+            except Exception:
+                self.disconnect()
+                raise
+            self._start_reader()
+            return
+
+        self.socket_dir = tempfile.mkdtemp(prefix="runner-", dir=SOCKETS_DIR)
+        os.chmod(self.socket_dir, 0o777)
+        # A runner can only write to its own function's code cache
+        code_cache_dir = os.path.join(CODE_CACHE_DIR, str(function.id))
+        os.makedirs(code_cache_dir, exist_ok=True)
+        os.chmod(code_cache_dir, 0o777)
+        phase_start = time.time()
+        self.container = client.containers.create(
+            image=image_name,
+            command=["node", "/opt/runtime/server.js"],
+            name=f"node-runner-{function.id}-{str(uuid.uuid4())[:8]}",
+            volumes={
+                self.socket_dir: {"bind": "/runner", "mode": "rw"},
+                # Only the source this runner serves, under its code hash
+                str(artifact_store.artifact_dir(function.code_hash)): {
+                    "bind": f"/functions/{function.code_hash}", "mode": "ro"
+                },
+                code_cache_dir: {"bind": "/code-cache", "mode": "rw"}
+            },
+            labels=container_labels("runner", function.id),
+            mem_limit=f"{function.memory_limit}m"
+        )
+        self.container_id = self.container.id
+        self.startup_phases["create"] = time.time() - phase_start
+
+        try:
+            phase_start = time.time()
+            self.container.start()
+            self.startup_phases["start"] = time.time() - phase_start
+            phase_start = time.time()
+            self._connect(os.path.join(self.socket_dir, "runner.sock"), startup_timeout)
+            self.startup_phases["boot"] = time.time() - phase_start
+        except Exception:
+            self.close()
+            raise
+        self._start_reader()
+
+    def _start_reader(self):
+        self.reader = self.sock.makefile("rb")
+        self.writer = self.sock.makefile("wb")
+        threading.Thread(target=self._read_replies, daemon=True).start()
+
+    def _connect(self, socket_path, timeout):
+        deadline = time.time() + timeout
+        while True:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                self.sock.connect(socket_path)
+                return
+            except OSError:
+                self.sock.close()
+                if time.time() > deadline:
+                    raise RuntimeError("Node runner did not start in time")
+                time.sleep(0.01)
+
+    def _read_replies(self):
+        """Hand each reply to the call waiting on its id"""
+        while True:
+            try:
+                reply, data = read_frame(self.reader)
+            except (OSError, ValueError):
+                reply = None
+            if reply is None:
+                break
+            with self._lock:
+                slot = self._pending.pop(reply.get("id"), None)
+            if slot is not None:
+                slot["reply"], slot["data"] = reply, data
+                slot["done"].set()
+
+        # The runner went away; fail everything still waiting on it
+        self.alive = False
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for slot in pending.values():
+            slot["reply"] = {"error": "Node runner exited", "status": "error"}
+            slot["done"].set()
+
+    def _expire(self, call_id):
+        """Fail a call whose deadline passed"""
+        with self._lock:
+            slot = self._pending.pop(call_id, None)
+        if slot is None:
+            return
+        slot["reply"] = {"error": "Function execution timed out", "status": "timeout"}
+        slot["done"].set()
+        # A runaway handler can't be cancelled inside Node; the pool recycles the runner
+        # once the calls other invocations have on it are done
+        self.draining = True
+
+    def call(self, meta, body, deadline):
+        """Send one invocation and wait for its reply or its deadline"""
+        call_id = next(self._ids)
+        slot = {"done": threading.Event(), "reply": None, "data": None}
+        with self._lock:
+            self._pending[call_id] = slot
+            try:
+                write_frame(self.writer, dict(meta, id=call_id), body)
+            except OSError:
+                self._pending.pop(call_id, None)
+                self.alive = False
+                return {"error": "Node runner is not reachable", "status": "error"}, None
+
+        expiry = DEADLINES.schedule(deadline, lambda: self._expire(call_id))
+        slot["done"].wait()
+        expiry.cancel()
+        return slot["reply"], slot["data"]
+
+    def disconnect(self):
+        """Drop this worker's connection and leave the container to the others"""
+        self.alive = False
+        if self.sock is not None:
+            self.sock.close()
+
+    def close(self):
+        """Stop the container for every worker using it"""
+        self.disconnect()
+        stop_runner(self.client, self.container_id, self.socket_dir)
+
+
+def stop_runner(client, container_id, socket_dir):
+    try:
+        client.containers.get(container_id).remove(force=True)
+    except Exception:
+        pass
+    shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+def pause_runner(client, container_id):
+    """Freeze a runner's processes with the cgroup freezer; memory stays, CPU drops to zero"""
+    client.containers.get(container_id).pause()
+
+
+def unpause_runner(client, container_id):
+    client.containers.get(container_id).unpause()
+
+
+class NodeRunnerPool:
+    """
+    Keeps one persistent Node runner per function version and host.
+
+    A runner only sees its own function's source, so a code update
+    starts a new runner and the old one idles out; V8 code cache files
+    in the function's directory under CODE_CACHE_DIR let restarted
+    runners skip reparsing. The runner is
+    shared by every API worker on the node through the warm registry:
+    the first worker to need it starts it, the others connect to it.
+
+    Idle runners move from running to paused after pause_after seconds
+    and are removed after idle_timeout. The next call unpauses a paused
+    runner, which takes milliseconds instead of a cold start. A runner
+    left running a call that overran its deadline is retired: no worker
+    sends it new calls, and it is stopped once the calls already on it
+    are done. Starting a
+    runner that would overrun a host's memory_budget first evicts idle
+    runners by GreedyDual priority, so frequently used functions that
+    are slow to start and small are kept warm the longest.
+    """
+
+    def __init__(self, image_name, max_concurrency=16, idle_timeout=RUNNER_IDLE_TIMEOUT,
+                 pause_after=RUNNER_PAUSE_AFTER, memory_budget=WARM_MEMORY_BUDGET, registry=None):
+        self.image_name = image_name
+        self.max_concurrency = max_concurrency
+        self.idle_timeout = idle_timeout
+        self.memory_budget = memory_budget
+        self.pause_after = pause_after if pause_after and pause_after < idle_timeout else None
+        self.registry = registry or WarmRegistry()
+        self._runners = {}  # (host name, function id, memory limit, code hash) -> this worker's connection
+        self._retiring = []  # (key, connection) to retiring runners with calls still on them
+        self._hosts = {}  # host name -> host, for pausing and stopping runners nobody uses
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._keep_alive = None
+        os.makedirs(artifact_store.ARTIFACT_DIR, exist_ok=True)
+        for path in (CODE_CACHE_DIR, SOCKETS_DIR):
+            os.makedirs(path, exist_ok=True)
+            os.chmod(path, 0o777)
+
+    @staticmethod
+    def _registry_key(key):
+        return "/".join(str(part) for part in key)
+
+    def _sweep(self):
+        """
+        Drop dead connections, and return the lease of idle ones so the
+        runner can be paused; caller holds the lock
+        """
+        now = time.time()
+        idle_after = self.pause_after or self.idle_timeout
+        for key, runner in list(self._runners.items()):
+            if not runner.alive:
+                del self._runners[key]
+                self.registry.remove_runner(self._registry_key(key), runner.container_id)
+                runner.close()
+            elif runner.draining:
+                # New calls go to a replacement; this one is stopped once every worker has let go of it
+                del self._runners[key]
+                self.registry.retire_runner(self._registry_key(key), runner.container_id)
+                self._retiring.append((key, runner))
+            elif runner.in_flight == 0 and now - runner.last_used > idle_after:
+                del self._runners[key]
+                runner.disconnect()
+                self._report_hits(key, runner)
+                self.registry.release_runner(self._registry_key(key), runner.container_id)
+        
+        for key, runner in list(self._retiring):
+            if runner.in_flight == 0:
+                self._retiring.remove((key, runner))
+                self._release_retired(key, runner)
+
+    def _release_retired(self, key, runner):
+        """Let go of a retiring runner, stopping it if no other worker still uses it"""
+        runner.disconnect()
+        record = self.registry.release_retired_runner(self._registry_key(key), runner.container_id)
+        if record is not None:
+            stop_runner(runner.client, record["container_id"], record["socket_dir"])
+
+    def _report_hits(self, key, runner):
+        """Pass a connection's warm calls on to the registry's eviction priorities"""
+        if runner.hits:
+            hits, runner.hits = runner.hits, 0
+            self.registry.record_hits(self._registry_key(key), hits)
+
+    def _sweep_shared(self, host):
+        """Pause and stop the host's runners that no worker on the node has leased for long enough"""
+        if self.pause_after is not None:
+            self.registry.pause_idle_runners(
+                host.name, self.pause_after, lambda record: pause_runner(host.client, record["container_id"])
+            )
+        for record in self.registry.claim_idle_runners(host.name, self.idle_timeout):
+            stop_runner(host.client, record["container_id"], record["socket_dir"])
+
+    def _keep_alive_loop(self):
+        # Runs even without traffic, which is exactly when runners go idle
+        while not self._stop.wait(SHARED_SWEEP_INTERVAL):
+            try:
+                retiring = self.registry.retiring_containers()
+            except Exception as e:
+                print(f"Runner keep-alive sweep failed: {str(e)}")
+                retiring = set()
+            with self._lock:
+                # Another worker retired a runner this one is also connected to
+                for runner in self._runners.values():
+                    if runner.container_id in retiring:
+                        runner.draining = True
+                self._sweep()
+                for key, runner in self._runners.items():
+                    self._report_hits(key, runner)
+                hosts = list(self._hosts.values())
+            for host in hosts:
+                try:
+                    self._sweep_shared(host)
+                except Exception as e:
+                    print(f"Runner keep-alive sweep failed on {host.name}: {str(e)}")
+
+    def _connect_shared(self, host, function, key, deadline):
+        """
+        Connect to the node's runner for key, starting it if no worker has;
+        None if the deadline passes while another worker readies it
+        """
+        registry_key = self._registry_key(key)
+        while True:
+            action, record = self.registry.lease_runner(
+                registry_key, host.name, function.id, function.memory_limit,
+                resume=lambda record: unpause_runner(host.client, record["container_id"])
+            )
+            if action == "wait":
+                # Another worker is booting it
+                if deadline.expired:
+                    return None
+                time.sleep(0.05)
+                continue
+            if action == "ready":
+                try:
+                    return PersistentNodeRunner(
+                        host.client, self.image_name, function, self.max_concurrency, attach_to=record
+                    )
+                except Exception:
+                    # Its socket is gone, so the container died; replace it
+                    self.registry.remove_runner(registry_key, record["container_id"])
+                    stop_runner(host.client, record["container_id"], record["socket_dir"])
+                    continue
+            # Make room in the host's warm budget before adding to it
+            for record in self.registry.evict_for(registry_key, host.name, self.memory_budget):
+                stop_runner(host.client, record["container_id"], record["socket_dir"])
+            try:
+                runner = PersistentNodeRunner(host.client, self.image_name, function, self.max_concurrency)
+            except Exception:
+                self.registry.abandon_runner(registry_key)
+                raise
+            cost = sum(runner.startup_phases.values())
+            self.registry.register_runner(registry_key, runner.container_id, runner.socket_dir, cost)
+            return runner
+
+    def _get_runner(self, host, function, deadline):
+        key = (host.name, function.id, function.memory_limit, function.code_hash)
+        with self._lock:
+            self._hosts[host.name] = host
+            if self._keep_alive is None:
+                self._keep_alive = threading.Thread(target=self._keep_alive_loop, name="runner-keep-alive", daemon=True)
+                self._keep_alive.start()
+            self._sweep()
+            runner = self._runners.get(key)
+            if runner is not None:
+                runner.in_flight += 1
+                return runner
+
+        # Connect outside the lock so other functions aren't held up
+        runner = self._connect_shared(host, function, key, deadline)
+        if runner is None:
+            return None
+        with self._lock:
+            # Retire a connection that started draining meanwhile before looking at it
+            self._sweep()
+            existing = self._runners.get(key)
+            if existing is not None and existing.alive and not existing.draining:
+                # Another thread connected first; keep one connection and one lease
+                runner.disconnect()
+                self.registry.release_runner(self._registry_key(key), runner.container_id)
+                runner = existing
+            else:
+                self._runners[key] = runner
+            runner.in_flight += 1
+            return runner
+
+    def run(self, host, function, event_data, codec, deadline):
+        """Run a JavaScript function on this host's persistent runner"""
+        kind, body = encode_event(event_data, codec)
+        runner = self._get_runner(host, function, deadline)
+        if runner is None:
+            return {"error": "Function execution timed out", "status": "timeout"}
+        try:
+            # A call queued behind a saturated runner gives up at its own deadline
+            if not runner.slots.acquire(timeout=deadline.remaining()):
+                return {"error": "Function execution timed out", "status": "timeout"}
+            try:
+                reply, data = runner.call(
+                    {"code_hash": function.code_hash, "kind": kind, "codec": codec.name},
+                    body,
+                    deadline
+                )
+            finally:
+                runner.slots.release()
+            with self._lock:
+                phases, runner.startup_phases = runner.startup_phases, None
+                if phases is None:
+                    runner.hits += 1
+        finally:
+            with self._lock:
+                runner.in_flight -= 1
+                runner.last_used = time.time()
+
+        result = decode_reply(reply, data, codec)
+        # Cold if this call started the runner or had to compile the handler
+        load_time = result.pop("load_time", None)
+        result["cold_start"] = phases is not None or load_time is not None
+        if result["cold_start"]:
+            result["phases"] = dict(phases or {}, load=load_time or 0.0, handler=result.get("execution_time", 0.0))
+        return result
+
+    def shutdown(self):
+        """Return this worker's leases and stop the runners no other worker still uses"""
+        self._stop.set()
+        with self._lock:
+            for key, runner in self._runners.items():
+                runner.disconnect()
+                self._report_hits(key, runner)
+                self.registry.release_runner(self._registry_key(key), runner.container_id)
+            self._runners.clear()
+            for key, runner in self._retiring:
+                self._release_retired(key, runner)
+            self._retiring.clear()
+            for host in self._hosts.values():
+                for record in self.registry.claim_idle_runners(host.name, 0):
+                    stop_runner(host.client, record["container_id"], record["socket_dir"])
@@ -0,0 +1,205 @@
+# payload_transfer.py
+import mmap
+import os
+import shutil
+import tempfile
+from codec import JSON, EncodedPayload
+
+# Payloads at or above this size (in bytes) skip the event/result files and are
+# staged in a shared-memory segment that is mounted into the container
+LARGE_PAYLOAD_THRESHOLD = int(os.environ.get("LARGE_PAYLOAD_THRESHOLD", 1024 * 1024))
+# Largest invocation input accepted for functions without their own limit, in bytes
+MAX_INPUT_SIZE = int(os.environ.get("MAX_INPUT_SIZE", 64 * 1024 * 1024))
+SHM_ROOT = "/dev/shm"
+CONTAINER_PAYLOAD_DIR = "/payload"
+EVENT_FILE = "event.bin"
+RESULT_FILE = "result.bin"
+
+
+def _staging_root():
+    """Prefer tmpfs-backed /dev/shm, fall back to the regular temp dir"""
+    if os.path.isdir(SHM_ROOT) and os.access(SHM_ROOT, os.W_OK):
+        return SHM_ROOT
+    return tempfile.gettempdir()
+
+
+def is_buffer(data):
+    """Check whether data is a raw byte buffer rather than a JSON document"""
+    return isinstance(data, (bytes, bytearray, memoryview))
+
+
+class PayloadTooLargeError(Exception):
+    """Raised when a request body exceeds the function's input limit"""
+
+
+class SpooledPayload:
+    """
+    A request body that was streamed to a file as it arrived.
+
+    codec is None for raw bodies. The file is mapped up front, so the
+    view stays usable after cleanup() unlinks it; pages are only read
+    in when a backend touches them.
+    """
+
+    def __init__(self, path, size, codec=None):
+        self.path = path
+        self.size = size
+        self.codec = codec
+        self._view = self._map()
+
+    @property
+    def raw(self):
+        return self.codec is None
+
+    def _map(self):
+        if self.size == 0:
+            return memoryview(b"")
+        with open(self.path, "rb") as f:
+            return memoryview(mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ))
+
+    def view(self):
+        return self._view
+
+    def link_to(self, path):
+        """Place the body at path without copying it when both are on one filesystem"""
+        try:
+            os.link(self.path, path)
+        except OSError:
+            with open(path, "wb") as f:
+                f.write(self._view)
+
+    def cleanup(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class BodySpool:
+    """
+    Collects a request body chunk by chunk, enforcing a size limit.
+
+    Bodies below the threshold stay in memory; past it they continue
+    into a file in the staging area, so concurrent large uploads never
+    sit whole in API memory.
+    """
+
+    def __init__(self, limit, threshold=LARGE_PAYLOAD_THRESHOLD):
+        self.limit = limit
+        self.threshold = threshold
+        self.size = 0
+        self.path = None
+        self._chunks = []
+        self._file = None
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.limit is not None and self.size > self.limit:
+            self.discard()
+            raise PayloadTooLargeError(f"Input exceeds the function's limit of {self.limit} bytes")
+        if self._file is not None:
+            self._file.write(chunk)
+            return
+        self._chunks.append(chunk)
+        if self.size >= self.threshold:
+            fd, self.path = tempfile.mkstemp(prefix="serverless-payload-", dir=_staging_root())
+            self._file = os.fdopen(fd, "wb")
+            for buffered in self._chunks:
+                self._file.write(buffered)
+            self._chunks = []
+
+    def finish(self, codec=None):
+        """The body as bytes if it stayed small, otherwise as a SpooledPayload"""
+        if self._file is None:
+            return b"".join(self._chunks)
+        self._file.close()
+        # Containers may run as a different user than the API process
+        os.chmod(self.path, 0o644)
+        return SpooledPayload(self.path, self.size, codec)
+
+    def discard(self):
+        self._chunks = []
+        if self._file is not None:
+            self._file.close()
+            os.remove(self.path)
+            self._file = None
+
+
+class PayloadStage:
+    """Shared-memory staging area for the input and output of one invocation"""
+
+    def __init__(self, threshold=LARGE_PAYLOAD_THRESHOLD):
+        self.threshold = threshold
+        self.path = tempfile.mkdtemp(prefix="serverless-payload-", dir=_staging_root())
+        # Containers may run as a different user than the API process
+        os.chmod(self.path, 0o777)
+
+    def volume(self):
+        """Volume spec that mounts the staging area into the container"""
+        return {self.path: {"bind": CONTAINER_PAYLOAD_DIR, "mode": "rw"}}
+
+    def stage_event(self, event_data, codec=JSON):
+        """
+        Stage the event and return the encoded event file contents.
+
+        Small events are returned encoded with the codec. Raw buffers and
+        encoded events above the threshold are written to the shared
+        segment and replaced by a small manifest the runner resolves.
+        """
+        if isinstance(event_data, SpooledPayload):
+            if not event_data.raw and event_data.size < self.threshold:
+                return bytes(event_data.view())
+            # Already in a file; link it in rather than writing it out again
+            event_data.link_to(os.path.join(self.path, EVENT_FILE))
+            return self._manifest("raw" if event_data.raw else "encoded", event_data.size, codec)
+
+        if is_buffer(event_data):
+            kind, data = "raw", event_data
+        else:
+            if isinstance(event_data, EncodedPayload):
+                data = event_data.data
+            else:
+                data = codec.dumps(event_data)
+            if len(data) < self.threshold:
+                return data
+            kind = "encoded"
+
+        with open(os.path.join(self.path, EVENT_FILE), "wb") as f:
+            f.write(data)
+
+        return self._manifest(kind, len(data), codec)
+
+    def _manifest(self, kind, size, codec):
+        """Small event file contents pointing the runner at the staged event"""
+        return codec.dumps({
+            "__payload__": {
+                "path": f"{CONTAINER_PAYLOAD_DIR}/{EVENT_FILE}",
+                "kind": kind,
+                "size": size
+            }
+        })
+
+    def resolve_result(self, result, codec=JSON):
+        """Replace an output reference in the result with the staged output"""
+        ref = result.pop("output_ref", None)
+        if ref is None:
+            return result
+
+        view = self._map(RESULT_FILE, ref["size"])
+        if ref["kind"] == "encoded":
+            result["output"] = codec.loads(view)
+        else:
+            # Zero-copy view of the output; the mapping outlives the staging dir
+            result["output"] = view
+        return result
+
+    def _map(self, name, size):
+        if size == 0:
+            return memoryview(b"")
+        with open(os.path.join(self.path, name), "rb") as f:
+            mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        return memoryview(mm)
+
+    def cleanup(self):
+        """Remove the staging area; mappings handed out stay valid"""
+        shutil.rmtree(self.path, ignore_errors=True)
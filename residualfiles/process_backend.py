@@ -0,0 +1,233 @@
+# process_backend.py
+import ctypes
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from backends import ExecutionBackend, decode_reply, encode_event, resolve_codec
+from deadlines import DEADLINES, Deadline
+from sandbox_worker import read_frame, write_frame
+import bytecode_cache
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+
+
+def _sandbox(memory_limit):
+    """Build the pre-exec hook that confines a worker before it starts"""
+    def apply():
+        # Address-space and core-dump limits; CPU is limited per call by the worker
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        # A fresh network namespace has only a downed loopback interface
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.unshare(CLONE_NEWUSER | CLONE_NEWNET) != 0:
+            raise OSError(ctypes.get_errno(), "Could not isolate worker network")
+    return apply
+
+
+class SandboxWorker:
+    """A sandboxed interpreter with one function loaded, reused across invocations"""
+
+    def __init__(self, function, startup_timeout=10.0):
+        self.workdir = tempfile.mkdtemp(prefix="serverless-sandbox-")
+        self.timed_out = False
+        self.last_used = time.time()
+        # Startup profile, handed to the first call this worker serves
+        self.startup_phases = {}
+        phase_start = time.time()
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=self.workdir,
+            env={"PATH": os.environ.get("PATH", ""), "HOME": self.workdir},
+            preexec_fn=_sandbox(function.memory_limit),
+            close_fds=True
+        )
+        self.startup_phases["create"] = time.time() - phase_start
+        phase_start = time.time()
+        # Workers share the API's interpreter, so deploy-time artifacts apply
+        bytecode = bytecode_cache.load(function.code_hash)
+        startup = Deadline(startup_timeout)
+        if bytecode is not None:
+            self.ready = self.call({"bytecode": True}, bytecode, startup)
+        else:
+            self.ready = self.call({"bytecode": False}, function.code.encode("utf-8"), startup)
+        load_time = self.ready[0].get("load_time", 0.0)
+        self.startup_phases["boot"] = max(0.0, time.time() - phase_start - load_time)
+        self.startup_phases["load"] = load_time
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def _timeout(self):
+        self.timed_out = True
+        self.process.kill()
+
+    def call(self, meta, body, deadline):
+        """Send one frame and wait for the reply, killing the worker at the deadline"""
+        kill = DEADLINES.schedule(deadline, self._timeout)
+        # Keeps the directory fresh for the reaper's age check
+        os.utime(self.workdir)
+        try:
+            write_frame(self.process.stdin, meta, body)
+            reply, data = read_frame(self.process.stdout)
+        except OSError:
+            reply, data = None, None
+        finally:
+            kill.cancel()
+            self.last_used = time.time()
+
+        if reply is not None:
+            return reply, data
+
+        # The worker died mid-call
+        self.process.wait()
+        if self.timed_out:
+            return {"error": "Function execution timed out", "status": "timeout"}, None
+        if self.process.returncode == -signal.SIGXCPU:
+            return {"error": "Function exceeded its CPU limit", "status": "error"}, None
+        return {"error": f"Worker exited with code {self.process.returncode}", "status": "error"}, None
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except Exception:
+            self.process.kill()
+            self.process.wait()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class ProcessBackend(ExecutionBackend):
+    """
+    Runs trusted functions in pooled, rlimited subprocesses instead of containers.
+
+    Each function version gets up to max_workers warm interpreters that
+    keep the handler loaded between calls. Workers run in their own
+    working directory and network namespace with an address-space limit
+    of the function's memory_limit, a per-call CPU limit and a wall-clock
+    kill when the invocation's deadline passes.
+    """
+
+    name = "process"
+
+    def __init__(self, max_workers=4, idle_timeout=300.0):
+        self.max_workers = max_workers
+        self.idle_timeout = idle_timeout
+        self._idle = {}  # pool key -> idle workers
+        self._live = {}  # pool key -> number of live workers
+        self._available = threading.Condition()
+
+    def _pool_key(self, function):
+        return (function.id, function.code_hash, function.memory_limit)
+
+    def _sweep(self):
+        """Close workers that have been idle too long; caller holds the lock"""
+        now = time.time()
+        for key, workers in list(self._idle.items()):
+            for worker in [w for w in workers if now - w.last_used > self.idle_timeout]:
+                workers.remove(worker)
+                self._live[key] -= 1
+                worker.close()
+
+    def _acquire(self, key, function, deadline):
+        """Take an idle worker or start one; None if the deadline passes while waiting"""
+        with self._available:
+            self._sweep()
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    return idle.pop()
+                if self._live.get(key, 0) < self.max_workers:
+                    self._live[key] = self._live.get(key, 0) + 1
+                    break
+                if deadline.expired:
+                    return None
+                self._available.wait(deadline.remaining())
+
+        try:
+            return SandboxWorker(function)
+        except Exception:
+            self._discard(key, None)
+            raise
+
+    def _release(self, key, worker):
+        if not worker.alive:
+            self._discard(key, worker)
+            return
+        with self._available:
+            self._idle.setdefault(key, []).append(worker)
+            self._available.notify()
+
+    def _discard(self, key, worker):
+        if worker is not None:
+            worker.close()
+        with self._available:
+            self._live[key] -= 1
+            self._available.notify()
+
+    def run_function(self, function, event_data, codec=None, deadline=None):
+        """Run a function in a pooled sandbox process"""
+        if function.language != "python":
+            return {"error": f"Unsupported language for process backend: {function.language}", "status": "error"}
+        codec = resolve_codec(event_data, codec)
+        deadline = deadline or Deadline.for_function(function)
+        kind, body = encode_event(event_data, codec)
+
+        key = self._pool_key(function)
+        try:
+            worker = self._acquire(key, function, deadline)
+        except Exception as e:
+            return {"error": f"Could not start sandbox: {str(e)}", "status": "error"}
+        if worker is None:
+            return {"error": "Function execution timed out", "status": "timeout"}
+
+        # Code that fails to load leaves a worker that can't serve calls
+        reply, _ = worker.ready
+        if reply.get("status") != "ready":
+            self._discard(key, worker)
+            return reply
+        # The first call on a fresh worker pays for its startup; claim the
+        # phases while the worker is still ours, before it goes back idle
+        phases, worker.startup_phases = worker.startup_phases, None
+
+        try:
+            # The worker's CPU limit is whatever is left of the budget
+            reply, data = worker.call(
+                {"kind": kind, "codec": codec.name, "cpu_limit": deadline.remaining()},
+                body,
+                deadline
+            )
+        finally:
+            self._release(key, worker)
+
+        result = decode_reply(reply, data, codec)
+        result["cold_start"] = phases is not None
+        if phases is not None:
+            result["phases"] = dict(phases, handler=result.get("execution_time", 0.0))
+        return result
+
+    def workdirs(self):
+        """Working directories of idle pooled workers"""
+        with self._available:
+            return {worker.workdir for workers in self._idle.values() for worker in workers}
+
+    def shutdown(self):
+        """Stop every pooled worker"""
+        with self._available:
+            for key, workers in self._idle.items():
+                for worker in workers:
+                    self._live[key] -= 1
+                    worker.close()
+            self._idle.clear()
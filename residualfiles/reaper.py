@@ -0,0 +1,273 @@
+# reaper.py
+import datetime
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import docker
+
+# Every container the platform starts carries these labels
+ROLE_LABEL = "serverless-platform.role"  # "function" or "runner"
+FUNCTION_LABEL = "serverless-platform.function-id"
+EXPIRES_LABEL = "serverless-platform.expires-at"  # unix time the invocation's deadline passes
+OWNER_LABEL = "serverless-platform.owner"  # "<hostname>:<pid>" of the API process that started it
+# Every image the platform builds carries this one; only those are ever removed
+IMAGE_LABEL = "serverless-platform.image"  # "base", or "legacy-function" for the old executor's per-function images
+
+INSTANCE = f"{socket.gethostname()}:{os.getpid()}"
+
+REAPER_INTERVAL = float(os.environ.get("REAPER_INTERVAL", 60))
+REAPER_MAX_OPERATIONS = int(os.environ.get("REAPER_MAX_OPERATIONS", 50))  # removals per pass
+REAPER_RATE = float(os.environ.get("REAPER_RATE", 5))  # removals per second
+REAPER_CPU_BUDGET = float(os.environ.get("REAPER_CPU_BUDGET", 0.5))  # CPU seconds per pass
+WORKSPACE_MAX_AGE = float(os.environ.get("WORKSPACE_MAX_AGE", 3600))
+IMAGE_MAX_AGE = float(os.environ.get("IMAGE_MAX_AGE", 86400))
+# How long past its deadline a function container may linger before it counts as leaked
+CONTAINER_GRACE = 30.0
+
+# Workspace name prefixes, by the directory they are created in; all of them are the platform's own
+WORKSPACE_PREFIXES = {
+    tempfile.gettempdir(): (
+        "serverless-func-",  # DockerManager workspaces
+        "serverless-sandbox-",  # process backend workers
+        "serverless-payload-",  # staged payloads and spooled request bodies without /dev/shm
+    ),
+    "/dev/shm": ("serverless-payload-",),
+}
+
+
+def container_labels(role, function_id, deadline=None):
+    """Labels for a container started by this API process"""
+    labels = {
+        ROLE_LABEL: role,
+        FUNCTION_LABEL: str(function_id),
+        OWNER_LABEL: INSTANCE
+    }
+    if deadline is not None:
+        labels[EXPIRES_LABEL] = str(time.time() + deadline.remaining())
+    return labels
+
+
+def owner_alive(owner):
+    """Whether the API process that started a container is still running"""
+    hostname, _, pid = owner.rpartition(":")
+    if hostname != socket.gethostname():
+        # Can't tell from here; only that node's reaper may judge
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        pass
+    return True
+
+
+def _image_age(image):
+    created = image.attrs.get("Created", "")
+    try:
+        created_at = datetime.datetime.strptime(created[:19], "%Y-%m-%dT%H:%M:%S")
+    except ValueError:
+        return 0
+    return (datetime.datetime.utcnow() - created_at).total_seconds()
+
+
+def _path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class _Budget:
+    """Caps one pass by removals and CPU time and spaces removals out"""
+
+    def __init__(self, max_operations, rate, cpu_seconds):
+        self.max_operations = max_operations
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.cpu_seconds = cpu_seconds
+        self.operations = 0
+        self.cpu_start = time.thread_time()
+        self.last_operation = 0.0
+
+    @property
+    def exhausted(self):
+        return (self.operations >= self.max_operations or
+                time.thread_time() - self.cpu_start >= self.cpu_seconds)
+
+    def spend(self):
+        """Wait for the next removal slot; False once the pass is over budget"""
+        if self.exhausted:
+            return False
+        wait = self.last_operation + self.interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.last_operation = time.monotonic()
+        self.operations += 1
+        return True
+
+
+class Reaper:
+    """
+    Background sweeper for resources that failure paths leave behind.
+
+    Removes labelled function containers that outlived their deadline,
+    runner containers whose API process is gone, stale images the
+    platform built, and old workspace directories. Each pass stops once
+    it has used its removal or CPU budget and picks up from there on
+    the next one.
+    """
+
+    def __init__(self, scheduler, protected=None, registered=None, interval=REAPER_INTERVAL,
+                 max_operations=REAPER_MAX_OPERATIONS, rate=REAPER_RATE, cpu_budget=REAPER_CPU_BUDGET,
+                 workspace_max_age=WORKSPACE_MAX_AGE, image_max_age=IMAGE_MAX_AGE):
+        self.scheduler = scheduler
+        # Callable returning paths still in use, e.g. live worker directories
+        self.protected = protected or (lambda: set())
+        # Callable returning runner container ids still shared through the warm registry
+        self.registered = registered or (lambda: set())
+        self.interval = interval
+        self.max_operations = max_operations
+        self.rate = rate
+        self.cpu_budget = cpu_budget
+        self.workspace_max_age = workspace_max_age
+        self.image_max_age = image_max_age
+        self.totals = {"containers": 0, "images": 0, "workspaces": 0, "bytes": 0}
+        self.last_pass = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="reaper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Reaper pass failed: {str(e)}")
+
+    def run_once(self):
+        """Run one budgeted pass and return what it reclaimed"""
+        with self._lock:
+            started_at = time.time()
+            budget = _Budget(self.max_operations, self.rate, self.cpu_budget)
+            reclaimed = {"containers": 0, "images": 0, "workspaces": 0, "bytes": 0}
+
+            for host in self.scheduler.hosts:
+                if not host.healthy:
+                    continue
+                try:
+                    self._reap_containers(host.client, budget, reclaimed)
+                    self._reap_images(host.client, budget, reclaimed)
+                except docker.errors.DockerException as e:
+                    print(f"Reaper skipped host {host.name}: {str(e)}")
+            self._reap_workspaces(budget, reclaimed)
+
+            for kind, amount in reclaimed.items():
+                self.totals[kind] += amount
+            self.last_pass = {
+                "started_at": started_at,
+                "duration": time.time() - started_at,
+                "budget_exhausted": budget.exhausted,
+                "reclaimed": reclaimed
+            }
+            return self.last_pass
+
+    def _leaked(self, container, now, registered):
+        labels = container.labels
+        if labels.get(ROLE_LABEL) == "runner":
+            if container.status not in ("running", "paused"):
+                return True
+            # Other workers on the node may still use a registered runner after its starter exits
+            return container.id not in registered and not owner_alive(labels.get(OWNER_LABEL, ""))
+        expires_at = labels.get(EXPIRES_LABEL)
+        if expires_at is None:
+            return container.status in ("exited", "dead")
+        return now > float(expires_at) + CONTAINER_GRACE
+
+    def _reap_containers(self, client, budget, reclaimed):
+        now = time.time()
+        registered = self.registered()
+        for container in client.containers.list(all=True, filters={"label": ROLE_LABEL}):
+            if not self._leaked(container, now, registered):
+                continue
+            if not budget.spend():
+                return
+            try:
+                container.remove(force=True)
+                reclaimed["containers"] += 1
+            except docker.errors.NotFound:
+                pass
+
+    def _reap_images(self, client, budget, reclaimed):
+        # Base images left untagged by a rebuild, and the legacy executor's per-function images
+        stale = client.images.list(filters={"dangling": True, "label": IMAGE_LABEL})
+        stale += client.images.list(filters={"label": f"{IMAGE_LABEL}=legacy-function"})
+        for image in stale:
+            if _image_age(image) < self.image_max_age:
+                continue
+            if not budget.spend():
+                return
+            try:
+                client.images.remove(image.id)
+                reclaimed["images"] += 1
+                reclaimed["bytes"] += image.attrs.get("Size", 0)
+            except docker.errors.APIError:
+                # Still used by a container, or already gone
+                pass
+
+    def _reap_workspaces(self, budget, reclaimed):
+        now = time.time()
+        protected = self.protected()
+        for root, prefixes in WORKSPACE_PREFIXES.items():
+            try:
+                entries = list(os.scandir(root))
+            except OSError:
+                continue
+            for entry in entries:
+                if not entry.name.startswith(prefixes) or entry.path in protected:
+                    continue
+                try:
+                    if now - entry.stat(follow_symlinks=False).st_mtime < self.workspace_max_age:
+                        continue
+                except OSError:
+                    continue
+                if not budget.spend():
+                    return
+                size = _path_size(entry.path)
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        continue
+                reclaimed["workspaces"] += 1
+                reclaimed["bytes"] += size
+
+    def get_stats(self):
+        return {
+            "interval": self.interval,
+            "budget": {
+                "max_operations": self.max_operations,
+                "rate": self.rate,
+                "cpu_seconds": self.cpu_budget
+            },
+            "totals": dict(self.totals),
+            "last_pass": self.last_pass
+        }
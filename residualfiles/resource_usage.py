@@ -0,0 +1,144 @@
+# resource_usage.py
+import math
+import os
+import threading
+
+CGROUP_ROOT = os.environ.get("CGROUP_ROOT", "/sys/fs/cgroup")
+
+# Headroom over observed usage when recommending limits
+MEMORY_HEADROOM = 1.25
+TIMEOUT_HEADROOM = 2.0
+MIN_MEMORY_LIMIT = 32  # MB, smallest limit worth recommending
+MEMORY_STEP = 16  # MB, recommendations are rounded up to this
+MIN_SAMPLES = 10
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            return int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _read_cpu_stat(path):
+    """usage_usec from a cgroup v2 cpu.stat file"""
+    try:
+        with open(path) as f:
+            for line in f:
+                key, _, value = line.partition(" ")
+                if key == "usage_usec":
+                    return int(value)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class UsageSampler:
+    """
+    Tracks a container's peak memory and CPU time while it runs.
+
+    Reads the container's cgroup files when the daemon is local and
+    falls back to the Docker stats API otherwise. Samples on its own
+    thread between start() and stop(), so the caller can block on the
+    container instead of polling it.
+    """
+
+    def __init__(self, container):
+        self.container = container
+        self.memory_peak = 0  # bytes
+        self.cpu_time = 0.0  # seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, interval):
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name="usage-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _loop(self, interval):
+        while True:
+            self.sample()
+            if self._stop.wait(interval):
+                break
+
+    def _cgroup_v2_dirs(self):
+        container_id = self.container.id
+        return [
+            os.path.join(CGROUP_ROOT, "system.slice", f"docker-{container_id}.scope"),
+            os.path.join(CGROUP_ROOT, "docker", container_id)
+        ]
+
+    def _sample_cgroup(self):
+        for path in self._cgroup_v2_dirs():
+            if os.path.isdir(path):
+                memory = _read_int(os.path.join(path, "memory.peak")) or _read_int(os.path.join(path, "memory.current"))
+                cpu_usec = _read_cpu_stat(os.path.join(path, "cpu.stat"))
+                return memory, None if cpu_usec is None else cpu_usec / 1e6
+
+        # cgroup v1 keeps memory and CPU accounting in separate hierarchies
+        memory = _read_int(os.path.join(CGROUP_ROOT, "memory", "docker", self.container.id, "memory.max_usage_in_bytes"))
+        cpu_nsec = _read_int(os.path.join(CGROUP_ROOT, "cpuacct", "docker", self.container.id, "cpuacct.usage"))
+        if memory is None and cpu_nsec is None:
+            return None
+        return memory, None if cpu_nsec is None else cpu_nsec / 1e9
+
+    def _sample_stats_api(self):
+        stats = self.container.stats(stream=False, one_shot=True)
+        memory_stats = stats.get("memory_stats", {})
+        memory = memory_stats.get("max_usage") or memory_stats.get("usage")
+        cpu_total = stats.get("cpu_stats", {}).get("cpu_usage", {}).get("total_usage")
+        return memory, None if cpu_total is None else cpu_total / 1e9
+
+    def sample(self):
+        """Take one sample, keeping the highest values seen"""
+        try:
+            sampled = self._sample_cgroup()
+            if sampled is None:
+                sampled = self._sample_stats_api()
+        except Exception:
+            return
+        memory, cpu_time = sampled
+        if memory:
+            self.memory_peak = max(self.memory_peak, memory)
+        if cpu_time:
+            self.cpu_time = max(self.cpu_time, cpu_time)
+
+    def usage(self):
+        return {"cpu_time": self.cpu_time, "memory_peak": self.memory_peak / (1024 * 1024)}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def recommend_limits(memory_peaks, execution_times, current_memory, current_timeout):
+    """
+    Suggest memory_limit (MB) and timeout (s) from recent executions.
+
+    Uses the p99 of observed peaks plus headroom. Returns None for a
+    value when there are too few samples to say anything.
+    """
+    recommendation = {"memory_limit": None, "timeout": None}
+
+    if len(memory_peaks) >= MIN_SAMPLES:
+        memory = percentile(memory_peaks, 0.99) * MEMORY_HEADROOM
+        memory = max(MIN_MEMORY_LIMIT, math.ceil(memory / MEMORY_STEP) * MEMORY_STEP)
+        recommendation["memory_limit"] = memory
+
+    if len(execution_times) >= MIN_SAMPLES:
+        timeout = max(1, math.ceil(percentile(execution_times, 0.99) * TIMEOUT_HEADROOM))
+        recommendation["timeout"] = timeout
+
+    return {
+        "current": {"memory_limit": current_memory, "timeout": current_timeout},
+        "recommended": recommendation,
+        "samples": {"memory": len(memory_peaks), "execution_time": len(execution_times)}
+    }
@@ -0,0 +1,127 @@
+# retention.py
+import datetime
+import os
+import threading
+import time
+from database import SessionLocal
+
+# How long each level of detail is kept, in hours; 0 keeps hourly rollups forever
+EXECUTION_RAW_RETENTION = float(os.environ.get("EXECUTION_RAW_RETENTION", 24))
+EXECUTION_MINUTE_RETENTION = float(os.environ.get("EXECUTION_MINUTE_RETENTION", 24 * 7))
+EXECUTION_HOUR_RETENTION = float(os.environ.get("EXECUTION_HOUR_RETENTION", 24 * 90))
+# Seconds after which executions no worker flushed to the rollups are folded in here
+EXECUTION_ROLLUP_GRACE = float(os.environ.get("EXECUTION_ROLLUP_GRACE", 300))
+RETENTION_INTERVAL = float(os.environ.get("RETENTION_INTERVAL", 60))
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", 1000))  # rows per transaction
+RETENTION_MAX_BATCHES = int(os.environ.get("RETENTION_MAX_BATCHES", 20))  # per stage and pass
+
+
+class RetentionManager:
+    """
+    Background compaction of function_executions.
+
+    Executions are rolled up per minute as they are recorded (see
+    metrics.LatencyTracker); ones still not rolled up after a grace
+    period, because they predate rollups or their worker stopped before
+    flushing, are folded in here. Rolled-up raw rows older than the raw
+    window are deleted; minute rollups older than their window are folded into
+    hourly ones, and hourly rollups past theirs are dropped. Each stage works
+    through short transactions of a bounded batch size and stops after
+    a bounded number of them, so a backlog is worked off over several
+    passes without holding the database.
+    """
+
+    def __init__(self, service_factory, interval=RETENTION_INTERVAL, rollup_grace=EXECUTION_ROLLUP_GRACE,
+                 raw_retention=EXECUTION_RAW_RETENTION,
+                 minute_retention=EXECUTION_MINUTE_RETENTION, hour_retention=EXECUTION_HOUR_RETENTION,
+                 batch_size=RETENTION_BATCH_SIZE, max_batches=RETENTION_MAX_BATCHES):
+        # Builds a FunctionService for a session; kept abstract to avoid an import cycle
+        self.service_factory = service_factory
+        self.interval = interval
+        self.rollup_grace = rollup_grace
+        self.raw_retention = raw_retention
+        self.minute_retention = max(minute_retention, raw_retention)
+        self.hour_retention = hour_retention
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.totals = {"unrolled_executions": 0, "executions": 0, "minute_rollups": 0, "hour_rollups": 0}
+        self.last_pass = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Retention pass failed: {str(e)}")
+
+    def _stages(self, now):
+        """(name, service method name, cutoff) for every stage, most detailed first"""
+        stages = [
+            ("unrolled_executions", "compact_executions", now - datetime.timedelta(seconds=self.rollup_grace)),
+            ("executions", "prune_executions", now - datetime.timedelta(hours=self.raw_retention)),
+            ("minute_rollups", "compact_rollups", now - datetime.timedelta(hours=self.minute_retention))
+        ]
+        if self.hour_retention > 0:
+            stages.append(("hour_rollups", "expire_rollups", now - datetime.timedelta(hours=self.hour_retention)))
+        return stages
+
+    def _run_batch(self, method, cutoff):
+        db = SessionLocal()
+        try:
+            return getattr(self.service_factory(db), method)(cutoff, self.batch_size)
+        finally:
+            db.close()
+
+    def run_once(self):
+        """Run one bounded pass and return how many rows each stage processed"""
+        with self._lock:
+            started_at = time.time()
+            now = datetime.datetime.utcnow()
+            processed = {}
+            backlog = False
+            for name, method, cutoff in self._stages(now):
+                processed[name] = 0
+                for _ in range(self.max_batches):
+                    count = self._run_batch(method, cutoff)
+                    processed[name] += count
+                    if count < self.batch_size:
+                        break
+                else:
+                    # Out of batches for this pass; the rest waits for the next one
+                    backlog = True
+
+            for name, count in processed.items():
+                self.totals[name] += count
+            self.last_pass = {
+                "started_at": started_at,
+                "duration": time.time() - started_at,
+                "backlog": backlog,
+                "processed": processed
+            }
+            return self.last_pass
+
+    def get_stats(self):
+        return {
+            "interval": self.interval,
+            "rollup_grace": self.rollup_grace,
+            "retention_hours": {
+                "raw": self.raw_retention,
+                "minute": self.minute_retention,
+                "hour": self.hour_retention or None
+            },
+            "batch_size": self.batch_size,
+            "max_batches": self.max_batches,
+            "totals": dict(self.totals),
+            "last_pass": self.last_pass
+        }
@@ -0,0 +1,129 @@
+# routing.py
+import bisect
+import hashlib
+import math
+import threading
+import time
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    """Hash ring with virtual nodes so hosts can join and leave with little reshuffling"""
+
+    def __init__(self, names=(), replicas=100):
+        self.replicas = replicas
+        self._points = []
+        self._owners = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        for i in range(self.replicas):
+            point = _hash(f"{name}#{i}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = name
+
+    def remove(self, name):
+        self._points = [p for p in self._points if self._owners[p] != name]
+        self._owners = {p: n for p, n in self._owners.items() if n != name}
+
+    def walk(self, key):
+        """Yield each distinct host name in ring order starting at the key"""
+        if not self._points:
+            return
+        seen = set()
+        start = bisect.bisect(self._points, _hash(key))
+        for i in range(len(self._points)):
+            name = self._owners[self._points[(start + i) % len(self._points)]]
+            if name not in seen:
+                seen.add(name)
+                yield name
+
+
+class AffinityRouter:
+    """
+    Routes repeat invocations of a function back to hosts that are already warm.
+
+    Hosts holding the function's image or warm containers are preferred,
+    then the function's home on the consistent hash ring. Every choice is
+    capped at load_factor times the average load, so a hot function
+    spills over to the next host on the ring instead of piling onto one.
+    """
+
+    def __init__(self, host_names, load_factor=1.25, warm_ttl=600.0):
+        self.ring = ConsistentHashRing(host_names)
+        self.load_factor = load_factor
+        self.warm_ttl = warm_ttl
+        self._warm = {}  # key -> {host name: last time it was seen warm}
+        self._pruned_at = time.time()
+        self._lock = threading.Lock()
+
+    def _expire(self, key, now):
+        """Drop a key's hosts not seen warm within the TTL, and the key once none are left; caller holds the lock"""
+        hosts = self._warm.get(key)
+        if hosts is None:
+            return {}
+        for name in [n for n, seen in hosts.items() if now - seen > self.warm_ttl]:
+            del hosts[name]
+        if not hosts:
+            del self._warm[key]
+        return hosts
+
+    def mark_warm(self, key, host_name):
+        """Record that a host now holds warm state for key"""
+        now = time.time()
+        with self._lock:
+            self._warm.setdefault(key, {})[host_name] = now
+            # Keys of old versions and deleted functions are never marked again; sweep them once per TTL
+            if now - self._pruned_at > self.warm_ttl:
+                self._pruned_at = now
+                for stale in list(self._warm):
+                    self._expire(stale, now)
+
+    def forget(self, key, host_name):
+        """Drop warm state for key on a host, e.g. after eviction or failure"""
+        with self._lock:
+            hosts = self._warm.get(key)
+            if hosts is not None:
+                hosts.pop(host_name, None)
+                if not hosts:
+                    del self._warm[key]
+
+    def warm_hosts(self, key):
+        """Hosts with live warm state for key, most recently used first"""
+        with self._lock:
+            hosts = self._expire(key, time.time())
+            return sorted(hosts, key=hosts.get, reverse=True)
+
+    def choose(self, key, candidates, load):
+        """
+        Pick a host from candidates for key.
+
+        load maps a host to its current in-flight count. Returns None if
+        candidates is empty.
+        """
+        if not candidates:
+            return None
+        by_name = {host.name: host for host in candidates}
+        total = sum(load(host) for host in candidates)
+        cap = math.ceil(self.load_factor * (total + 1) / len(candidates))
+
+        for name in self.warm_hosts(key):
+            host = by_name.get(name)
+            if host is not None and load(host) < cap:
+                return host
+
+        for name in self.ring.walk(key):
+            host = by_name.get(name)
+            if host is not None and load(host) < cap:
+                return host
+
+        return min(candidates, key=load)
+
+    def get_stats(self):
+        with self._lock:
+            return {key: sorted(hosts) for key, hosts in self._warm.items()}
@@ -0,0 +1,142 @@
+# sandbox_worker.py
+# Child process for the process backend. Loads one function and then serves
+# invocations over length-prefixed frames on stdin/stdout until stdin closes.
+import marshal
+import resource
+import struct
+import sys
+import time
+import traceback
+from types import ModuleType
+from codec import JSON, get_codec
+
+FRAME_HEADER = struct.Struct("!II")
+
+
+def read_frame(stream):
+    """Read one (meta, body) frame, or (None, None) at end of stream"""
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None, None
+    meta_len, body_len = FRAME_HEADER.unpack(header)
+    meta = stream.read(meta_len)
+    body = stream.read(body_len)
+    if len(meta) < meta_len or len(body) < body_len:
+        return None, None
+    return JSON.loads(meta), body
+
+
+def write_frame(stream, meta, body=b""):
+    """Write one (meta, body) frame"""
+    meta = JSON.dumps(meta)
+    stream.write(FRAME_HEADER.pack(len(meta), len(body)))
+    stream.write(meta)
+    stream.write(body)
+    stream.flush()
+
+
+def _limit_cpu(seconds):
+    """Allow this call `seconds` of CPU on top of what the worker already used"""
+    soft = int(_cpu_time() + seconds) + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _address_space_peak():
+    """
+    Peak virtual address space in MB. That is what the worker's RLIMIT_AS
+    caps over its whole life, so limits recommended from it are the ones
+    enforced; peak RSS only where /proc isn't available
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmPeak:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _usage(cpu_before):
+    """CPU used by this call and the worker's peak address space so far, in MB"""
+    return {
+        "cpu_time": _cpu_time() - cpu_before,
+        "memory_peak": _address_space_peak()
+    }
+
+
+def main():
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    # Handler prints must not corrupt the protocol
+    sys.stdout = sys.stderr
+
+    # The first frame carries the function's bytecode or source
+    meta, code = read_frame(stdin)
+    mod = ModuleType('function_module')
+    load_start = time.time()
+    try:
+        if meta.get("bytecode"):
+            code = marshal.loads(code)
+        else:
+            code = compile(code, 'function.py', 'exec')
+        exec(code, mod.__dict__)
+        if not hasattr(mod, 'handler'):
+            raise Exception("Function must contain a 'handler' function")
+        write_frame(stdout, {"status": "ready", "load_time": time.time() - load_start})
+    except Exception as e:
+        write_frame(stdout, {"error": str(e), "traceback": traceback.format_exc(), "status": "error"})
+        return
+
+    while True:
+        meta, body = read_frame(stdin)
+        if meta is None:
+            return
+
+        _limit_cpu(meta["cpu_limit"])
+        codec = get_codec(meta["codec"])
+        cpu_before = _cpu_time()
+        try:
+            event = memoryview(body) if meta["kind"] == "raw" else codec.loads(body)
+        except ValueError as e:
+            # The caller's event, not the function, is at fault
+            write_frame(stdout, {
+                "error": f"Request body could not be decoded: {e}",
+                "usage": _usage(cpu_before),
+                "status": "bad_request"
+            })
+            continue
+        try:
+            start_time = time.time()
+            output = mod.handler(event)
+            execution_time = time.time() - start_time
+
+            if isinstance(output, (bytes, bytearray, memoryview)):
+                kind, data = "raw", output
+            else:
+                kind, data = "encoded", codec.dumps(output)
+            write_frame(stdout, {
+                "kind": kind,
+                "execution_time": execution_time,
+                "usage": _usage(cpu_before),
+                "status": "success"
+            }, data)
+        except Exception as e:
+            write_frame(stdout, {
+                "error": str(e),
+                "traceback": traceback.format_exc(),
+                "usage": _usage(cpu_before),
+                "status": "error"
+            })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+# scheduler.py
+import functools
+import os
+import threading
+import time
+import docker
+import requests
+from routing import AffinityRouter
+
+# Comma-separated Docker endpoints, e.g. "unix://var/run/docker.sock,tcp://10.0.0.2:2375"
+DOCKER_HOSTS = os.environ.get("DOCKER_HOSTS", "")
+
+# Failures to reach a daemon or to hear back from it in time
+CONNECTION_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+def is_host_error(error):
+    """Whether an error means the host itself is in trouble rather than the function"""
+    if isinstance(error, docker.errors.APIError):
+        # A 4xx is the daemon refusing this request, e.g. an invalid memory limit, on any host
+        return error.is_server_error()
+    # The client raises a bare DockerException when it can't reach the daemon at all
+    return isinstance(error, CONNECTION_ERRORS) or type(error) is docker.errors.DockerException
+
+
+class NoHealthyHostError(Exception):
+    """Raised when no host can take an invocation"""
+
+
+class DockerHost:
+    """A Docker endpoint and the load the scheduler has placed on it"""
+
+    def __init__(self, name, client=None, connect=None, max_in_flight=32):
+        self.name = name
+        # The client is created on first use, so a daemon that is down at boot isn't fatal
+        self._client = client
+        self._connect = connect
+        self._connect_lock = threading.Lock()
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.reserved_memory = 0  # MB held by in-flight invocations
+        self.total_memory = None  # MB reported by the daemon
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.retry_at = 0.0
+
+    @property
+    def client(self):
+        """Docker client for this endpoint; connects on first access"""
+        if self._client is None:
+            with self._connect_lock:
+                if self._client is None:
+                    self._client = self._connect()
+        return self._client
+
+    @property
+    def connected(self):
+        return self._client is not None
+
+    @property
+    def free_memory(self):
+        """Memory not yet reserved by in-flight invocations, in MB"""
+        if self.total_memory is None:
+            return None
+        return self.total_memory - self.reserved_memory
+
+    def probe(self):
+        """Ping the daemon and refresh its memory capacity"""
+        self.client.ping()
+        info = self.client.info()
+        self.total_memory = info.get("MemTotal", 0) // (1024 * 1024)
+
+    def snapshot(self):
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "connected": self.connected,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "reserved_memory": self.reserved_memory,
+            "free_memory": self.free_memory,
+            "consecutive_failures": self.consecutive_failures
+        }
+
+
+class HostScheduler:
+    """Places invocations on the least-loaded healthy Docker host"""
+
+    def __init__(self, hosts, failure_threshold=3, retry_interval=10.0, router=None):
+        if not hosts:
+            raise ValueError("At least one Docker host is required")
+        self.hosts = list(hosts)
+        self.failure_threshold = failure_threshold
+        self.retry_interval = retry_interval
+        # Keyed invocations prefer hosts where the function is already warm
+        self.router = router or AffinityRouter([host.name for host in self.hosts])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_endpoints(cls, endpoints=None, **kwargs):
+        """Build a scheduler from Docker endpoint URLs, or the local environment; nothing connects yet"""
+        if endpoints is None:
+            endpoints = [e.strip() for e in DOCKER_HOSTS.split(",") if e.strip()]
+        if not endpoints:
+            return cls([DockerHost("local", connect=docker.from_env)], **kwargs)
+        return cls(
+            [DockerHost(url, connect=functools.partial(docker.DockerClient, base_url=url, version="auto")) for url in endpoints],
+            **kwargs
+        )
+
+    def _check(self, host):
+        """Probe a host whose capacity is unknown or whose back-off has expired"""
+        if host.healthy and host.total_memory is not None:
+            return
+        if not host.healthy and time.time() < host.retry_at:
+            return
+        try:
+            host.probe()
+            host.healthy = True
+            host.consecutive_failures = 0
+        except Exception:
+            host.healthy = False
+            host.retry_at = time.time() + self.retry_interval
+
+    def acquire(self, memory_limit, exclude=(), key=None):
+        """
+        Reserve a slot on a host that fits memory_limit MB.
+
+        With a key the affinity router picks a warm or ring-assigned host
+        under its load bound; otherwise the least-loaded host wins.
+        """
+        # Probe outside the lock so a slow daemon doesn't stall placement
+        for host in self.hosts:
+            if host.name not in exclude:
+                self._check(host)
+
+        with self._lock:
+            candidates = [
+                host for host in self.hosts
+                if host.healthy
+                and host.name not in exclude
+                and host.in_flight < host.max_in_flight
+                and (host.free_memory is None or host.free_memory >= memory_limit)
+            ]
+            if not candidates:
+                return None
+
+            if key is not None:
+                host = self.router.choose(key, candidates, lambda h: h.in_flight)
+            else:
+                # Fewest in-flight invocations first, then the most free memory
+                host = min(candidates, key=lambda h: (h.in_flight, -(h.free_memory or 0)))
+            host.in_flight += 1
+            host.reserved_memory += memory_limit
+            return host
+
+    def release(self, host, memory_limit, failed=False):
+        """Return a slot and record whether the host failed"""
+        with self._lock:
+            host.in_flight -= 1
+            host.reserved_memory -= memory_limit
+            if not failed:
+                host.consecutive_failures = 0
+                return
+            host.consecutive_failures += 1
+            if host.consecutive_failures >= self.failure_threshold:
+                host.healthy = False
+                host.retry_at = time.time() + self.retry_interval
+
+    def run(self, memory_limit, task, key=None):
+        """Run task(host) on the best host, failing over to the others on host errors"""
+        tried = set()
+        last_error = None
+        while True:
+            host = self.acquire(memory_limit, exclude=tried, key=key)
+            if host is None:
+                if last_error is not None:
+                    raise NoHealthyHostError(f"All hosts failed, last error: {last_error}")
+                raise NoHealthyHostError("No healthy Docker host has capacity")
+
+            try:
+                result = task(host)
+            except Exception as e:
+                if not is_host_error(e):
+                    self.release(host, memory_limit)
+                    raise
+                self.release(host, memory_limit, failed=True)
+                if key is not None:
+                    self.router.forget(key, host.name)
+                tried.add(host.name)
+                last_error = e
+                continue
+            self.release(host, memory_limit)
+            if key is not None:
+                self.router.mark_warm(key, host.name)
+            return result
+
+    def healthy_hosts(self):
+        """Names of the hosts that answer, probing any that are unknown or due a retry"""
+        for host in self.hosts:
+            self._check(host)
+        return [host.name for host in self.hosts if host.healthy]
+
+    def for_each_host(self, task):
+        """Run task(host) on every healthy host"""
+        for host in self.hosts:
+            self._check(host)
+            if host.healthy:
+                task(host)
+
+    def get_stats(self):
+        with self._lock:
+            return [host.snapshot() for host in self.hosts]
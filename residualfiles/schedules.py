@@ -0,0 +1,385 @@
+# schedules.py
+import calendar
+import datetime
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from database import SessionLocal
+
+# Scheduled runs in flight at once, across every schedule
+SCHEDULE_MAX_CONCURRENCY = int(os.environ.get("SCHEDULE_MAX_CONCURRENCY", 8))
+# How late a run may start before it counts as missed, in seconds
+MISFIRE_GRACE = 60
+# Missed runs "run_all" catches up on after downtime
+MAX_CATCH_UP = 10
+DEFAULT_JITTER = 30  # seconds
+
+MISFIRE_POLICIES = ["skip", "run_once", "run_all"]
+OVERLAP_POLICIES = ["skip", "queue", "allow"]
+
+_CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]  # minute hour day month weekday
+_CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+}
+
+
+def _parse_field(text, low, high):
+    values = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid cron step: {step_text}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron field out of range {low}-{high}: {text}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    """Five-field cron expression (minute hour day month weekday), evaluated in UTC"""
+
+    def __init__(self, expression):
+        self.expression = expression
+        fields = _CRON_ALIASES.get(expression.strip(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression}")
+        try:
+            self.minutes, self.hours, self.days, self.months, weekdays = (
+                _parse_field(text, low, high) for text, (low, high) in zip(fields, _CRON_FIELDS)
+            )
+        except ValueError as e:
+            raise ValueError(f"Invalid cron expression {expression!r}: {e}")
+        # Both 0 and 7 mean Sunday
+        self.weekdays = {day % 7 for day in weekdays}
+        self.day_restricted = fields[2] != "*"
+        self.weekday_restricted = fields[4] != "*"
+
+    def _day_matches(self, t):
+        in_days = t.day in self.days
+        # Cron counts weekdays from Sunday, Python from Monday
+        in_weekdays = (t.weekday() + 1) % 7 in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return in_days or in_weekdays
+        if self.day_restricted:
+            return in_days
+        if self.weekday_restricted:
+            return in_weekdays
+        return True
+
+    def next_after(self, t):
+        """First matching minute strictly after t"""
+        t = t.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        # A few years of skipping is enough to find any real schedule
+        for _ in range(100000):
+            if t.month not in self.months:
+                year, month = (t.year + 1, 1) if t.month == 12 else (t.year, t.month + 1)
+                t = t.replace(year=year, month=month, day=1, hour=0, minute=0)
+            elif not self._day_matches(t):
+                t = (t + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+            elif t.hour not in self.hours:
+                t = (t + datetime.timedelta(hours=1)).replace(minute=0)
+            elif t.minute not in self.minutes:
+                t += datetime.timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron expression never fires: {self.expression}")
+
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel over integer ticks.
+
+    Level k has 2**bits slots each spanning 2**(bits*k) ticks, so adding
+    and expiring a timer is O(1) however many are pending; timers cascade
+    down a level as their slot comes round. Timers beyond the top level
+    wait in an overflow list.
+    """
+
+    def __init__(self, start, levels=4, bits=6):
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.levels = [[[] for _ in range(1 << bits)] for _ in range(levels)]
+        self.overflow = []
+        self.due = []
+        self.current = start
+        self.count = 0
+
+    def _place(self, expires, item):
+        delta = expires - self.current
+        if delta <= 0:
+            # The current tick's slot has already been emptied
+            self.due.append(item)
+            return
+        for level, slots in enumerate(self.levels):
+            if delta < 1 << (self.bits * (level + 1)):
+                slots[(expires >> (self.bits * level)) & self.mask].append((expires, item))
+                return
+        self.overflow.append((expires, item))
+
+    def add(self, expires, item):
+        """Schedule item for tick expires; current and past ticks fire on the next advance"""
+        self.count += 1
+        self._place(expires, item)
+
+    def advance(self, to_tick):
+        """Move time forward to to_tick and return the items that expired"""
+        due, self.due = self.due, []
+        while self.current < to_tick:
+            self.current += 1
+            # Pull the next slot of each higher level down once the levels below wrap
+            for level in range(1, len(self.levels)):
+                if self.current & ((1 << (self.bits * level)) - 1):
+                    break
+                slot = self.levels[level][(self.current >> (self.bits * level)) & self.mask]
+                self.levels[level][(self.current >> (self.bits * level)) & self.mask] = []
+                for expires, item in slot:
+                    self._place(expires, item)
+            else:
+                if not self.current & ((1 << (self.bits * len(self.levels))) - 1):
+                    overflow, self.overflow = self.overflow, []
+                    for expires, item in overflow:
+                        self._place(expires, item)
+
+            bucket = self.levels[0][self.current & self.mask]
+            self.levels[0][self.current & self.mask] = []
+            due.extend(item for _, item in bucket)
+            due.extend(self.due)
+            self.due = []
+        self.count -= len(due)
+        return due
+
+
+def _to_unix(t):
+    return calendar.timegm(t.timetuple())
+
+
+def _from_unix(seconds):
+    return datetime.datetime.utcfromtimestamp(seconds)
+
+
+class ScheduleRunner:
+    """
+    Fires function schedules from an in-process timer wheel.
+
+    Every occurrence is delayed by a random jitter so schedules sharing a
+    cron time don't all start in the same second. Runs share a bounded
+    pool; an occurrence that finds it full is retried each tick and,
+    once it is later than MISFIRE_GRACE, handled by the schedule's
+    misfire policy. The overlap policy decides what happens when the
+    previous run of the same schedule is still going.
+
+    Every worker process arms every schedule, but an occurrence only runs
+    in the worker that claims it by moving the schedule's next_run_at on
+    from it in the database.
+    """
+
+    def __init__(self, backends, service_factory, max_concurrency=SCHEDULE_MAX_CONCURRENCY):
+        self.backends = backends
+        # Builds a FunctionService for a session; kept abstract to avoid an import cycle
+        self.service_factory = service_factory
+        self.max_concurrency = max_concurrency
+        self.wheel = TimerWheel(int(time.time()))
+        self._entries = {}  # schedule id -> schedule dict
+        self._generations = {}  # schedule id -> generation, bumped to drop stale timers
+        self._running = {}  # schedule id -> runs in flight
+        self._queued = set()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="schedule")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"fired": 0, "missed": 0, "skipped_overlap": 0, "deferred": 0}
+
+    def start(self):
+        """Load every enabled schedule, catch up on missed runs and start ticking"""
+        db = SessionLocal()
+        try:
+            for schedule in self.service_factory(db).get_all_schedules():
+                self.load(schedule, catch_up=True)
+        finally:
+            db.close()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="schedule-wheel", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._pool.shutdown(wait=False)
+
+    def load(self, schedule, catch_up=False):
+        """(Re)arm a schedule from its dict form; disabled schedules are dropped"""
+        with self._lock:
+            generation = self._generations.get(schedule["id"], 0) + 1
+            self._generations[schedule["id"]] = generation
+            if not schedule["enabled"]:
+                self._entries.pop(schedule["id"], None)
+                return
+            schedule = dict(schedule, cron=CronExpression(schedule["cron"]))
+            self._entries[schedule["id"]] = schedule
+
+        now = datetime.datetime.utcnow()
+        stored = schedule.get("next_run_at")
+        stored = datetime.datetime.fromisoformat(stored) if stored else None
+        missed_from = None
+        if stored is None:
+            next_run_at = schedule["cron"].next_after(now)
+        elif _to_unix(now) - _to_unix(stored) > MISFIRE_GRACE:
+            missed_from = stored if catch_up else None
+            next_run_at = schedule["cron"].next_after(now)
+        else:
+            # Not yet due, or due so recently that it still runs on time
+            next_run_at = stored
+        # Persist it so a restart only catches up on runs missed from here on; moving it on
+        # claims the missed runs, so only one worker catches up on them
+        claimed = next_run_at == stored or self._claim(schedule["id"], stored, next_run_at)
+
+        with self._lock:
+            if self._generations.get(schedule["id"]) != generation:
+                return
+            if missed_from is not None and claimed:
+                self._catch_up(schedule, generation, missed_from, now)
+            self._arm(schedule, generation, next_run_at)
+
+    def remove(self, schedule_id):
+        with self._lock:
+            self._generations[schedule_id] = self._generations.get(schedule_id, 0) + 1
+            self._entries.pop(schedule_id, None)
+
+    def _catch_up(self, schedule, generation, missed_from, now):
+        """Apply the misfire policy to runs missed while the platform was down; caller holds the lock"""
+        missed = []
+        t = missed_from
+        while t <= now and len(missed) < MAX_CATCH_UP:
+            missed.append(t)
+            t = schedule["cron"].next_after(t)
+        self.stats["missed"] += len(missed)
+        if schedule["misfire_policy"] == "run_once":
+            missed = missed[-1:]
+        elif schedule["misfire_policy"] == "skip":
+            missed = []
+        # Spread catch-up runs a tick apart rather than releasing them together
+        for i, cron_time in enumerate(missed):
+            self.wheel.add(int(time.time()) + i, (schedule["id"], generation, _to_unix(cron_time), True))
+
+    def _arm(self, schedule, generation, cron_time):
+        """Add the next occurrence to the wheel with jitter; caller holds the lock"""
+        jitter = random.uniform(0, schedule["jitter"]) if schedule["jitter"] else 0
+        self.wheel.add(int(_to_unix(cron_time) + jitter), (schedule["id"], generation, _to_unix(cron_time), False))
+
+    def _loop(self):
+        while not self._stop.is_set():
+            # Sleep to the next whole second
+            self._stop.wait(1 - time.time() % 1)
+            with self._lock:
+                due = self.wheel.advance(int(time.time()))
+            for item in due:
+                self._fire(*item)
+
+    def _fire(self, schedule_id, generation, cron_time, catch_up, deferred=False):
+        """Handle one due occurrence"""
+        first = not deferred and not catch_up
+        with self._lock:
+            schedule = self._entries.get(schedule_id)
+            if schedule is None or self._generations.get(schedule_id) != generation:
+                return
+            # The first time an occurrence comes due, arm the one after it
+            if first:
+                next_time = schedule["cron"].next_after(_from_unix(cron_time))
+                self._arm(schedule, generation, next_time)
+
+        # Another worker that moved next_run_at on first runs this occurrence instead
+        if first and not self._claim(schedule_id, _from_unix(cron_time), next_time):
+            return
+
+        status = None
+        with self._lock:
+            late = time.time() - cron_time - schedule["jitter"] > MISFIRE_GRACE
+            if late and not catch_up and schedule["misfire_policy"] == "skip":
+                self.stats["missed"] += 1
+                status = "missed"
+            elif self._running.get(schedule_id, 0) and schedule["overlap_policy"] != "allow":
+                if schedule["overlap_policy"] == "skip":
+                    self.stats["skipped_overlap"] += 1
+                    status = "skipped"
+                else:
+                    # At most one run waits behind the current one
+                    self._queued.add(schedule_id)
+            elif not self._slots.acquire(blocking=False):
+                # Respect the concurrency limit; try again next tick while it is full
+                self.stats["deferred"] += 1
+                self.wheel.add(int(time.time()) + 1, (schedule_id, generation, cron_time, catch_up, True))
+            else:
+                self._running[schedule_id] = self._running.get(schedule_id, 0) + 1
+                self.stats["fired"] += 1
+                self._pool.submit(self._execute, schedule, generation, cron_time)
+        if status is not None:
+            self._record(schedule_id, last_status=status)
+
+    def _execute(self, schedule, generation, cron_time):
+        status = "error"
+        db = SessionLocal()
+        try:
+            service = self.service_factory(db)
+            function = service.resolve_version(schedule["function_id"], schedule["alias"])
+            if function is None:
+                error = "Function or alias not found"
+                service.record_schedule_run(schedule["id"], _from_unix(cron_time), status, error)
+                return
+            start_time = time.time()
+            result = self.backends.run_function(function, json.loads(schedule["payload"] or "{}"))
+            status = result.get("status", "error")
+            service.record_result(schedule["function_id"], time.time() - start_time, result)
+            service.record_schedule_run(schedule["id"], _from_unix(cron_time), status, result.get("error"))
+        except Exception as e:
+            print(f"Scheduled run of schedule {schedule['id']} failed: {str(e)}")
+        finally:
+            db.close()
+            self._slots.release()
+            with self._lock:
+                self._running[schedule["id"]] -= 1
+                queued = schedule["id"] in self._queued
+                self._queued.discard(schedule["id"])
+            if queued:
+                self._fire(schedule["id"], generation, cron_time, True, deferred=True)
+
+    def _claim(self, schedule_id, expected, next_run_at):
+        db = SessionLocal()
+        try:
+            return self.service_factory(db).claim_schedule_run(schedule_id, expected, next_run_at)
+        finally:
+            db.close()
+
+    def _record(self, schedule_id, **fields):
+        db = SessionLocal()
+        try:
+            self.service_factory(db).update_schedule_state(schedule_id, **fields)
+        finally:
+            db.close()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(
+                self.stats,
+                schedules=len(self._entries),
+                pending_timers=self.wheel.count,
+                running=sum(self._running.values()),
+                queued=len(self._queued),
+                max_concurrency=self.max_concurrency
+            )
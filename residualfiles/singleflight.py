@@ -0,0 +1,73 @@
+# singleflight.py
+import asyncio
+import functools
+import hashlib
+import json
+import threading
+from codec import EncodedPayload
+from payload_transfer import SpooledPayload, is_buffer
+
+
+def input_hash(event_data):
+    """Hash of an event that ignores key order and whitespace"""
+    if is_buffer(event_data):
+        return hashlib.sha256(event_data).hexdigest()
+    if isinstance(event_data, SpooledPayload):
+        # Too large to decode just for a key; spooled bodies coalesce on their exact bytes
+        digest = hashlib.sha256(b"" if event_data.raw else event_data.codec.name.encode("utf-8"))
+        digest.update(event_data.view())
+        return digest.hexdigest()
+    if isinstance(event_data, EncodedPayload):
+        try:
+            event_data = event_data.codec.loads(event_data.data)
+        except Exception:
+            # Undecodable bodies still coalesce on their exact bytes
+            return hashlib.sha256(event_data.codec.name.encode("utf-8") + bytes(event_data.data)).hexdigest()
+    try:
+        canonical = json.dumps(event_data, sort_keys=True, separators=(",", ":"))
+    except (TypeError, ValueError):
+        canonical = repr(event_data)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Collapses identical concurrent invocations onto one execution.
+
+    Calls are keyed by (function id, version, input hash). The first
+    caller starts the execution on a worker thread; callers arriving
+    while it is in flight await the same task and share its result. The
+    task is shielded, so a disconnecting caller never cancels it for the
+    others.
+    """
+
+    def __init__(self):
+        self._inflight = {}  # key -> asyncio task
+        self._stats = {}  # function id -> counters
+        self._lock = threading.Lock()
+
+    def _count(self, function_id, field):
+        with self._lock:
+            stats = self._stats.setdefault(function_id, {"executions": 0, "coalesced": 0})
+            stats[field] += 1
+
+    async def run(self, key, func, *args, **kwargs):
+        """Run func(*args, **kwargs) once per key at a time; returns (result, shared)"""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self._count(key[0], "coalesced")
+        else:
+            loop = asyncio.get_running_loop()
+            task = asyncio.ensure_future(loop.run_in_executor(None, functools.partial(func, *args, **kwargs)))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self._count(key[0], "executions")
+        return await asyncio.shield(task), shared
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                function_id: dict(stats, in_flight=sum(1 for key in self._inflight if key[0] == function_id))
+                for function_id, stats in self._stats.items()
+            }
@@ -0,0 +1,112 @@
+# sketches.py
+import math
+
+# Durations at or below this are counted as zero rather than given a bucket
+MIN_VALUE = 1e-9
+
+
+class DDSketch:
+    """
+    Mergeable quantile sketch with relative-error guarantees (DDSketch).
+
+    Values fall into logarithmic buckets, so any quantile is returned
+    within relative_accuracy of the true value, two sketches merge by
+    adding bucket counts, and memory grows with the range of values
+    rather than their number. Past max_bins the lowest buckets are
+    folded together, which only loses accuracy at the fast end.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}  # bucket index -> count
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, index):
+        """Midpoint of a bucket, within relative_accuracy of anything in it"""
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value, count=1):
+        if value <= MIN_VALUE:
+            self.zero_count += count
+        else:
+            index = self._index(value)
+            self.bins[index] = self.bins.get(index, 0) + count
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def _collapse(self):
+        """Fold the lowest buckets into one until the sketch fits max_bins"""
+        indexes = sorted(self.bins)
+        excess = indexes[:len(indexes) - self.max_bins + 1]
+        self.bins[excess[-1]] = sum(self.bins.pop(index) for index in excess[:-1]) + self.bins[excess[-1]]
+
+    def merge(self, other):
+        """Add another sketch's values to this one; both need the same accuracy"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Sketches with different accuracies can't be merged")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """Value at quantile q (0 to 1), or None for an empty sketch"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = self.zero_count
+        for index in sorted(self.bins):
+            cumulative += self.bins[index]
+            if cumulative > rank:
+                # Never report past what was actually observed
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "bins": {str(index): count for index, count in self.bins.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data.get("relative_accuracy", 0.01))
+        sketch.bins = {int(index): count for index, count in data.get("bins", {}).items()}
+        sketch.zero_count = data.get("zero_count", 0)
+        sketch.count = data.get("count", 0)
+        sketch.sum = data.get("sum", 0.0)
+        sketch.min = data.get("min")
+        sketch.max = data.get("max")
+        return sketch
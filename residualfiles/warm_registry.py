@@ -0,0 +1,424 @@
+# warm_registry.py
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from reaper import INSTANCE, owner_alive
+
+# One registry per node, shared by every API worker process on it
+WARM_REGISTRY_PATH = os.environ.get(
+    "WARM_REGISTRY_PATH",
+    os.path.join(tempfile.gettempdir(), "serverless-node", "registry.db")
+)
+# How long others wait on a worker that claimed a runner or image before taking the claim over
+CLAIM_TIMEOUT = 60.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runners (
+    key TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    function_id INTEGER,
+    container_id TEXT,
+    socket_dir TEXT,
+    state TEXT NOT NULL,  -- "starting" while its owner boots it, then "ready"
+    paused INTEGER NOT NULL DEFAULT 0,  -- frozen while idle; unpaused by the next lease
+    owner TEXT NOT NULL,
+    claimed_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    memory REAL NOT NULL DEFAULT 0,  -- MB the runner may use
+    cost REAL NOT NULL DEFAULT 0,  -- seconds its cold start took
+    hits INTEGER NOT NULL DEFAULT 0,  -- warm calls served
+    priority REAL NOT NULL DEFAULT 0,  -- GreedyDual value; the lowest is evicted first
+    retiring INTEGER NOT NULL DEFAULT 0  -- a call overran it; no new leases, stopped once the last is returned
+);
+CREATE TABLE IF NOT EXISTS leases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    owner TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leases_key ON leases (key);
+CREATE TABLE IF NOT EXISTS images (
+    host TEXT NOT NULL,
+    name TEXT NOT NULL,
+    digest TEXT,
+    state TEXT NOT NULL,  -- "building" or "ready"
+    owner TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (host, name)
+);
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    inflation REAL NOT NULL DEFAULT 0,  -- GreedyDual L: priority of the last eviction
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    evictions INTEGER NOT NULL DEFAULT 0,
+    evicted_memory REAL NOT NULL DEFAULT 0
+);
+"""
+# Columns added to runners since the registry was introduced, for registries created before them
+RUNNER_COLUMNS_ADDED = {
+    "paused": "INTEGER NOT NULL DEFAULT 0",
+    "memory": "REAL NOT NULL DEFAULT 0",
+    "cost": "REAL NOT NULL DEFAULT 0",
+    "hits": "INTEGER NOT NULL DEFAULT 0",
+    "priority": "REAL NOT NULL DEFAULT 0",
+    "retiring": "INTEGER NOT NULL DEFAULT 0"
+}
+
+
+def retired_key(key, container_id):
+    """Where a retiring runner is kept, clear of the key its replacement takes"""
+    return f"{key}@{container_id}"
+
+
+def greedy_dual_priority(inflation, hits, cost, memory):
+    """
+    GreedyDual-Size-Frequency value of a warm runner.
+
+    Runners that are used often and are slow to start but small stay
+    longest. inflation is the value of the last runner evicted, so
+    runners that stop being used age out instead of living forever on
+    old hits.
+    """
+    return inflation + max(hits, 1) * max(cost, 0.001) / max(memory, 1)
+
+
+class WarmRegistry:
+    """
+    Node-local record of warm runner containers and built images.
+
+    Every API worker process on a node shares one SQLite file, so a
+    runner container is started once per node and leased by each worker
+    that connects to it, and base images are built by one worker only.
+    A lease belongs to the worker holding a connection; leases of dead
+    workers are dropped, and a runner nobody leases is reclaimed once it
+    has been idle long enough.
+    """
+
+    def __init__(self, path=WARM_REGISTRY_PATH):
+        self.path = path
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _ensure_schema(self):
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            try:
+                # WAL lets workers read while another one writes
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(runners)")]
+                for column, definition in RUNNER_COLUMNS_ADDED.items():
+                    if column not in columns:
+                        conn.execute(f"ALTER TABLE runners ADD COLUMN {column} {definition}")
+            finally:
+                conn.close()
+            self._schema_ready = True
+
+    @contextmanager
+    def _transaction(self):
+        """A write transaction that holds the node-wide lock until it commits"""
+        self._ensure_schema()
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _claim_live(self, row, now):
+        """Whether a start claim still stands; claims of dead or stuck workers lapse"""
+        return owner_alive(row["owner"]) and now - row["claimed_at"] < CLAIM_TIMEOUT
+
+    def _host_stats(self, conn, host):
+        conn.execute("INSERT OR IGNORE INTO hosts (host) VALUES (?)", (host,))
+        return conn.execute("SELECT * FROM hosts WHERE host = ?", (host,)).fetchone()
+
+    def _drop_dead_leases(self, conn):
+        """Leases held by workers that have since exited will never be returned"""
+        for (owner,) in conn.execute("SELECT DISTINCT owner FROM leases").fetchall():
+            if not owner_alive(owner):
+                conn.execute("DELETE FROM leases WHERE owner = ?", (owner,))
+
+    def lease_runner(self, key, host, function_id, memory, resume):
+        """
+        Lease the node's runner for key, or claim the right to start it.
+
+        Returns ("ready", record) with a lease taken, ("start", None) when
+        the caller must start the runner and then register it, or
+        ("wait", None) while another worker is starting it. A paused
+        runner is handed to resume(record) first; that happens inside the
+        transaction, so no other worker can pause it again in between.
+        A start claim reserves memory MB of the host's warm budget.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT * FROM runners WHERE key = ?", (key,)).fetchone()
+            if row is not None and row["state"] == "ready" and row["paused"]:
+                try:
+                    resume(dict(row))
+                    conn.execute("UPDATE runners SET paused = 0 WHERE key = ?", (key,))
+                    row = conn.execute("SELECT * FROM runners WHERE key = ?", (key,)).fetchone()
+                except Exception:
+                    # The container is gone; start a new one in its place
+                    conn.execute("DELETE FROM leases WHERE key = ?", (key,))
+                    row = None
+            if row is not None and row["state"] == "ready":
+                conn.execute("INSERT INTO leases (key, owner) VALUES (?, ?)", (key, INSTANCE))
+                conn.execute("UPDATE runners SET last_used = ? WHERE key = ?", (now, key))
+                return "ready", dict(row)
+            if row is not None and self._claim_live(row, now):
+                return "wait", None
+            conn.execute(
+                "INSERT OR REPLACE INTO runners (key, host, function_id, state, owner, claimed_at, last_used, memory) "
+                "VALUES (?, ?, ?, 'starting', ?, ?, ?, ?)",
+                (key, host, function_id, INSTANCE, now, now, memory)
+            )
+            self._host_stats(conn, host)
+            conn.execute("UPDATE hosts SET misses = misses + 1 WHERE host = ?", (host,))
+            return "start", None
+
+    def register_runner(self, key, container_id, socket_dir, cost):
+        """Publish a runner this worker started, cost seconds to start, and take the first lease on it"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT host, memory FROM runners WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return
+            inflation = self._host_stats(conn, row["host"])["inflation"]
+            conn.execute(
+                "UPDATE runners SET state = 'ready', container_id = ?, socket_dir = ?, last_used = ?, "
+                "cost = ?, hits = 0, priority = ? WHERE key = ? AND owner = ?",
+                (container_id, socket_dir, time.time(), cost,
+                 greedy_dual_priority(inflation, 0, cost, row["memory"]), key, INSTANCE)
+            )
+            conn.execute("INSERT INTO leases (key, owner) VALUES (?, ?)", (key, INSTANCE))
+
+    def abandon_runner(self, key):
+        """Give up a start claim after the runner failed to boot"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM runners WHERE key = ? AND state = 'starting' AND owner = ?", (key, INSTANCE))
+
+    def release_runner(self, key, container_id):
+        """Return one of this worker's leases on a runner, wherever retiring it moved it"""
+        keys = (key, retired_key(key, container_id))
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM leases WHERE id = (SELECT id FROM leases WHERE key IN (?, ?) AND owner = ? LIMIT 1)",
+                keys + (INSTANCE,)
+            )
+            conn.execute("UPDATE runners SET last_used = ? WHERE key IN (?, ?)", (time.time(),) + keys)
+
+    def retire_runner(self, key, container_id):
+        """
+        Move a runner, e.g. one still running a call that overran, out of
+        key's way along with its leases, so the next lease starts a
+        replacement while the workers using it finish their calls
+        """
+        with self._transaction() as conn:
+            retired = conn.execute(
+                "UPDATE runners SET key = ?, retiring = 1 WHERE key = ? AND container_id = ?",
+                (retired_key(key, container_id), key, container_id)
+            ).rowcount
+            if retired:
+                conn.execute("UPDATE leases SET key = ? WHERE key = ?", (retired_key(key, container_id), key))
+
+    def retiring_containers(self):
+        """Ids of the runner containers being retired"""
+        with self._transaction() as conn:
+            return {row[0] for row in conn.execute("SELECT container_id FROM runners WHERE retiring = 1")}
+
+    def release_retired_runner(self, key, container_id):
+        """
+        Return this worker's lease on a retiring runner; returns its record
+        when no worker leases it any more, for the caller to stop
+        """
+        key = retired_key(key, container_id)
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM leases WHERE id = (SELECT id FROM leases WHERE key = ? AND owner = ? LIMIT 1)",
+                (key, INSTANCE)
+            )
+            self._drop_dead_leases(conn)
+            row = conn.execute("SELECT * FROM runners WHERE key = ?", (key,)).fetchone()
+            if row is None or conn.execute("SELECT 1 FROM leases WHERE key = ?", (key,)).fetchone():
+                return None
+            conn.execute("DELETE FROM runners WHERE key = ?", (key,))
+            return dict(row)
+
+    def remove_runner(self, key, container_id):
+        """Forget a runner that died or was recycled, unless a replacement took its key"""
+        for key in (key, retired_key(key, container_id)):
+            with self._transaction() as conn:
+                removed = conn.execute(
+                    "DELETE FROM runners WHERE key = ? AND container_id = ?", (key, container_id)
+                ).rowcount
+                if removed:
+                    conn.execute("DELETE FROM leases WHERE key = ?", (key,))
+
+    def record_hits(self, key, hits):
+        """Count warm calls a worker served on a runner since it last reported, and refresh its priority"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT * FROM runners WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return
+            inflation = self._host_stats(conn, row["host"])["inflation"]
+            conn.execute(
+                "UPDATE runners SET hits = ?, priority = ?, last_used = ? WHERE key = ?",
+                (row["hits"] + hits, greedy_dual_priority(inflation, row["hits"] + hits, row["cost"], row["memory"]),
+                 time.time(), key)
+            )
+            conn.execute("UPDATE hosts SET hits = hits + ? WHERE host = ?", (hits, row["host"]))
+
+    def evict_for(self, key, host, budget):
+        """
+        Make room in the host's warm memory budget for the runner claimed as key.
+
+        Idle runners go lowest GreedyDual priority first; each eviction
+        raises the host's inflation to the evicted priority. Returns the
+        evicted records for the caller to stop. Runners that are leased
+        are never evicted, so the budget can be overrun while all of them
+        are busy.
+        """
+        evicted = []
+        with self._transaction() as conn:
+            self._drop_dead_leases(conn)
+            used = conn.execute("SELECT COALESCE(SUM(memory), 0) FROM runners WHERE host = ?", (host,)).fetchone()[0]
+            candidates = conn.execute(
+                "SELECT * FROM runners WHERE host = ? AND key != ? AND state = 'ready' "
+                "AND key NOT IN (SELECT key FROM leases) ORDER BY priority",
+                (host, key)
+            ).fetchall()
+            for row in candidates:
+                if used <= budget:
+                    break
+                conn.execute("DELETE FROM runners WHERE key = ?", (row["key"],))
+                conn.execute(
+                    "UPDATE hosts SET inflation = ?, evictions = evictions + 1, evicted_memory = evicted_memory + ? "
+                    "WHERE host = ?",
+                    (row["priority"], row["memory"], host)
+                )
+                used -= row["memory"]
+                evicted.append(dict(row))
+        return evicted
+
+    def claim_idle_runners(self, host, idle_timeout):
+        """
+        Remove and return the host's runners that nobody leases and that
+        have been idle for idle_timeout seconds; the caller stops them.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._drop_dead_leases(conn)
+            rows = conn.execute(
+                "SELECT * FROM runners WHERE host = ? AND state = 'ready' AND last_used <= ? "
+                "AND key NOT IN (SELECT key FROM leases)",
+                (host, now - idle_timeout)
+            ).fetchall()
+            for row in rows:
+                conn.execute("DELETE FROM runners WHERE key = ?", (row["key"],))
+            return [dict(row) for row in rows]
+
+    def pause_idle_runners(self, host, idle_after, pause):
+        """
+        Hand the host's running runners that nobody leases and that have been
+        idle for idle_after seconds to pause(record); returns how many paused
+        """
+        now = time.time()
+        paused = 0
+        with self._transaction() as conn:
+            self._drop_dead_leases(conn)
+            rows = conn.execute(
+                "SELECT * FROM runners WHERE host = ? AND state = 'ready' AND paused = 0 AND last_used <= ? "
+                "AND key NOT IN (SELECT key FROM leases)",
+                (host, now - idle_after)
+            ).fetchall()
+            for row in rows:
+                # Paused while the transaction holds the lock, so a lease can't slip in first
+                try:
+                    pause(dict(row))
+                except Exception:
+                    continue
+                conn.execute("UPDATE runners SET paused = 1 WHERE key = ?", (row["key"],))
+                paused += 1
+        return paused
+
+    def container_ids(self):
+        """Ids of every runner container the registry still tracks"""
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT container_id FROM runners WHERE container_id IS NOT NULL").fetchall()
+            return {row["container_id"] for row in rows}
+
+    def claim_image(self, host, name, digest, force=False):
+        """
+        Decide who builds an image on a host.
+
+        Returns "ready" when it is already built from the same templates,
+        "building" while another worker builds it, and "build" when the
+        caller should build it and then call image_built.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT * FROM images WHERE host = ? AND name = ?", (host, name)).fetchone()
+            if row is not None:
+                if row["state"] == "ready" and row["digest"] == digest and not force:
+                    return "ready"
+                if (row["state"] == "building" and row["owner"] != INSTANCE and
+                        owner_alive(row["owner"]) and now - row["updated_at"] < CLAIM_TIMEOUT):
+                    return "building"
+            conn.execute(
+                "INSERT OR REPLACE INTO images (host, name, digest, state, owner, updated_at) "
+                "VALUES (?, ?, ?, 'building', ?, ?)",
+                (host, name, digest, INSTANCE, now)
+            )
+            return "build"
+
+    def image_built(self, host, name, digest):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE images SET state = 'ready', digest = ?, updated_at = ? WHERE host = ? AND name = ?",
+                (digest, time.time(), host, name)
+            )
+
+    def abandon_image(self, host, name):
+        """Drop a build claim after the build failed"""
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM images WHERE host = ? AND name = ? AND state = 'building' AND owner = ?",
+                (host, name, INSTANCE)
+            )
+
+    def get_stats(self):
+        with self._transaction() as conn:
+            runners = conn.execute(
+                "SELECT r.key, r.host, r.function_id, r.container_id, r.state, r.paused, r.owner, r.last_used, "
+                "r.memory, r.cost, r.hits, r.priority, COUNT(l.id) AS leases "
+                "FROM runners r LEFT JOIN leases l ON l.key = r.key GROUP BY r.key"
+            ).fetchall()
+            images = conn.execute("SELECT host, name, digest, state, owner, updated_at FROM images").fetchall()
+            hosts = conn.execute(
+                "SELECT h.*, (SELECT COALESCE(SUM(memory), 0) FROM runners r WHERE r.host = h.host) AS warm_memory "
+                "FROM hosts h"
+            ).fetchall()
+            return {
+                "path": self.path,
+                "hosts": [
+                    dict(row, hit_rate=row["hits"] / (row["hits"] + row["misses"]) if row["hits"] + row["misses"] else None)
+                    for row in hosts
+                ],
+                "runners": [dict(row) for row in runners],
+                "images": [dict(row) for row in images]
+            }
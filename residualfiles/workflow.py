@@ -0,0 +1,177 @@
+# workflow.py
+import base64
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from deadlines import Deadline
+from payload_transfer import is_buffer
+
+
+def plan(steps):
+    """
+    Validate workflow steps and return their ids in dependency order.
+
+    Each step needs a unique "id" and a "function_id"; "depends_on"
+    lists the ids of steps whose outputs it consumes.
+    """
+    if not steps:
+        raise ValueError("A workflow needs at least one step")
+
+    by_id = {}
+    for step in steps:
+        if "id" not in step or "function_id" not in step:
+            raise ValueError("Every step needs an id and a function_id")
+        if step["id"] in by_id:
+            raise ValueError(f"Duplicate step id: {step['id']}")
+        by_id[step["id"]] = step
+
+    remaining = {}
+    for step in steps:
+        depends_on = step.get("depends_on", [])
+        for dependency in depends_on:
+            if dependency not in by_id:
+                raise ValueError(f"Step {step['id']} depends on unknown step {dependency}")
+        remaining[step["id"]] = set(depends_on)
+
+    # Kahn's algorithm; anything left over sits on a cycle
+    order = []
+    ready = [step_id for step_id, deps in remaining.items() if not deps]
+    while ready:
+        step_id = ready.pop()
+        order.append(step_id)
+        del remaining[step_id]
+        for other, deps in remaining.items():
+            if step_id in deps:
+                deps.discard(step_id)
+                if not deps:
+                    ready.append(other)
+    if remaining:
+        raise ValueError(f"Workflow has a dependency cycle through: {', '.join(sorted(map(str, remaining)))}")
+    return order
+
+
+def _response_output(output):
+    """Raw bytes outputs don't fit in a JSON response, so they're base64-encoded"""
+    if is_buffer(output):
+        return base64.b64encode(memoryview(output).cast("B")).decode("ascii")
+    return output
+
+
+def _step_input(step, workflow_input, outputs):
+    """Entry steps get the workflow input, others their dependencies' outputs"""
+    depends_on = step.get("depends_on", [])
+    if not depends_on:
+        return workflow_input
+    if len(depends_on) == 1:
+        return outputs[depends_on[0]]
+    # Fan-in: a step with several dependencies gets their outputs by step id
+    return {dependency: outputs[dependency] for dependency in depends_on}
+
+
+class WorkflowEngine:
+    """
+    Runs a DAG of functions inside the platform in a single request.
+
+    Independent steps fan out over a shared thread pool as soon as their
+    dependencies finish. Intermediate outputs stay in memory and are
+    handed straight to the next step's backend, so there are no client
+    round trips or re-encodes between hops.
+    """
+
+    def __init__(self, backends, max_parallel=8):
+        self.backends = backends
+        self._pool = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="workflow")
+
+    def _run_step(self, function, event_data, deadline):
+        started_at = time.time()
+        step_deadline = None
+        if deadline is not None:
+            # A step gets its own timeout or whatever is left of the workflow's, whichever is shorter
+            step_deadline = Deadline.for_function(function, deadline.remaining())
+        result = self.backends.run_function(function, event_data, deadline=step_deadline)
+        return started_at, time.time(), result
+
+    def run(self, definition, functions):
+        """
+        Execute a workflow and return its output and per-step timings.
+
+        functions maps each step id to the resolved function version it
+        runs. The result carries "status", "output" (the "output" step's
+        result, the only sink's, or every sink's by step id; raw bytes
+        are base64-encoded) and "steps".
+        """
+        steps = {step["id"]: step for step in definition["steps"]}
+        plan(definition["steps"])
+        workflow_input = definition.get("input", {})
+        deadline = Deadline(definition["timeout"]) if definition.get("timeout") is not None else None
+
+        start_time = time.time()
+        outputs = {}
+        report = {
+            step_id: {"function_id": functions[step_id].function_id, "version": functions[step_id].version, "status": "pending"}
+            for step_id in steps
+        }
+        waiting = {step_id: set(step.get("depends_on", [])) for step_id, step in steps.items()}
+        running = {}
+        failed = None
+
+        while True:
+            # Start every step whose dependencies are done, unless a step already failed
+            if failed is None:
+                for step_id in [s for s, deps in waiting.items() if not deps]:
+                    del waiting[step_id]
+                    event_data = _step_input(steps[step_id], workflow_input, outputs)
+                    future = self._pool.submit(self._run_step, functions[step_id], event_data, deadline)
+                    running[future] = step_id
+                    report[step_id]["status"] = "running"
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step_id = running.pop(future)
+                entry = report[step_id]
+                try:
+                    started_at, finished_at, result = future.result()
+                except Exception as e:
+                    started_at = finished_at = time.time()
+                    result = {"error": str(e), "status": "error"}
+                entry["started_at"] = started_at - start_time
+                entry["execution_time"] = finished_at - started_at
+                entry["usage"] = result.get("usage")
+                entry["cold_start"] = result.get("cold_start")
+                if "phases" in result:
+                    entry["phases"] = result["phases"]
+
+                if "error" in result:
+                    entry["status"] = result.get("status", "error")
+                    entry["error"] = result["error"]
+                    failed = failed or step_id
+                    continue
+
+                entry["status"] = "success"
+                outputs[step_id] = result["output"]
+                for deps in waiting.values():
+                    deps.discard(step_id)
+
+        for step_id in waiting:
+            report[step_id]["status"] = "skipped"
+
+        response = {"status": "success", "total_time": time.time() - start_time, "steps": report}
+        if failed is not None:
+            response["status"] = "error"
+            response["error"] = f"Step {failed} failed: {report[failed]['error']}"
+            return response
+
+        if definition.get("output") is not None:
+            response["output"] = _response_output(outputs[definition["output"]])
+        else:
+            consumed = {dep for step in steps.values() for dep in step.get("depends_on", [])}
+            sinks = [step_id for step_id in steps if step_id not in consumed]
+            if len(sinks) == 1:
+                response["output"] = _response_output(outputs[sinks[0]])
+            else:
+                response["output"] = {s: _response_output(outputs[s]) for s in sinks}
+        return response
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)